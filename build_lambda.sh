@@ -13,7 +13,8 @@ rm -f lambda_handler_*.zip
 
 mkdir -p $LAYER_DIR/python/lib/python$PYTHON_VERSION/site-packages
 
-EXCLUDE_PKGS="boto3 botocore s3transfer urllib3 fastapi uvicorn prometheus_client pytest black moto starlette werkzeug h11 anyio coverage _pytest requests-aws4auth"
+# pyarrow 約 100MB+, 只有離線的 Parquet 合併與 --reload (python -m src.etl.parquet_compaction) 會用到, 不放進 layer 以免超過 250MB 上限
+EXCLUDE_PKGS="boto3 botocore s3transfer urllib3 fastapi uvicorn pytest black moto starlette werkzeug h11 anyio coverage _pytest requests-aws4auth pyarrow"
 for pkg in $(ls $VENV_DIR/lib/python$PYTHON_VERSION/site-packages); do
     skip=false
     for ex in $EXCLUDE_PKGS; do
@@ -1,6 +1,10 @@
 import json
 import logging
-from src.extract import arxiv_collector
+from src.core import metrics, startup
+
+# import 時只載入程式碼, boto3 / config / DB 連線都延後到第一次使用
+with startup.timed("import src.extract.arxiv_collector"):
+    from src.extract import arxiv_collector
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -9,7 +13,7 @@ def lambda_handler(event, context):
     logger.info(f"--- Collector Lambda 執行開始 ---")
     
     try:
-        arxiv_collector.run_lambda()
+        arxiv_collector.run_lambda(context)
         
         logger.info("--- Lambda 執行成功 ---")
         return {
@@ -22,3 +26,8 @@ def lambda_handler(event, context):
             "statusCode": 500,
             "body": json.dumps({"status": "error", "message": str(e)})
         }
+    finally:
+        # 只有 cold start 第一次會輸出
+        startup.report(logger)
+        # 有設 PUSHGATEWAY_URL / METRICS_TEXTFILE 才會輸出
+        metrics.push("arxiv_collector")
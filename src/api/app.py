@@ -0,0 +1,97 @@
+"""
+app.py
+arxiv_papers 的唯讀查詢 API (FastAPI)
+uvicorn src.api.app:app --host 0.0.0.0 --port 8000
+
+GET /papers?primary_category=cs.AI&category=cs.LG&author=...&published_from=2025-01-01&published_to=...&limit=50&cursor=...
+    由新到舊, 回應的 next_cursor 帶到下一次請求的 cursor 取得下一頁
+GET /search?q="graph neural network" -survey&primary_category=cs.LG&limit=20&cursor=...
+    title / summary 全文檢索 (websearch 語法: "..." 片語、OR、-排除), 依相關度排序, 篩選條件同 /papers
+GET /papers/{entry_id}    (entry_id 為完整的 http://arxiv.org/abs/... )
+GET /healthz              cache 統計
+"""
+
+from contextlib import asynccontextmanager
+from datetime import date
+
+from fastapi import FastAPI, HTTPException, Query
+
+from src.api import papers
+from src.core.config_loader import get_config
+from src.core.db import get_pg
+
+# 以下都在 lifespan (啟動時) 才建立
+pg = None
+cache: papers.ResponseCache = None
+api_cfg = None
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    global pg, cache, api_cfg
+    api_cfg = get_config().api
+    pg = get_pg(maxconn=api_cfg.db_connections)
+    cache = papers.ResponseCache(api_cfg.cache_maxsize, api_cfg.cache_ttl_seconds)
+    invalidator = papers.CacheInvalidator(pg, cache).start()
+    try:
+        yield
+    finally:
+        invalidator.stop()
+
+
+app = FastAPI(title="arXiv papers API", lifespan=lifespan)
+
+
+# endpoint 用一般 def, FastAPI 會放到 threadpool 執行, 不會卡住 event loop (psycopg2 是同步的)
+@app.get("/papers")
+def list_papers(
+    primary_category: str | None = None,
+    category: list[str] = Query(default=[], description="categories 需包含全部指定的領域"),
+    author: str | None = None,
+    published_from: date | None = None,
+    published_to: date | None = None,
+    cursor: str | None = None,
+    limit: int | None = Query(default=None, ge=1),
+):
+    limit = min(limit or api_cfg.page_size, api_cfg.max_page_size)
+    flt = papers.PaperFilter(primary_category, tuple(sorted(set(category))), author, published_from, published_to)
+    try:
+        return cache.get_or_load(("list", flt, cursor, limit), lambda: papers.list_papers(pg, flt, cursor, limit))
+    except papers.CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/search")
+def search(
+    q: str = Query(min_length=1, max_length=500),
+    primary_category: str | None = None,
+    category: list[str] = Query(default=[], description="categories 需包含全部指定的領域"),
+    author: str | None = None,
+    published_from: date | None = None,
+    published_to: date | None = None,
+    cursor: str | None = None,
+    limit: int | None = Query(default=None, ge=1),
+    headline: bool = True,
+):
+    limit = min(limit or api_cfg.page_size, api_cfg.max_page_size)
+    flt = papers.PaperFilter(primary_category, tuple(sorted(set(category))), author, published_from, published_to)
+    try:
+        return cache.get_or_load(
+            ("search", q, flt, cursor, limit, headline),
+            lambda: papers.search_papers(pg, q, flt, cursor, limit, headline),
+        )
+    except papers.CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/papers/{entry_id:path}")
+def get_paper(entry_id: str):
+    paper = cache.get_or_load(("paper", entry_id), lambda: papers.get_paper(pg, entry_id))
+    if paper is None:
+        raise HTTPException(status_code=404, detail=f"paper not found: {entry_id}")
+    return paper
+
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok", "cache": cache.stats()}
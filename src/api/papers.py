@@ -0,0 +1,283 @@
+"""
+papers.py
+查詢 API 的資料存取: arxiv_papers 的篩選、keyset 分頁與 response cache
+- 依 (published_date, entry_id) 由新到舊排序, 下一頁從上一頁最後一筆之後開始 (WHERE (published_date, entry_id) < cursor),
+  不論翻到第幾頁都是一次 index range scan, 不像 OFFSET 要先掃過前面所有資料
+- 篩選條件對應既有索引: primary_category / published_date 走 btree 複合索引 (migration 008),
+  categories / authors 用陣列包含 (@>) 走 GIN 索引
+- search_papers: search_vector (title 權重 A, summary 權重 B, migration 009) 的全文檢索, 走 GIN 索引,
+  查詢語法同 websearch_to_tsquery ("..." 片語、OR、-排除), 依 ts_rank 排序, 以 (rank, entry_id) 做 keyset 分頁
+- ResponseCache: cachetools.TTLCache (TTL + LRU), CacheInvalidator 以 LISTEN 等待 ETL 寫完檔案的 NOTIFY 後清空
+"""
+
+import base64
+import json
+import logging
+import select
+import threading
+from dataclasses import dataclass, field
+from datetime import date
+
+import psycopg2
+import psycopg2.extras
+from cachetools import TTLCache
+
+from src.core.pg_engine import PsqlEngine
+from src.etl.leases import FINISHED_CHANNEL
+
+LIST_COLUMNS = [
+    "entry_id", "title", "authors", "summary", "primary_category", "categories",
+    "published", "updated", "published_date", "journal_ref", "doi", "keywords", "topic", "version",
+]
+DETAIL_COLUMNS = LIST_COLUMNS + ["affiliations", "links", "updated_date", "etl_timestamp"]
+# 與 migration 009 的 search_vector 使用相同的 text search config
+SEARCH_CONFIG = "english"
+# ts_rank normalization 1: 除以 1 + log(文件長度), 摘要較長的文章不會因為字多而排前面
+RANK_NORMALIZATION = 1
+HEADLINE_OPTIONS = "MaxFragments=2, MinWords=10, MaxWords=30"
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(*values) -> str:
+    """排序鍵 (最後一筆的值) 編碼成 URL-safe 字串"""
+    values = [v.isoformat() if isinstance(v, date) else v for v in values]
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[date, str]:
+    """/papers 的 cursor: (published_date, entry_id)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        published_date, entry_id = json.loads(raw)
+        return date.fromisoformat(published_date), str(entry_id)
+    except (ValueError, TypeError) as e:
+        raise CursorError(f"invalid cursor: {cursor!r}") from e
+
+
+def decode_search_cursor(cursor: str) -> tuple[float, str]:
+    """/search 的 cursor: (rank, entry_id)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        rank, entry_id = json.loads(raw)
+        return float(rank), str(entry_id)
+    except (ValueError, TypeError) as e:
+        raise CursorError(f"invalid cursor: {cursor!r}") from e
+
+
+@dataclass(frozen=True)
+class PaperFilter:
+    primary_category: str | None = None
+    categories: tuple[str, ...] = field(default_factory=tuple)  # 全部都要包含
+    author: str | None = None                                   # 完整作者名稱
+    published_from: date | None = None
+    published_to: date | None = None
+
+
+def _filter_clauses(flt: PaperFilter) -> tuple[list[str], list]:
+    where = []
+    params = []
+    if flt.primary_category:
+        where.append("primary_category = %s")
+        params.append(flt.primary_category)
+    if flt.categories:
+        where.append("categories @> %s::text[]")
+        params.append(list(flt.categories))
+    if flt.author:
+        where.append("authors @> ARRAY[%s]::text[]")
+        params.append(flt.author)
+    if flt.published_from:
+        where.append("published_date >= %s")
+        params.append(flt.published_from)
+    if flt.published_to:
+        where.append("published_date <= %s")
+        params.append(flt.published_to)
+    return where, params
+
+
+def build_list_query(flt: PaperFilter, cursor: tuple[date, str] | None, limit: int) -> tuple[str, list]:
+    """多取一筆判斷是否還有下一頁"""
+    where, params = _filter_clauses(flt)
+    where.insert(0, "published_date IS NOT NULL")
+    if cursor:
+        where.append("(published_date, entry_id) < (%s, %s)")
+        params.extend(cursor)
+    stmt = (
+        f"SELECT {', '.join(LIST_COLUMNS)} FROM arxiv_papers "
+        f"WHERE {' AND '.join(where)} "
+        f"ORDER BY published_date DESC, entry_id DESC LIMIT %s"
+    )
+    params.append(limit + 1)
+    return stmt, params
+
+
+def list_papers(pg: PsqlEngine, flt: PaperFilter, cursor: str | None, limit: int) -> dict:
+    """回傳 {"items": [...], "next_cursor": 下一頁的 cursor 或 None}; DB 錯誤直接往外拋"""
+    stmt, params = build_list_query(flt, decode_cursor(cursor) if cursor else None, limit)
+    with pg.transaction(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(stmt, params)
+        rows = cur.fetchall()
+    items = [dict(r) for r in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last["published_date"], last["entry_id"])
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def build_search_query(q: str, flt: PaperFilter, cursor: tuple[float, str] | None, limit: int,
+                       headline: bool = True) -> tuple[str, list]:
+    """
+    內層用 GIN 索引找出符合的文章、算 rank 並取一頁 (多取一筆), 外層只對這一頁產生 ts_headline (較花時間)
+    """
+    rank = f"ts_rank(search_vector, query, {RANK_NORMALIZATION})"
+    where, filter_params = _filter_clauses(flt)
+    where.insert(0, "search_vector @@ query")
+    params = [q, *filter_params]
+    if cursor:
+        where.append(f"({rank}, entry_id) < (%s::real, %s)")
+        params.extend(cursor)
+    params.append(limit + 1)
+    columns = ", ".join(LIST_COLUMNS)
+    inner = (
+        f"SELECT {columns}, {rank} AS rank, query "
+        f"FROM arxiv_papers, websearch_to_tsquery('{SEARCH_CONFIG}', %s) AS query "
+        f"WHERE {' AND '.join(where)} "
+        f"ORDER BY rank DESC, entry_id DESC LIMIT %s"
+    )
+    if not headline:
+        return f"SELECT {columns}, rank FROM ({inner}) page ORDER BY rank DESC, entry_id DESC", params
+    stmt = (
+        f"SELECT {columns}, rank, ts_headline('{SEARCH_CONFIG}', summary, query, %s) AS headline "
+        f"FROM ({inner}) page ORDER BY rank DESC, entry_id DESC"
+    )
+    return stmt, [HEADLINE_OPTIONS, *params]
+
+
+def search_papers(pg: PsqlEngine, q: str, flt: PaperFilter, cursor: str | None, limit: int,
+                  headline: bool = True) -> dict:
+    """全文檢索, 回傳格式同 list_papers, 每筆多了 rank (與 headline)"""
+    stmt, params = build_search_query(q, flt, decode_search_cursor(cursor) if cursor else None, limit, headline)
+    with pg.transaction(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(stmt, params)
+        rows = cur.fetchall()
+    items = [dict(r) for r in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last["rank"], last["entry_id"])
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def get_paper(pg: PsqlEngine, entry_id: str) -> dict | None:
+    with pg.transaction(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(f"SELECT {', '.join(DETAIL_COLUMNS)} FROM arxiv_papers WHERE entry_id = %s", (entry_id,))
+        row = cur.fetchone()
+    return dict(row) if row else None
+
+
+# -------------------------------
+# Response cache
+# -------------------------------
+class ResponseCache:
+    """
+    thread-safe 的 TTL + LRU cache, 只存成功的結果
+    同一個 key 同時有多個請求時可能各自查一次 DB, 不另外合併
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._generation = 0  # clear() 時 +1, 清空前開始的查詢結果不寫回 cache
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            try:
+                value = self._cache[key]
+                self.hits += 1
+                return value
+            except KeyError:
+                self.misses += 1
+                generation = self._generation
+        value = loader()
+        with self._lock:
+            if generation == self._generation:
+                self._cache[key] = value
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._generation += 1
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+class CacheInvalidator:
+    """
+    背景 thread 用一條獨立連線 LISTEN FINISHED_CHANNEL, ETL 每寫完一個檔案就清空 cache
+    連線中斷時重連, 重連後也清空一次 (中斷期間可能漏掉通知); TTL 是最後的保障
+    """
+
+    def __init__(self, pg: PsqlEngine, cache: ResponseCache, channel: str = FINISHED_CHANNEL,
+                 reconnect_seconds: float = 5.0):
+        self.pg = pg
+        self.cache = cache
+        self.channel = channel
+        self.reconnect_seconds = reconnect_seconds
+        self.notifications = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="api-cache-invalidator", daemon=True)
+
+    def _connect(self):
+        conn = psycopg2.connect(
+            dbname=self.pg.dbname, user=self.pg.user, password=self.pg.password,
+            host=self.pg.host, port=self.pg.port,
+        )
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {self.channel}")
+        return conn
+
+    def _run(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                self.cache.clear()
+                while not self._stop.is_set():
+                    if not select.select([conn], [], [], 1.0)[0]:
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        self.notifications += len(conn.notifies)
+                        conn.notifies.clear()
+                        self.cache.clear()
+            except (psycopg2.Error, OSError) as e:
+                logging.warning(f"Cache invalidation listener disconnected, retry in {self.reconnect_seconds}s: {e}")
+                self._stop.wait(self.reconnect_seconds)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def start(self) -> "CacheInvalidator":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
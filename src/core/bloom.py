@@ -0,0 +1,83 @@
+"""
+bloom.py
+簡單的 Bloom filter, 可序列化成 bytes 存到 S3
+只會有 false positive (誤判為存在), 不會有 false negative
+"""
+
+import hashlib
+import math
+import struct
+from typing import Iterable
+
+# magic, num_bits, num_hashes, count
+_HEADER = struct.Struct(">4sQBQ")
+_MAGIC = b"BLM1"
+
+
+class BloomFilter:
+    def __init__(self, num_bits: int, num_hashes: int, bits: bytearray | None = None, count: int = 0):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((num_bits + 7) // 8)
+        self.count = count
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float) -> "BloomFilter":
+        """依預計筆數與可接受的誤判率計算 bit 數與 hash 數"""
+        num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return cls(num_bits, num_hashes)
+
+    @property
+    def capacity(self) -> int:
+        """誤判率維持在設計值以下時可容納的筆數"""
+        return int(self.num_bits * math.log(2) / self.num_hashes)
+
+    def error_rate_at(self, n: int) -> float:
+        """放入 n 筆後的理論誤判率"""
+        return (1 - math.exp(-self.num_hashes * n / self.num_bits)) ** self.num_hashes
+
+    def _positions(self, item: str):
+        # double hashing: h1 + i * h2
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        m = self.num_bits
+        return [(h1 + i * h2) % m for i in range(self.num_hashes)]
+
+    def add(self, item: str) -> bool:
+        """
+        回傳是否有新設定的 bit; 全部 bit 原本就有 (已加入過或誤判) 時不計入 count,
+        重複加入同一個 id 不會讓 count 提早超過 capacity
+        """
+        bits = self.bits
+        added = False
+        for pos in self._positions(item):
+            mask = 1 << (pos & 7)
+            if not bits[pos >> 3] & mask:
+                bits[pos >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def update(self, items: Iterable[str]) -> None:
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(_MAGIC, self.num_bits, self.num_hashes, self.count) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        magic, num_bits, num_hashes, count = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("Not a bloom filter blob")
+        bits = bytearray(data[_HEADER.size:])
+        if len(bits) != (num_bits + 7) // 8:
+            raise ValueError("Bloom filter blob is truncated")
+        return cls(num_bits, num_hashes, bits, count)
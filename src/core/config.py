@@ -1,5 +1,7 @@
 from pathlib import Path
+from typing import Literal
 from dotenv import load_dotenv
+from pydantic import BaseModel, ConfigDict, Field
 from pydantic_settings import BaseSettings
 import yaml
 import os
@@ -10,24 +12,33 @@ ENV_PATH = PROJECT_ROOT / ".env"
 load_dotenv(dotenv_path=ENV_PATH)
 
 
+# Lambda 打包時不含 config/, 不存在就用空設定
 CONFIG_YAML_PATH = PROJECT_ROOT / "config" / "config.yaml"
-with open(CONFIG_YAML_PATH, "r", encoding="utf-8") as f:
-    yaml_config = yaml.safe_load(f)
+yaml_config = {}
+if CONFIG_YAML_PATH.exists():
+    with open(CONFIG_YAML_PATH, "r", encoding="utf-8") as f:
+        yaml_config = yaml.safe_load(f) or {}
 
 class Settings(BaseSettings):
     # Postgres
-    POSTGRES_DB: str = os.getenv("POSTGRES_DB")
-    POSTGRES_USER: str = os.getenv("POSTGRES_USER")
-    POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD")
-    POSTGRES_SERVER: str = os.getenv("POSTGRES_SERVER")
+    POSTGRES_DB: str | None = os.getenv("POSTGRES_DB")
+    POSTGRES_USER: str | None = os.getenv("POSTGRES_USER")
+    POSTGRES_PASSWORD: str | None = os.getenv("POSTGRES_PASSWORD")
+    POSTGRES_SERVER: str | None = os.getenv("POSTGRES_SERVER")
     POSTGRES_PORT: int = int(os.getenv("POSTGRES_PORT", 5432))
 
     # AWS
-    AWS_REGION: str = os.getenv("AWS_REGION")
-    AWS_ACCESS_KEY_ID: str = os.getenv("AWS_ACCESS_KEY_ID")
-    AWS_SECRET_ACCESS_KEY: str = os.getenv("AWS_SECRET_ACCESS_KEY")
+    AWS_REGION: str | None = os.getenv("AWS_REGION")
+    AWS_ACCESS_KEY_ID: str | None = os.getenv("AWS_ACCESS_KEY_ID")
+    AWS_SECRET_ACCESS_KEY: str | None = os.getenv("AWS_SECRET_ACCESS_KEY")
     S3_BUCKET: str = os.getenv("S3_BUCKET", "hackmd-paper-bucket")
 
+    # S3 上的 config.yaml, 以及多久重新確認一次 ETag
+    CONFIG_BUCKET: str = os.getenv("CONFIG_BUCKET") or os.getenv("BUCKET_NAME") or "arvix-paper-bucket"
+    CONFIG_KEY: str = os.getenv("CONFIG_KEY", "config/config.yaml")
+    CONFIG_CACHE_PATH: str = os.getenv("CONFIG_CACHE_PATH", "/tmp/config.yaml")
+    CONFIG_REVALIDATE_SECONDS: float = float(os.getenv("CONFIG_REVALIDATE_SECONDS", 60))
+
     DYNAMODB_TABLE_NAME: str = yaml_config.get("dynamodb_table_name", "")
     ALLOW_RECREATE_TABLE: bool = yaml_config.get("allow_recreate_table", False)
 
@@ -41,3 +52,109 @@ class Settings(BaseSettings):
 
 
 settings = Settings()
+
+
+# -------------------------------
+# config.yaml 結構 (型別與範圍檢查)
+# 未列出的 key 會保留, 之後新增設定不會因此壞掉
+# -------------------------------
+class _Section(BaseModel):
+    model_config = ConfigDict(extra="allow", populate_by_name=True)
+
+
+class AwsConfig(_Section):
+    region: str = "ap-northeast-1"
+    s3_bucket: str = "arvix-paper-bucket"
+    s3_prefix_raw: str = "raw/"
+
+
+class LambdaConfig(_Section):
+    num_categories_per_run: int = Field(default=3, gt=0)
+    AWS_LAMBDA_FUNCTION_COLLECT: str = "Collector"
+    AWS_LAMBDA_FUNCTION_ETL: str = "ETL_A"
+    AWS_LAMBDA_FUNCTION_MONITOR: str = "Monitor"
+    time_safety_margin_seconds: float = Field(default=30, ge=0)
+    time_estimate_alpha: float = Field(default=0.3, gt=0, le=1)
+
+
+class SourcePapersConfig(_Section):
+    max_results_goal: int = Field(default=1000, gt=0)
+    collect_mode: Literal["full", "incremental"] = "full"
+    collect_concurrency: int = Field(default=1, gt=0)
+    collect_max_attempts: int = Field(default=3, gt=0)
+    request_interval_seconds: float = Field(default=3, gt=0)
+    request_burst: int = Field(default=1, gt=0)
+    upload_workers: int = Field(default=1, gt=0)
+    upload_queue_size: int = Field(default=2, gt=0)
+    batch_size: int = Field(default=100, gt=0)
+    s3_max_attempts: int = Field(default=3, gt=0)
+    initial_delay_seconds: float = Field(default=5, ge=0)
+    multipart_threshold_mb: int = Field(default=8, ge=5)
+    multipart_part_size_mb: int = Field(default=8, ge=5)
+    gzip_level: int = Field(default=6, ge=1, le=9)
+    lookback_months: int = Field(default=6, gt=0)
+    dedup_mode: Literal["set", "bloom"] = "set"
+    dedup_capacity: int = Field(default=5_000_000, gt=0)
+    dedup_error_rate: float = Field(default=0.001, gt=0, lt=1)
+    dedup_s3_key: str = "state/dedup/downloaded_papers.bloom"
+
+
+class EtlConfig(_Section):
+    pending_gz_batch: int = Field(default=10, gt=0)
+    etl_batch_size: int = Field(default=100, gt=0)
+    load_method: Literal["mogrify", "copy"] = "mogrify"
+    write_mode: Literal["append", "upsert"] = "append"
+    stream_chunk_kb: int = Field(default=256, gt=0)
+    stream_prefetch_chunks: int = Field(default=4, gt=0)
+    file_concurrency: int = Field(default=1, gt=0)
+    db_writers: int | None = Field(default=None, gt=0)  # 未設定時等於 file_concurrency
+    lease_seconds: int = Field(default=300, gt=0)
+    heartbeat_seconds: float = Field(default=60, gt=0)
+    max_attempts: int = Field(default=3, gt=0)
+    dispatch_max_workers: int = Field(default=1, gt=0)
+    dispatch_db_connections: int = Field(default=12, gt=0)
+    dispatch_target_seconds: float = Field(default=600, gt=0)
+    dispatch_window_minutes: int = Field(default=60, gt=0)
+
+
+class CompactionConfig(_Section):
+    prefix: str = "compacted/"
+    min_age_days: int = Field(default=1, ge=0)
+    row_group_size: int = Field(default=50_000, gt=0)
+    max_records_per_file: int = Field(default=500_000, gt=0)
+    compression: Literal["zstd", "snappy", "gzip", "none"] = "zstd"
+
+
+class PartitionConfig(_Section):
+    months_ahead: int = Field(default=3, ge=0)
+    history_retention_months: int | None = Field(default=None, gt=0)  # 未設定時不清理
+    downloaded_retention_months: int | None = Field(default=None, gt=0)
+    drop_detached: bool = False
+
+
+class ApiConfig(_Section):
+    page_size: int = Field(default=50, gt=0)
+    max_page_size: int = Field(default=200, gt=0)
+    cache_ttl_seconds: float = Field(default=300, gt=0)
+    cache_maxsize: int = Field(default=1024, gt=0)
+    db_connections: int = Field(default=8, gt=0)
+
+
+class KeywordsConfig(_Section):
+    enabled: bool = False
+    top_k: int = Field(default=8, gt=0)
+    title_weight: float = Field(default=2.0, gt=0)
+    min_df: int = Field(default=2, ge=1)
+    backfill_batch_size: int = Field(default=2000, gt=0)
+
+
+class PipelineConfig(_Section):
+    aws: AwsConfig = Field(default_factory=AwsConfig)
+    lambda_: LambdaConfig = Field(default_factory=LambdaConfig, alias="lambda")
+    source_papers: SourcePapersConfig = Field(default_factory=SourcePapersConfig)
+    etl: EtlConfig = Field(default_factory=EtlConfig)
+    compaction: CompactionConfig = Field(default_factory=CompactionConfig)
+    partitions: PartitionConfig = Field(default_factory=PartitionConfig)
+    api: ApiConfig = Field(default_factory=ApiConfig)
+    keywords: KeywordsConfig = Field(default_factory=KeywordsConfig)
+    categories: dict[str, list[str]] = Field(default_factory=dict)
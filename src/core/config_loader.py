@@ -0,0 +1,112 @@
+"""
+config_loader.py
+從 S3 讀 config.yaml, 兩層 cache:
+1. process 內: 解析好的 PipelineConfig, 每 CONFIG_REVALIDATE_SECONDS 秒最多向 S3 確認一次
+2. /tmp: yaml 內容與 ETag, 同一個 Lambda 執行環境重新載入 module 時可直接用
+向 S3 確認時帶 If-None-Match, 沒變動只會拿到 304, 不用重新下載與解析
+"""
+
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+
+import yaml
+
+from src.core.config import PipelineConfig, settings
+from src.core.startup import timed
+
+
+class ConfigLoader:
+    def __init__(self, bucket: str, key: str, cache_path: str, revalidate_seconds: float, s3=None):
+        self.bucket = bucket
+        self.key = key
+        self.cache_path = Path(cache_path)
+        self.etag_path = Path(f"{cache_path}.etag")
+        self.revalidate_seconds = revalidate_seconds
+        self._s3 = s3
+        self._config: PipelineConfig | None = None
+        self._etag: str | None = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            import boto3
+            self._s3 = boto3.client("s3")
+        return self._s3
+
+    def get(self, force: bool = False) -> PipelineConfig:
+        with self._lock:
+            if self._config is None:
+                self._load_local_cache()
+            fresh = time.monotonic() - self._checked_at < self.revalidate_seconds
+            if self._config is not None and fresh and not force:
+                return self._config
+            try:
+                self._revalidate()
+            except Exception as e:
+                if self._config is None:
+                    logging.error(f"Failed to load config from S3: {e}")
+                    raise
+                # S3 暫時有問題時沿用舊設定, 不讓整個 Lambda 失敗
+                logging.warning(f"Config revalidation failed, keep cached config: {e}")
+            self._checked_at = time.monotonic()
+            return self._config
+
+    def _load_local_cache(self) -> None:
+        if not (self.cache_path.exists() and self.etag_path.exists()):
+            return
+        try:
+            meta = json.loads(self.etag_path.read_text())
+            if meta.get("bucket") != self.bucket or meta.get("key") != self.key:
+                return
+            self._config = self._parse(self.cache_path.read_bytes())
+            self._etag = meta.get("etag")
+        except Exception as e:
+            logging.warning(f"Ignore broken local config cache: {e}")
+            self._config, self._etag = None, None
+
+    def _revalidate(self) -> None:
+        from botocore.exceptions import ClientError
+        kwargs = {"Bucket": self.bucket, "Key": self.key}
+        if self._etag and self._config is not None:
+            kwargs["IfNoneMatch"] = self._etag
+        try:
+            obj = self.s3.get_object(**kwargs)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("304", "NotModified"):
+                return
+            raise
+        body = obj["Body"].read()
+        config = self._parse(body)
+        self._config, self._etag = config, obj.get("ETag")
+        try:
+            self.cache_path.write_bytes(body)
+            self.etag_path.write_text(json.dumps({"bucket": self.bucket, "key": self.key, "etag": self._etag}))
+        except OSError as e:
+            logging.warning(f"Failed to write local config cache: {e}")
+        logging.info(f"Config loaded from s3://{self.bucket}/{self.key} (ETag {self._etag})")
+
+    @staticmethod
+    def _parse(body: bytes) -> PipelineConfig:
+        return PipelineConfig.model_validate(yaml.safe_load(body) or {})
+
+
+_loader: ConfigLoader | None = None
+
+def get_config(force: bool = False) -> PipelineConfig:
+    """取得目前設定 (process 內共用同一個 loader)"""
+    global _loader
+    if _loader is None:
+        _loader = ConfigLoader(
+            settings.CONFIG_BUCKET,
+            settings.CONFIG_KEY,
+            settings.CONFIG_CACHE_PATH,
+            settings.CONFIG_REVALIDATE_SECONDS,
+        )
+        with timed("init config"):
+            return _loader.get(force=force)
+    return _loader.get(force=force)
@@ -1,5 +1,13 @@
 from src.core.pg_engine import PsqlEngine
+from src.core.startup import timed
 
-def get_pg():
-    pg = PsqlEngine()
-    return pg
\ No newline at end of file
+# 同一個 process (含 Lambda warm start) 共用同一個 engine 與連線池
+_pg: PsqlEngine | None = None
+
+def get_pg(**kwargs):
+    """kwargs (例如 maxconn) 只在第一次建立 engine 時生效"""
+    global _pg
+    if _pg is None:
+        with timed("init PsqlEngine"):
+            _pg = PsqlEngine(**kwargs)
+    return _pg
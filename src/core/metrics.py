@@ -0,0 +1,195 @@
+"""
+metrics.py
+Pipeline 內部各階段的 Prometheus 指標
+- arXiv 每頁抓取時間, S3 各 API 的 latency 與 bytes, gzip 壓縮 / 解壓時間
+- PsqlEngine 各 method 的 statement latency, 各資料表寫入筆數與 rows/sec
+- 每次 Lambda 執行結束呼叫 push(): 有設 PUSHGATEWAY_URL 就推到 Pushgateway, 有設 METRICS_TEXTFILE 就寫成 textfile
+prometheus_client 不存在時所有指標都是 no-op, 不影響主流程
+"""
+
+import functools
+import logging
+import os
+import socket
+import threading
+import time
+
+try:
+    from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, push_to_gateway, write_to_textfile
+except ImportError:  # pragma: no cover - Lambda layer 沒打包時
+    CollectorRegistry = None
+
+NAMESPACE = "arxiv_pipeline"
+# 秒; 涵蓋單筆 SQL (ms 級) 到 arXiv 一頁 1000 筆 (數十秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (1024, 16 * 1024, 128 * 1024, 1024 ** 2, 8 * 1024 ** 2, 64 * 1024 ** 2, 512 * 1024 ** 2)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, *args, **kwargs):
+        pass
+
+    def inc(self, *args, **kwargs):
+        pass
+
+    def set(self, *args, **kwargs):
+        pass
+
+
+if CollectorRegistry is not None:
+    # 獨立的 registry, push 時只送 pipeline 指標 (不含 process / gc 預設指標)
+    REGISTRY = CollectorRegistry()
+
+    def _histogram(name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        return Histogram(name, doc, labels, namespace=NAMESPACE, buckets=buckets, registry=REGISTRY)
+
+    def _counter(name, doc, labels=()):
+        return Counter(name, doc, labels, namespace=NAMESPACE, registry=REGISTRY)
+
+    def _gauge(name, doc, labels=()):
+        return Gauge(name, doc, labels, namespace=NAMESPACE, registry=REGISTRY)
+else:
+    REGISTRY = None
+
+    def _histogram(*args, **kwargs):
+        return _NoopMetric()
+
+    _counter = _gauge = _histogram
+
+
+ARXIV_PAGE_SECONDS = _histogram("arxiv_page_fetch_seconds", "arXiv API 每頁抓取時間 (含 retry)")
+S3_REQUEST_SECONDS = _histogram("s3_request_seconds", "S3 API latency", ["operation"])
+S3_BYTES = _histogram("s3_bytes", "S3 put / get 的資料量", ["operation"], buckets=BYTES_BUCKETS)
+GZIP_SECONDS = _histogram("gzip_seconds", "每個檔案的 gzip 壓縮 / 解壓時間", ["operation"])
+DB_STATEMENT_SECONDS = _histogram("db_statement_seconds", "PsqlEngine 各 method 的執行時間", ["method"])
+DB_ROWS = _counter("db_rows_written", "寫入各資料表的筆數", ["table"])
+DB_WRITE_SECONDS = _counter("db_write_seconds", "寫入各資料表花費的時間", ["table"])
+DB_ROWS_PER_SEC = _gauge("db_rows_per_second", "各資料表的寫入速度 (本 process 累計)", ["table"])
+DB_QUARANTINED_ROWS = _counter("db_quarantined_rows", "寫入失敗被移到 etl.quarantine_rows 的筆數", ["table"])
+
+_rows_lock = threading.Lock()
+_rows: dict[str, list[float]] = {}  # table -> [rows, seconds], 計算 rows/sec 用
+_db_calls = threading.local()
+
+
+# -------------------------------
+# 記錄工具
+# -------------------------------
+def record_rows(table: str, rows: int, seconds: float) -> None:
+    DB_ROWS.labels(table).inc(rows)
+    DB_WRITE_SECONDS.labels(table).inc(seconds)
+    with _rows_lock:
+        total = _rows.setdefault(table, [0, 0.0])
+        total[0] += rows
+        total[1] += seconds
+        if total[1] > 0:
+            DB_ROWS_PER_SEC.labels(table).set(total[0] / total[1])
+
+
+def rows_written(rows: int) -> None:
+    """
+    PsqlEngine 的寫入 method 在 statement 執行後回報實際寫入的筆數 (cur.rowcount), 由 observe_db 記錄
+    ON CONFLICT DO NOTHING 跳過、upsert 內容沒變的都不算; 連線斷掉重試時以最後一次為準
+    """
+    _db_calls.rows = rows
+
+
+def observe_db(method):
+    """
+    PsqlEngine method 的 decorator, 記錄執行時間
+    第一個參數是 table_name 且有呼叫 rows_written 的 method (insert_mogrify / copy_merge ...) 另外記錄寫入筆數
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            # copy_merge 內部會呼叫 stage_merge, 筆數只在最外層記一次
+            depth = getattr(_db_calls, "depth", 0)
+            _db_calls.depth = depth + 1
+            if depth == 0:
+                _db_calls.rows = None
+            start = time.perf_counter()
+            ok = False
+            try:
+                result = fn(self, *args, **kwargs)
+                ok = True
+                return result
+            finally:
+                _db_calls.depth = depth
+                elapsed = time.perf_counter() - start
+                DB_STATEMENT_SECONDS.labels(method).observe(elapsed)
+                # 失敗的批次會被拆開重試, 只記成功寫入的筆數
+                if ok and depth == 0 and args and isinstance(args[0], str) and _db_calls.rows is not None:
+                    record_rows(args[0], _db_calls.rows, elapsed)
+        return wrapper
+    return decorator
+
+
+def _body_size(body) -> int | None:
+    """botocore 送出前 body 可能是 bytes 或 file-like (BytesIO)"""
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    if hasattr(body, "seek") and hasattr(body, "tell"):
+        pos = body.tell()
+        body.seek(0, os.SEEK_END)
+        size = body.tell()
+        body.seek(pos)
+        return size
+    return None
+
+
+def instrument_s3(client):
+    """在 boto3 S3 client 掛上 event hook, 記錄每個 API 的 latency 與 put / get 的 bytes"""
+    if REGISTRY is None:
+        return client
+
+    def before_call(model, params, context, **kwargs):
+        context["metrics_start"] = time.perf_counter()
+        if model.name in ("PutObject", "UploadPart"):
+            size = _body_size(params.get("body"))
+            if size is not None:
+                S3_BYTES.labels(model.name).observe(size)
+
+    def after_call(model, context, parsed, **kwargs):
+        start = context.get("metrics_start")
+        if start is not None:
+            S3_REQUEST_SECONDS.labels(model.name).observe(time.perf_counter() - start)
+        if model.name == "GetObject" and parsed.get("ContentLength") is not None:
+            S3_BYTES.labels(model.name).observe(parsed["ContentLength"])
+
+    events = client.meta.events
+    events.register("before-call.s3.*", before_call)
+    events.register("after-call.s3.*", after_call)
+    return client
+
+
+# -------------------------------
+# 匯出
+# -------------------------------
+def _instance() -> str:
+    """Lambda 每個 container 有自己的 log stream, 本機執行用 hostname + pid"""
+    return os.getenv("AWS_LAMBDA_LOG_STREAM_NAME") or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def push(job: str) -> None:
+    """
+    執行結束時呼叫, 失敗只記 log 不影響 Lambda 結果
+    PUSHGATEWAY_URL: 推到 Pushgateway, grouping key 為 Lambda function 名稱 + instance (container 的 log stream)
+        同時執行的 container 各自一組, 不會互相覆蓋; 指標在 container 內累加, warm start 再推一次是覆蓋自己那組的累計值
+        (counter / histogram 語意不變, 以 sum(rate(...)) 跨 instance 彙總, 已結束的 container 可用 push_time_seconds 排除)
+    METRICS_TEXTFILE: 寫成 node_exporter textfile collector 的格式
+    """
+    if REGISTRY is None:
+        return
+    gateway = os.getenv("PUSHGATEWAY_URL")
+    textfile = os.getenv("METRICS_TEXTFILE")
+    try:
+        if gateway:
+            grouping_key = {"function": os.getenv("AWS_LAMBDA_FUNCTION_NAME", "local"), "instance": _instance()}
+            push_to_gateway(gateway, job=job, registry=REGISTRY, grouping_key=grouping_key, timeout=5)
+        if textfile:
+            write_to_textfile(textfile, REGISTRY)
+    except Exception as e:
+        logging.warning(f"Failed to export metrics: {e}")
@@ -0,0 +1,229 @@
+"""
+partitions.py
+arxiv_papers_history (etl_timestamp) 與 papers.downloaded_papers (last_attempt) 的每月 range partition 管理 (migration 005)
+- ensure_partitions: 建立本月到未來 months_ahead 個月的 partition, DEFAULT partition 裡有資料的月份也會拆成獨立 partition
+- apply_retention: 超過保留月數的 partition 整個 DETACH (drop_detached 時再 DROP), 不需要對大表 DELETE
+- partition 名稱為 <table>_pYYYY_MM, 以 UTC 月初為界
+
+Lambda 啟動時會呼叫 ensure_partitions (同一個 process 每月只檢查一次), 保留期限的清理只在 CLI 執行:
+python -m src.core.partitions             # 依 config 的 partitions.* 建立 partition 並套用保留期限
+python -m src.core.partitions --list
+"""
+
+import argparse
+import json
+import logging
+import re
+import threading
+from datetime import date, datetime, timezone
+
+from src.core.config import PartitionConfig
+from src.core.pg_engine import PsqlEngine
+
+# 資料表 -> partition key
+PARTITIONED_TABLES = {
+    "public.arxiv_papers_history": "etl_timestamp",
+    "papers.downloaded_papers": "last_attempt",
+}
+# config 的保留月數欄位
+RETENTION_FIELDS = {
+    "public.arxiv_papers_history": "history_retention_months",
+    "papers.downloaded_papers": "downloaded_retention_months",
+}
+_PARTITION_SUFFIX = re.compile(r"_p(\d{4})_(\d{2})$")
+
+_ensured_lock = threading.Lock()
+_ensured_month: date | None = None
+
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, months: int) -> date:
+    index = d.year * 12 + d.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _utc_bound(d: date) -> str:
+    return f"{d.isoformat()} 00:00:00+00"
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month.year:04d}_{month.month:02d}"
+
+
+def default_partition(table: str) -> str:
+    return f"{table}_default"
+
+
+def _month_of(partition: str) -> date | None:
+    match = _PARTITION_SUFFIX.search(partition)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+# -------------------------------
+# 查詢
+# -------------------------------
+def is_partitioned(pg: PsqlEngine, table: str) -> bool:
+    row = pg.execute_query(
+        "SELECT c.relkind FROM pg_class c WHERE c.oid = to_regclass(%s)", first=True, params=(table,)
+    )
+    return bool(row) and row.relkind == "p"
+
+
+def list_partitions(pg: PsqlEngine, table: str) -> list[tuple[str, str]]:
+    """(partition 名稱 schema.table, 範圍) 依名稱排序"""
+    rows = pg.execute_query(
+        """
+        SELECT n.nspname || '.' || c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE i.inhparent = to_regclass(%s)
+        ORDER BY 1
+        """,
+        params=(table,),
+    )
+    return [(r.name, r.bound) for r in rows]
+
+
+def default_months(pg: PsqlEngine, table: str, column: str) -> list[date]:
+    """DEFAULT partition 裡資料所在的月份 (正常情況下是空的)"""
+    rows = pg.execute_query(
+        f"SELECT DISTINCT date_trunc('month', {column} AT TIME ZONE 'UTC')::date AS month "
+        f"FROM {default_partition(table)} ORDER BY 1"
+    )
+    return [r.month for r in rows]
+
+
+# -------------------------------
+# 建立 / 清理
+# -------------------------------
+def create_partition(pg: PsqlEngine, table: str, column: str, month: date) -> bool:
+    """
+    建立一個月份的 partition, 已存在回傳 False
+    DEFAULT partition 裡有這個月份的資料時, 先建成一般資料表把資料搬過去再 ATTACH
+    (直接 CREATE ... PARTITION OF 會因為 DEFAULT partition 有符合的資料而失敗)
+    """
+    name = partition_name(table, month)
+    lower, upper = _utc_bound(month), _utc_bound(add_months(month, 1))
+    with pg.transaction() as cur:
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL AS found", (name,))
+        if cur.fetchone().found:
+            return False
+        cur.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {default_partition(table)} WHERE {column} >= %s AND {column} < %s) AS found",
+            (lower, upper),
+        )
+        if not cur.fetchone().found:
+            cur.execute(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)", (lower, upper))
+        else:
+            cur.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+            cur.execute(
+                f"""
+                WITH moved AS (
+                    DELETE FROM {default_partition(table)} WHERE {column} >= %s AND {column} < %s RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+                """,
+                (lower, upper),
+            )
+            logging.info(f"Moved {cur.rowcount} rows from {default_partition(table)} to {name}")
+            cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (lower, upper))
+    logging.info(f"Created partition {name}")
+    return True
+
+
+def ensure_partitions(pg: PsqlEngine, months_ahead: int, today: date | None = None) -> list[str]:
+    """建立本月起 months_ahead 個月的 partition, 並拆出 DEFAULT partition 裡的月份, 回傳新建的 partition"""
+    current = month_start(today or datetime.now(timezone.utc).date())
+    created = []
+    for table, column in PARTITIONED_TABLES.items():
+        if not is_partitioned(pg, table):
+            logging.warning(f"{table} is not partitioned, run migration 005_monthly_partitions.sql first")
+            continue
+        months = {add_months(current, i) for i in range(months_ahead + 1)}
+        months.update(default_months(pg, table, column))
+        for month in sorted(months):
+            if create_partition(pg, table, column, month):
+                created.append(partition_name(table, month))
+    return created
+
+
+def ensure_partitions_once(pg: PsqlEngine, months_ahead: int) -> list[str]:
+    """Lambda 用: warm start 時同一個月份只檢查一次, 失敗只記 log (資料會先落在 DEFAULT partition)"""
+    global _ensured_month
+    current = month_start(datetime.now(timezone.utc).date())
+    with _ensured_lock:
+        if _ensured_month == current:
+            return []
+        try:
+            created = ensure_partitions(pg, months_ahead, current)
+        except Exception as e:
+            logging.warning(f"Failed to ensure partitions: {e}")
+            return []
+        _ensured_month = current
+        return created
+
+
+def apply_retention(pg: PsqlEngine, table: str, retain_months: int, drop: bool = False,
+                    today: date | None = None) -> list[str]:
+    """
+    DETACH 整個月份都超過 retain_months 的 partition (含本月共保留 retain_months 個月)
+    drop=False 時留下獨立的資料表, 可以先備份再手動 DROP
+    """
+    cutoff = add_months(month_start(today or datetime.now(timezone.utc).date()), -(retain_months - 1))
+    removed = []
+    for name, _ in list_partitions(pg, table):
+        month = _month_of(name)
+        if month is None or month >= cutoff:
+            continue
+        with pg.transaction() as cur:
+            cur.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+            if drop:
+                cur.execute(f"DROP TABLE {name}")
+        logging.info(f"{'Dropped' if drop else 'Detached'} partition {name}")
+        removed.append(name)
+    return removed
+
+
+def maintain(pg: PsqlEngine, conf: PartitionConfig, today: date | None = None) -> dict:
+    """建立未來的 partition 並套用保留期限 (CLI / 排程用)"""
+    result = {"created": ensure_partitions(pg, conf.months_ahead, today), "detached": {}}
+    for table, field in RETENTION_FIELDS.items():
+        retain = getattr(conf, field)
+        if retain and is_partitioned(pg, table):
+            result["detached"][table] = apply_retention(pg, table, retain, conf.drop_detached, today)
+    return result
+
+
+def main():
+    from src.core.config_loader import get_config
+    from src.core.db import get_pg
+
+    parser = argparse.ArgumentParser(description="Manage monthly partitions of history / downloaded_papers")
+    parser.add_argument("--list", action="store_true", help="只列出目前的 partition")
+    parser.add_argument("--months-ahead", type=int, help="覆蓋 config 的 partitions.months_ahead")
+    parser.add_argument("--drop", action="store_true", help="超過保留期限的 partition DETACH 後直接 DROP")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    conf = get_config().partitions
+    updates = {}
+    if args.months_ahead is not None:
+        updates["months_ahead"] = args.months_ahead
+    if args.drop:
+        updates["drop_detached"] = True
+    conf = conf.model_copy(update=updates)
+    pg = get_pg()
+    if args.list:
+        for table in PARTITIONED_TABLES:
+            for name, bound in list_partitions(pg, table):
+                print(f"{name}\t{bound}")
+        return
+    print(json.dumps(maintain(pg, conf), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,21 @@
-from typing import Annotated, Any
+from typing import Annotated, Any, Iterable, Iterator
+from contextlib import contextmanager
+from datetime import date, datetime
 from pathlib import Path
+import io
+import json
+import re
+import threading
+import time
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 from loguru import logger
 from pydantic import BaseModel, Field
 import os
 
+from src.core.metrics import observe_db, rows_written
+
 # -------------------------------
 # 環境設定讀取
 # -------------------------------
@@ -24,6 +34,107 @@ POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 POSTGRES_SERVER = os.getenv("POSTGRES_SERVER")
 POSTGRES_PORT = int(os.getenv("POSTGRES_PORT", 5432))
 
+# 連線池大小, 閒置多久後 checkout 要先做健康檢查 (秒)
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", 1))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", 4))
+PG_HEALTH_CHECK_IDLE_SEC = float(os.getenv("PG_HEALTH_CHECK_IDLE_SEC", 30))
+# 連線池用完時最多等幾秒, 超過就 raise PoolExhaustedError (連線沒歸還時不會卡到 Lambda timeout)
+PG_POOL_TIMEOUT_SEC = float(os.getenv("PG_POOL_TIMEOUT_SEC", 30))
+
+# 連線斷掉時會丟的例外, 遇到就換一條新連線重試一次
+RECONNECT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+class PoolExhaustedError(psycopg2.pool.PoolError):
+    """等了 pool_timeout_sec 仍借不到連線"""
+
+
+def is_disconnect(e: Exception) -> bool:
+    """client 端的斷線錯誤沒有 pgcode, server 端錯誤 (例如 statement timeout) 則有"""
+    return isinstance(e, RECONNECT_ERRORS) and getattr(e, "pgcode", None) is None
+
+# -------------------------------
+# 連線池 (module level)
+# Lambda warm start 時 module 不會重新 import, 連線池會被沿用
+# ThreadedConnectionPool 用完會直接 raise, 另外用 semaphore 讓借不到的 thread 等待
+# -------------------------------
+_POOLS: dict[tuple, psycopg2.pool.ThreadedConnectionPool] = {}
+_SLOTS: dict[tuple, threading.BoundedSemaphore] = {}
+_POOLS_LOCK = threading.Lock()
+# id(conn) -> 最後一次歸還的時間, 用來判斷是否需要健康檢查
+_LAST_USED: dict[int, float] = {}
+# table_name -> 欄位名稱 (依 attnum 排序), COPY 時要明確指定欄位
+_TABLE_COLUMNS: dict[str, list[str]] = {}
+
+
+# -------------------------------
+# COPY text format 序列化
+# -------------------------------
+def _copy_escape(s: str) -> str:
+    # str.replace 走 C 實作, 比 str.translate 快很多
+    return s.replace("\\", "\\\\").replace("\n", "\\n").replace("\r", "\\r").replace("\t", "\\t")
+
+def _array_literal(values: Iterable[Any]) -> str:
+    items = []
+    for v in values:
+        if v is None:
+            items.append("NULL")
+        elif isinstance(v, (list, tuple)):
+            items.append(_array_literal(v))
+        else:
+            s = _copy_value(v) if not isinstance(v, str) else v
+            items.append('"' + s.replace("\\", "\\\\").replace('"', '\\"') + '"')
+    return "{" + ",".join(items) + "}"
+
+def _copy_value(v: Any) -> str:
+    """單一欄位值轉成 COPY text format (尚未做 COPY 跳脫)"""
+    if isinstance(v, str):
+        return v
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    if isinstance(v, (int, float)):
+        return repr(v)
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, (list, tuple)):
+        return _array_literal(v)
+    if isinstance(v, dict):
+        return json.dumps(v, ensure_ascii=False)
+    if isinstance(v, psycopg2.extras.Json):
+        return v.dumps(v.adapted)
+    return str(v)
+
+def copy_line(row: tuple[Any, ...]) -> str:
+    return "\t".join(
+        "\\N" if v is None else _copy_escape(_copy_value(v)) for v in row
+    ) + "\n"
+
+
+class CopyStream(io.TextIOBase):
+    """
+    把 rows 包成 file-like 物件給 copy_expert 讀
+    邊讀邊序列化, 不會一次在記憶體組出整份資料
+    """
+
+    def __init__(self, rows: Iterable[tuple[Any, ...]]):
+        self._lines = map(copy_line, rows)
+        self._buf = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buf) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buf += line
+        if size < 0:
+            out, self._buf = self._buf, ""
+        else:
+            out, self._buf = self._buf[:size], self._buf[size:]
+        return out
+
+
 # -------------------------------
 # PostgreSQL Engine
 # -------------------------------
@@ -33,26 +144,141 @@ class PsqlEngine(BaseModel):
     password: Annotated[str, Field(default=POSTGRES_PASSWORD)]
     host: Annotated[str, Field(default=POSTGRES_SERVER)]
     port: Annotated[int, Field(default=POSTGRES_PORT)]
-    conn: Annotated[Any, Field(default=None)]
-    cursor: Annotated[Any, Field(default=None)]
+    minconn: Annotated[int, Field(default=PG_POOL_MIN)]
+    maxconn: Annotated[int, Field(default=PG_POOL_MAX)]
+    health_check_idle_sec: Annotated[float, Field(default=PG_HEALTH_CHECK_IDLE_SEC)]
+    pool_timeout_sec: Annotated[float, Field(default=PG_POOL_TIMEOUT_SEC)]
+    pool: Annotated[Any, Field(default=None)]
 
     def model_post_init(self, context: Any):
         self.connect_db()
 
+    @property
+    def pool_key(self) -> tuple:
+        return (self.host, self.port, self.dbname, self.user)
+
     def connect_db(self):
-        self.conn = psycopg2.connect(
-            dbname=self.dbname,
-            user=self.user,
-            password=self.password,
-            host=self.host,
-            port=self.port,
-        )
-        self.conn.set_session(autocommit=False)
+        """取得 (或建立) 這組連線資訊對應的連線池"""
+        with _POOLS_LOCK:
+            pool = _POOLS.get(self.pool_key)
+            if pool is None or pool.closed:
+                pool = psycopg2.pool.ThreadedConnectionPool(
+                    self.minconn,
+                    self.maxconn,
+                    dbname=self.dbname,
+                    user=self.user,
+                    password=self.password,
+                    host=self.host,
+                    port=self.port,
+                )
+                _POOLS[self.pool_key] = pool
+                _SLOTS[self.pool_key] = threading.BoundedSemaphore(self.maxconn)
+        self.pool = pool
         return self
 
     def re_connect(self):
+        """整個連線池關掉重建"""
+        self.close_connect()
         self.connect_db()
 
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        idle = time.monotonic() - _LAST_USED.get(id(conn), 0.0)
+        if idle < self.health_check_idle_sec:
+            return True
+        # 閒置太久 (例如 Lambda 被凍結後) socket 可能已被對方關掉
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except RECONNECT_ERRORS:
+            return False
+
+    def _put(self, pool, conn) -> None:
+        if conn.closed:
+            _LAST_USED.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+        else:
+            _LAST_USED[id(conn)] = time.monotonic()
+            pool.putconn(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """
+        從連線池借一條連線, 用完自動歸還
+        借出前會做健康檢查, 已斷線的連線直接關閉不放回池中
+        連線都被借走時最多等 pool_timeout_sec 秒, 之後 raise PoolExhaustedError
+        """
+        if self.pool is None or self.pool.closed:
+            self.connect_db()
+        pool, slots = self.pool, _SLOTS[self.pool_key]
+        if not slots.acquire(timeout=self.pool_timeout_sec):
+            raise PoolExhaustedError(
+                f"connection pool exhausted: all {pool.maxconn} connections to {self.host}/{self.dbname} "
+                f"still in use after {self.pool_timeout_sec}s (a thread may be holding a connection)"
+            )
+        try:
+            conn = pool.getconn()
+            # 最多丟掉 maxconn 條壞掉的連線, 之後 pool 會開新的
+            for _ in range(self.maxconn):
+                if self._is_healthy(conn):
+                    break
+                logger.warning("Discard broken connection from pool")
+                conn.close()
+                self._put(pool, conn)
+                conn = pool.getconn()
+            try:
+                yield conn
+            finally:
+                if not conn.closed:
+                    try:
+                        conn.rollback()  # 清掉未 commit 的狀態再放回池中
+                    except RECONNECT_ERRORS:
+                        conn.close()
+                self._put(pool, conn)
+        finally:
+            slots.release()
+
+    @contextmanager
+    def transaction(self, cursor_factory=psycopg2.extras.NamedTupleCursor) -> Iterator[Any]:
+        """
+        多個 statement 包成一個 transaction, 成功 commit, 失敗 rollback 並往外拋
+        with pg.transaction() as cur:
+            cur.execute(...)
+            cur.execute(...)
+        """
+        with self.connection() as conn:
+            with conn.cursor(cursor_factory=cursor_factory) as cur:
+                try:
+                    yield cur
+                    conn.commit()
+                except Exception:
+                    if not conn.closed:
+                        conn.rollback()
+                    raise
+
+    def _run(self, fn, cursor_factory=psycopg2.extras.NamedTupleCursor, idempotent: bool = False):
+        """
+        在 transaction 裡執行 fn(cursor), 連線斷掉時換一條連線重試一次
+        COMMIT 之前斷線, 整個 transaction 已被 server rollback, 重試不會重複寫入
+        COMMIT 送出後才斷線則不知道有沒有 commit 成功, 只有 idempotent (唯讀或重跑結果相同) 的呼叫端才重試, 其餘往外拋
+        """
+        committing = False
+        try:
+            with self.transaction(cursor_factory=cursor_factory) as cur:
+                result = fn(cur)
+                committing = True
+            return result
+        except RECONNECT_ERRORS as e:
+            if not is_disconnect(e) or (committing and not idempotent):
+                raise
+            logger.warning(f"Connection lost, retry once: {e}")
+            with self.transaction(cursor_factory=cursor_factory) as cur:
+                return fn(cur)
+
+    @observe_db("execute_cmd")
     def execute_cmd(
         self,
         stmt: str,
@@ -60,74 +286,153 @@ class PsqlEngine(BaseModel):
         cursor_factory=psycopg2.extras.NamedTupleCursor
     ) -> None:
         try:
-            if not self.conn:
-                self.re_connect()
-            if not self.cursor:
-                self.cursor = self.conn.cursor(cursor_factory=cursor_factory)
-            if params:
-                self.cursor.execute(stmt, params)
-            else:
-                self.cursor.execute(stmt)
-            self.conn.commit()
+            self._run(lambda cur: cur.execute(stmt, params) if params else cur.execute(stmt), cursor_factory)
         except Exception as e:
             logger.error(e)
             logger.error(f"Error sql statement: {stmt}")
-            self.conn.rollback()
-        finally:
-            self.close_connect()
 
+    @observe_db("execute_query")
     def execute_query(
         self,
         stmt: str,
         cursor_factory=psycopg2.extras.NamedTupleCursor,
         first: bool = False,
+        params: tuple = None,
+        idempotent: bool = False,
     ) -> list[Any]:
+        """idempotent: 唯讀或重跑結果相同的 stmt, COMMIT 時斷線也可以重試 (見 _run)"""
         result = []
+
+        def _query(cur):
+            cur.execute(stmt, params) if params else cur.execute(stmt)
+            return cur.fetchall()
+
         try:
-            if not self.conn:
-                self.re_connect()
-            if not self.cursor:
-                self.cursor = self.conn.cursor(cursor_factory=cursor_factory)
-            self.cursor.execute(stmt)
-            result = self.cursor.fetchall()
-            self.conn.commit()
+            result = self._run(_query, cursor_factory, idempotent=idempotent)
         except Exception as e:
             logger.error(e)
             logger.error(f"Error sql statement: {stmt}")
-            self.conn.rollback()
-        finally:
-            self.close_connect()
         return result[0] if first and result else result
 
-    def insert_mogrify(self, table_name: str, values: list[tuple[Any, ...]]) -> None:
-        try:
-            if not self.conn:
-                self.re_connect()
-            if not self.cursor:
-                self.cursor = self.conn.cursor()
+    @observe_db("insert_mogrify")
+    def insert_mogrify(
+        self,
+        table_name: str,
+        values: list[tuple[Any, ...]],
+        on_conflict: str = "ON CONFLICT DO NOTHING",
+    ) -> None:
+        """失敗時記錄 SQL 後往上拋, 由呼叫端決定重試或隔離"""
+        args_str = ""
+
+        def _insert(cur):
+            nonlocal args_str
             placeholders = ",".join(["%s"] * len(values[0]))
             args_str = ",".join(
-                self.cursor.mogrify(f"({placeholders})", value).decode("utf-8")
+                cur.mogrify(f"({placeholders})", value).decode("utf-8")
                 for value in values
             )
-            self.cursor.execute(f"insert into {table_name} values {args_str} ON CONFLICT DO NOTHING;;")
-            self.conn.commit()
+            cur.execute(f"insert into {table_name} values {args_str} {on_conflict};;")
+            rows_written(cur.rowcount)
+
+        try:
+            self._run(_insert, cursor_factory=None)
         except Exception as e:
-            # logger.error(e)
+            logger.error(e)
             logger.error(
-                f"Error sql statement: insert into {table_name} values {args_str};"
+                f"Error sql statement: insert into {table_name} values {args_str[:1000]};"
             )
-            self.conn.rollback()
-        finally:
-            self.close_connect()
+            raise
+
+    def table_columns(self, table_name: str) -> list[str]:
+        """取得資料表欄位 (依定義順序), 結果會 cache 在 process 內"""
+        if table_name not in _TABLE_COLUMNS:
+            def _query(cur):
+                cur.execute(
+                    """
+                    SELECT attname FROM pg_attribute
+                    WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+                    ORDER BY attnum
+                    """,
+                    (table_name,),
+                )
+                return [r[0] for r in cur.fetchall()]
+            _TABLE_COLUMNS[table_name] = self._run(_query, cursor_factory=None, idempotent=True)
+        return _TABLE_COLUMNS[table_name]
+
+    def copy_rows(self, cur, table_name: str, values: Iterable[tuple[Any, ...]], columns: list[str]) -> None:
+        """在既有的 cursor 上用 COPY FROM STDIN (text format) 串流寫入"""
+        cur.copy_expert(
+            f"COPY {table_name} ({','.join(columns)}) FROM STDIN",
+            CopyStream(values),
+            size=65536,
+        )
+
+    @observe_db("stage_merge")
+    def stage_merge(
+        self,
+        table_name: str,
+        values: list[tuple[Any, ...]],
+        merge_stmt: str,
+        columns: list[str] | None = None,
+        params: tuple = None,
+    ) -> list[Any]:
+        """
+        COPY 到與 table_name 同結構的暫存表, 再執行 merge_stmt ({staging} 代換成暫存表名稱)
+        暫存表為 ON COMMIT DROP, 不會留在連線上; 失敗會往外拋
+        merge_stmt 有 RETURNING 時回傳結果
+        寫入筆數記 merge_stmt 最後一個 statement 的 rowcount (UPSERT_CHANGED_STMT 是有變動的文章數)
+        """
+        if not values:
+            return []
+        columns = columns or self.table_columns(table_name)[:len(values[0])]
+        staging = "_stage_" + re.sub(r"\W", "_", table_name)
+
+        def _merge(cur):
+            cur.execute(
+                f"CREATE TEMP TABLE {staging} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+            self.copy_rows(cur, staging, values, columns)
+            cur.execute(merge_stmt.replace("{staging}", staging), params)
+            rows_written(cur.rowcount)
+            return cur.fetchall() if cur.description else []
+
+        return self._run(_merge, cursor_factory=None)
+
+    @observe_db("copy_merge")
+    def copy_merge(
+        self,
+        table_name: str,
+        values: list[tuple[Any, ...]],
+        on_conflict: str = "ON CONFLICT DO NOTHING",
+    ) -> None:
+        """
+        COPY 到暫存表再 merge 進目標表, 效果等同 insert_mogrify (依欄位順序對應)
+        失敗時同樣往上拋
+        """
+        if not values:
+            return
+        columns = self.table_columns(table_name)[:len(values[0])]
+        cols = ",".join(columns)
+        try:
+            self.stage_merge(
+                table_name,
+                values,
+                f"INSERT INTO {table_name} ({cols}) SELECT {cols} FROM {{staging}} {on_conflict}",
+                columns=columns,
+            )
+        except Exception as e:
+            logger.error(e)
+            logger.error(f"Error copy merge into {table_name} ({len(values)} rows)")
+            raise
 
     def close_connect(self) -> None:
+        """關閉整個連線池 (一般不需要呼叫, 讓 warm Lambda 沿用連線)"""
         try:
-            if self.cursor:
-                self.cursor.close()
-            if self.conn:
-                self.conn.close()
-            self.cursor = None
-            self.conn = None
+            with _POOLS_LOCK:
+                pool = _POOLS.pop(self.pool_key, None)
+                _SLOTS.pop(self.pool_key, None)
+            if pool and not pool.closed:
+                pool.closeall()
+            self.pool = None
         except Exception as e:
             logger.error(e)
@@ -0,0 +1,43 @@
+"""
+rate_limit.py
+Thread-safe token bucket
+- 每秒補 rate 個 token, 最多累積 capacity 個
+- acquire() 拿不到 token 就 sleep 到補滿為止, 多個 thread 共用同一個 bucket 時整體速率不會超過 rate
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_interval(cls, interval_seconds: float, burst: float = 1) -> "TokenBucket":
+        """每 interval_seconds 秒一個 token"""
+        return cls(1 / interval_seconds, burst)
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1) -> float:
+        """取得 token, 回傳等待的秒數"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
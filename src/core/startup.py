@@ -0,0 +1,82 @@
+"""
+startup.py
+Cold start 相關工具
+- lazy_resource: 第一次使用時才建立資源 (boto3 client, arXiv client ...) 並記錄花費時間
+- LazyModule: 第一次取用屬性時才 import 較重的套件
+- report: 第一次執行完 handler 後輸出各 import / 初始化的耗時, 方便看出 cold start 退化
+"""
+
+import functools
+import importlib
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+_timings: dict[str, float] = {}
+_lock = threading.Lock()
+_reported = False
+
+
+@contextmanager
+def timed(name: str):
+    """記錄一段程式的耗時 (ms), 同名稱會累加"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        with _lock:
+            _timings[name] = _timings.get(name, 0.0) + elapsed
+
+
+def lazy_resource(name: str):
+    """
+    decorator: 把無參數的 factory 變成 memoized getter, 第一次呼叫時建立並計時
+    @lazy_resource("s3 client")
+    def get_s3():
+        return boto3.client("s3")
+    """
+    def decorator(factory):
+        lock = threading.Lock()
+        holder = []
+
+        @functools.wraps(factory)
+        def getter():
+            if not holder:
+                with lock:
+                    if not holder:
+                        with timed(f"init {name}"):
+                            holder.append(factory())
+            return holder[0]
+
+        getter.reset = holder.clear
+        return getter
+    return decorator
+
+
+class LazyModule:
+    """import 延後到第一次取用屬性, 並記錄 import 耗時"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            with timed(f"import {self._name}"):
+                self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def report(logger: logging.Logger = logging.getLogger()) -> dict | None:
+    """只在 cold start 後第一次呼叫時輸出, 之後的 warm start 回傳 None"""
+    global _reported
+    with _lock:
+        if _reported:
+            return None
+        _reported = True
+        timings = {k: round(v, 1) for k, v in sorted(_timings.items(), key=lambda kv: -kv[1])}
+    logger.info(f"Cold start timings (ms): {json.dumps(timings)}")
+    return timings
@@ -0,0 +1,105 @@
+"""
+time_budget.py
+依 Lambda 剩餘時間決定一次執行要做多少工作
+- 每個工作 (一個領域 / 一個檔案) 的耗時以 EWMA 估計, 估計值放在 module 變數, warm start 會沿用
+- 開始下一個工作前確認: 估計耗時 <= get_remaining_time_in_millis() - 安全餘量, 放不下就停止並交給下一個 Lambda
+- 沒有 context (本機執行) 時沒有期限, 改用 max_items 限制數量 (原本的 num_categories_per_run / pending_gz_batch)
+
+budget = TimeBudget(context, safety_seconds=30, estimate=FILE_SECONDS, max_items=None)
+results = budget.run(next_item, handle, concurrency=3)   # [(item, result), ...]
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Ewma:
+    """指數加權移動平均, 還沒有任何觀測值時 value 為 None"""
+
+    def __init__(self, alpha: float = 0.3, initial: float | None = None):
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be in (0, 1]")
+        self.alpha = alpha
+        self.value = initial
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def update(self, x: float) -> float:
+        with self._lock:
+            self.value = x if self.value is None else self.alpha * x + (1 - self.alpha) * self.value
+            self.samples += 1
+            return self.value
+
+
+class TimeBudget:
+    def __init__(self, context=None, safety_seconds: float = 30.0, estimate: Ewma | None = None,
+                 max_items: int | None = None):
+        """
+        context: Lambda context (有 get_remaining_time_in_millis), None 表示沒有期限
+        estimate: 每個工作的耗時估計, 同一種工作共用一個 Ewma
+        max_items: 最多開始幾個工作, None 表示只看剩餘時間
+        """
+        self.context = context
+        self.safety_seconds = safety_seconds
+        self.estimate = estimate or Ewma()
+        self.max_items = max_items
+        self.started = 0
+        self.stopped_early = False  # 因為剩餘時間不夠而停止取新的工作
+
+    def remaining_seconds(self) -> float | None:
+        if self.context is None:
+            return None
+        return self.context.get_remaining_time_in_millis() / 1000
+
+    def exhausted(self) -> bool:
+        """剩餘時間已進入安全餘量, 正在做的工作應該盡快收尾"""
+        remaining = self.remaining_seconds()
+        return remaining is not None and remaining <= self.safety_seconds
+
+    def fits(self) -> bool:
+        """還能不能再開始一個工作 (沒有估計值時只要還沒進入安全餘量就可以)"""
+        if self.max_items is not None and self.started >= self.max_items:
+            return False
+        remaining = self.remaining_seconds()
+        if remaining is None:
+            return True
+        return remaining - self.safety_seconds >= (self.estimate.value or 0.0)
+
+    def _timed(self, handle, item):
+        start = time.monotonic()
+        try:
+            return handle(item)
+        finally:
+            self.estimate.update(time.monotonic() - start)
+
+    def run(self, next_item, handle, concurrency: int = 1) -> list:
+        """
+        next_item(): 取得下一個工作, 沒有了回傳 None
+        handle(item): 處理一個工作
+        有空的 worker 且時間放得下才取下一個工作, 回傳 [(item, handle 的回傳值), ...] (依完成順序)
+        """
+        results = []
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix="budget") as executor:
+            running = {}
+            exhausted_items = False
+            while True:
+                while not exhausted_items and len(running) < max(concurrency, 1):
+                    if not self.fits():
+                        self.stopped_early = self.max_items is None or self.started < self.max_items
+                        break
+                    item = next_item()
+                    if item is None:
+                        exhausted_items = True
+                        break
+                    self.started += 1
+                    running[executor.submit(self._timed, handle, item)] = item
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results.append((running.pop(future), future.result()))
+                if self.stopped_early:
+                    # 時間不夠就不再取新的工作, 等正在做的做完
+                    exhausted_items = True
+        return results
@@ -1,203 +1,383 @@
 import os
 import json
+import psycopg2
 from psycopg2.extras import Json
-import gzip
-import io
-import boto3
-import uuid
-import yaml
 import logging
+import threading
+from collections import Counter, deque
 from datetime import datetime, timezone
+from src.core import metrics, partitions
+from src.core.config import PipelineConfig
+from src.core.config_loader import get_config
 from src.core.db import get_pg
 from src.core.pg_engine import PsqlEngine
+from src.core.startup import LazyModule, lazy_resource
+from src.core.time_budget import Ewma, TimeBudget
+from src.etl import dispatcher, leases
+from src.etl.record_decoder import (
+    HISTORY_KEYWORDS_INDEX, PAPER_KEYWORDS_INDEX, RecordDecoder, RecordError, loads,
+)
+from src.etl.s3_stream import iter_s3_gzip_lines
+
+# 較重的套件第一次用到才 import, 縮短 cold start
+boto3 = LazyModule("boto3")
+# 關鍵字擷取需要 numpy, keywords.enabled 為 true 才會載入
+keywords = LazyModule("src.etl.keywords")
+# 合併後的 Parquet 需要 pyarrow (不在 Lambda layer), 只有 parquet_compaction --reload 會讀到
+parquet_compaction = LazyModule("src.etl.parquet_compaction")
 
 BUCKET_NAME = os.getenv("BUCKET_NAME")
 AWS_LAMBDA_FUNCTION_NAME = os.getenv("AWS_LAMBDA_FUNCTION_ETL")
 
-s3 = boto3.client("s3")
-
-def load_config(bucket_name: str):
-    key = "config/config.yaml"
-    local_path = "/tmp/config.yaml"
-    try:
-        s3.download_file(bucket_name, key, local_path)
-        with open(local_path, "r") as f:
-            config = yaml.safe_load(f)
-        return config
-    except Exception as e:
-        logging.error(f"Failed to load config from S3: {e}")
-        raise
+@lazy_resource("s3 client")
+def get_s3():
+    return metrics.instrument_s3(boto3.client("s3"))
 
-cfg = load_config(BUCKET_NAME)
-
-PENDING_GZ_BATCH = cfg['etl']['pending_gz_batch']
-ETL_BATCH_SIZE = cfg['etl']['etl_batch_size']
+# 以下都在 apply_config (run_lambda 開始時) 才建立
+cfg: PipelineConfig = None
+pg: PsqlEngine = None
+db_writer_slots: threading.BoundedSemaphore = None
+# 每個檔案的耗時估計, warm start 沿用
+file_seconds: Ewma = None
+# keywords.enabled 為 false 時是 None
+keyword_extractor: "keywords.KeywordExtractor | None" = None
 
+def apply_config(conf: PipelineConfig):
+    """
+    把設定套用到 module 變數, 每次 run_lambda 開始時都會呼叫
+    warm Lambda 也能拿到 S3 上最新的 config (ETag 沒變就不會重新下載)
+    連線池大小只在第一次建立時決定
+    """
+    global cfg, pg, db_writer_slots, file_seconds, keyword_extractor, PENDING_GZ_BATCH, ETL_BATCH_SIZE, LOAD_METHOD
+    global STREAM_CHUNK_SIZE, STREAM_PREFETCH_CHUNKS, FILE_CONCURRENCY, DB_WRITERS, WRITE_MODE
+    global LEASE_SECONDS, HEARTBEAT_SECONDS, MAX_ATTEMPTS
+    if conf is cfg:
+        return
+    cfg = conf
+    etl = conf.etl
+    PENDING_GZ_BATCH = etl.pending_gz_batch
+    ETL_BATCH_SIZE = etl.etl_batch_size
+    # mogrify: 組 INSERT ... VALUES, copy: COPY FROM STDIN 到暫存表再 merge
+    LOAD_METHOD = etl.load_method
+    # 串流讀取 S3 的 chunk 大小與預先讀取的 chunk 數, 記憶體上限約為兩者相乘
+    STREAM_CHUNK_SIZE = etl.stream_chunk_kb * 1024
+    STREAM_PREFETCH_CHUNKS = etl.stream_prefetch_chunks
+    # 同時處理的檔案數 (S3 下載/解壓 thread) 與同時寫 DB 的連線數, 依 Lambda 記憶體/CPU 調整
+    FILE_CONCURRENCY = etl.file_concurrency
+    DB_WRITERS = etl.db_writers or FILE_CONCURRENCY
+    # append: 主表 ON CONFLICT DO NOTHING 且每筆都寫 history
+    # upsert: 比對 content_hash, 只有內容變動才更新主表 (version + 1) 並寫 history
+    WRITE_MODE = etl.write_mode
+    # 檔案以 lease 認領, 執行中每 heartbeat_seconds 延長; timeout / crash 的檔案到期後重新認領, 最多 max_attempts 次
+    LEASE_SECONDS = etl.lease_seconds
+    HEARTBEAT_SECONDS = etl.heartbeat_seconds
+    MAX_ATTEMPTS = etl.max_attempts
+    # 每個寫入批次以 TF-IDF 擷取關鍵字 (src.etl.keywords)
+    keyword_extractor = keywords.KeywordExtractor.from_config(conf.keywords) if conf.keywords.enabled else None
 
-pg = get_pg()
+    # 多留一條連線給狀態更新, 避免被寫入佔滿
+    pg = get_pg(maxconn=DB_WRITERS + 1)
+    db_writer_slots = threading.BoundedSemaphore(DB_WRITERS)
+    if file_seconds is None or file_seconds.alpha != conf.lambda_.time_estimate_alpha:
+        file_seconds = Ewma(conf.lambda_.time_estimate_alpha)
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-def get_pending_gz(pg: PsqlEngine, num: int):
-    stmt = f"""
-        UPDATE etl.raw_batches
-        SET etl_status = 'processing',
-            etl_started_at = now()
-        WHERE batch_id IN (
-            SELECT batch_id
-            FROM etl.raw_batches
-            WHERE etl_status = 'pending'
-            ORDER BY batch_id
-            FOR UPDATE SKIP LOCKED
-            LIMIT {num}
-        )
-        RETURNING s3_path, category;
-    """
-    return pg.execute_query(stmt)
-
-def parse_record(record: dict, s3_key: str):
-    published_date = record.get("published")
-    updated_date = record.get("updated")
-    if published_date:
-        published_date = datetime.fromisoformat(published_date).date()
-    if updated_date:
-        updated_date = datetime.fromisoformat(updated_date).date()
-    return (
-        record.get("entry_id"),
-        record.get("title"),
-        record.get("authors", []),
-        json.dumps({}),
-        record.get("summary"),
-        record.get("primary_category"),
-        record.get("categories", []),
-        record.get("published"),
-        record.get("updated"),
-        record.get("journal_ref"),
-        record.get("doi"),
-        json.dumps({}),
-        published_date,
-        updated_date,
-        datetime.now(timezone.utc),
-        1,
-        [],
-        None,
-        s3_key
+def get_pending_gz(pg: PsqlEngine, num: int, worker_id: str):
+    """認領最多 num 個 pending 或 lease 已到期的檔案, 狀態改為 processing"""
+    return leases.claim(pg, worker_id, num, LEASE_SECONDS, MAX_ATTEMPTS)
+
+# upsert 模式寫入 arxiv_papers 的欄位, 順序對應 RecordDecoder(with_hash=True) 的 paper tuple
+UPSERT_COLUMNS = [
+    "entry_id", "title", "authors", "affiliations", "summary", "primary_category", "categories",
+    "published", "updated", "journal_ref", "doi", "links", "published_date", "updated_date",
+    "etl_timestamp", "version", "keywords", "topic", "s3_path", "content_hash",
+]
+
+# 內容有變動的才會被 INSERT ... ON CONFLICT DO UPDATE 回傳, 再寫進 history
+# (PG 17 之前 MERGE 不支援 RETURNING, 所以用 ON CONFLICT ... WHERE 做同樣的事)
+# history 的 version 跟 append 模式 (RecordDecoder) 一樣是寫入時的 epoch 秒, 不是主表每篇文章的 version 計數
+UPSERT_CHANGED_STMT = f"""
+    WITH changed AS (
+        INSERT INTO arxiv_papers AS p ({", ".join(UPSERT_COLUMNS)})
+        SELECT DISTINCT ON (entry_id) {", ".join(UPSERT_COLUMNS)}
+        FROM {{staging}}
+        ORDER BY entry_id, updated DESC
+        ON CONFLICT (entry_id) DO UPDATE SET
+            {", ".join(f"{c} = EXCLUDED.{c}" for c in UPSERT_COLUMNS if c not in ("entry_id", "version"))},
+            version = p.version + 1
+        WHERE p.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+        RETURNING p.*, (xmax = 0) AS inserted
+    )
+    INSERT INTO arxiv_papers_history (
+        history_id, entry_id, version, etl_timestamp, etl_stage, title, authors, affiliations,
+        summary, primary_category, categories, published, updated, journal_ref, doi, links,
+        keywords, topic, s3_path, operation_type
     )
+    SELECT
+        gen_random_uuid()::text, entry_id, floor(extract(epoch FROM etl_timestamp))::bigint, etl_timestamp,
+        %s, title, authors, affiliations, summary, primary_category, categories, published, updated,
+        journal_ref, doi, links, keywords, topic, s3_path, CASE WHEN inserted THEN 'insert' ELSE 'update' END
+    FROM changed
+    RETURNING operation_type
+"""
 
-def parse_history_record(record: dict, s3_key: str, operation: str, etl_stage: str):
-    summary = (record.get("summary") or "").replace('\x00', '').replace('\n', ' ').replace('\r', ' ')
+def write_rows(table: str, rows: list):
+    """依 etl.load_method 選擇寫入方式, 兩者皆為 ON CONFLICT DO NOTHING"""
+    with db_writer_slots:
+        if LOAD_METHOD == "copy":
+            pg.copy_merge(table, rows)
+        else:
+            pg.insert_mogrify(table, rows)
+
+def upsert_papers(rows: list, etl_stage: str) -> Counter:
+    """
+    upsert 模式: COPY 到暫存表後一次比對 content_hash
+    回傳 insert / update 筆數, 內容沒變的不會有任何寫入
+    """
+    with db_writer_slots:
+        result = pg.stage_merge("arxiv_papers", rows, UPSERT_CHANGED_STMT, columns=UPSERT_COLUMNS, params=(etl_stage,))
+    return Counter(r[0] for r in result)
+
+# 只有資料本身的問題 (NOT NULL / 型別 / 長度 ...) 才拆批次找壞資料
+# 連線中斷等其他錯誤直接往上拋, 整個檔案標成 failed 下次重跑
+ROW_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError, ValueError, TypeError)
+
+QUARANTINE_STMT = """
+    INSERT INTO etl.quarantine_rows (table_name, entry_id, s3_path, error_msg, row_data)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+def strip_nul(value):
+    """PG 的 TEXT 與 JSONB 都不接受 \\x00 (JSONB 裡是 \\u0000), 隔離前先拿掉, 否則連隔離都寫不進去"""
+    if isinstance(value, str):
+        return value.replace("\x00", "")
+    if isinstance(value, dict):
+        return {strip_nul(k): strip_nul(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [strip_nul(v) for v in value]
+    return value
+
+def quarantine_row(table: str, row: tuple | dict, error: Exception, s3_key: str, columns: list[str] | None = None):
+    """
+    把寫不進去的單筆資料連同錯誤訊息與來源檔案寫進 etl.quarantine_rows
+    row 為 tuple 時依欄位順序轉成 dict; 解碼失敗的原始 record 直接是 dict
+    隔離本身寫入失敗時往外拋 (不經過 execute_cmd 吞掉錯誤), 整個檔案標成 failed 由 lease 重試, 資料不會默默消失
+    """
+    if isinstance(row, dict):
+        data = row
+    else:
+        columns = columns or pg.table_columns(table)[:len(row)]
+        data = {col: (v.adapted if isinstance(v, Json) else v) for col, v in zip(columns, row)}
+    data = strip_nul(data)
+    entry_id = data.get("entry_id")
+    message = strip_nul(str(error).strip())
+    params = (table, entry_id, s3_key, message, Json(data, dumps=lambda o: json.dumps(o, default=str)))
+    pg._run(lambda cur: cur.execute(QUARANTINE_STMT, params), cursor_factory=None)
+    metrics.DB_QUARANTINED_ROWS.labels(table).inc()
+    logger.warning(f"Quarantined row {entry_id} for {table} from {s3_key}: {message}")
+
+def safe_insert(table: str, batch: list, s3_key: str, write=None, columns: list[str] | None = None) -> int:
+    """
+    寫入一個批次, 失敗時對半拆開重試, 直到找出寫不進去的單筆資料並隔離
+    k 筆壞資料約需 O(k log n) 次 round trip, 其餘資料照常寫入
+    回傳被隔離的筆數
+    """
+    if not batch:
+        return 0
+    write = write or (lambda rows: write_rows(table, rows))
+    try:
+        write(batch)
+        return 0
+    except ROW_ERRORS as e:
+        if len(batch) == 1:
+            quarantine_row(table, batch[0], e, s3_key, columns)
+            return 1
+        logger.error(f"Batch insert into {table} failed ({len(batch)} rows), bisecting: {str(e).strip()}")
+    mid = len(batch) // 2
     return (
-        str(uuid.uuid4()),
-        record.get("entry_id"),
-        datetime.now(timezone.utc).timestamp(),
-        datetime.now(timezone.utc),
-        etl_stage,
-        record.get("title"),
-        record.get("authors", []),
-        Json({}),
-        summary,
-        record.get("primary_category"),
-        record.get("categories", []),
-        record.get("published"),
-        record.get("updated"),
-        record.get("journal_ref"),
-        record.get("doi"),
-        Json({}),
-        [],
-        None,
-        s3_key,
-        operation
+        safe_insert(table, batch[:mid], s3_key, write, columns)
+        + safe_insert(table, batch[mid:], s3_key, write, columns)
     )
 
-def safe_insert(table: str, batch: list):
-    try:
-        pg.insert_mogrify(table, batch)
-    except Exception as e:
-        logger.error(f"Batch insert failed: {e}")
-        for row in batch:
-            try:
-                pg.insert_mogrify(table, [row])
-            except Exception as e2:
-                logger.error(f"Single insert failed for row {row[0]}: {e2}")
-        return False
-    return True
-
-def update_etl_status(pg: PsqlEngine, s3_path: str, status: str, started_at=None, finished_at=None, error_msg=None):
-    stmt = """
-        update etl.raw_batches
-        set etl_status = %s,
-            etl_started_at = coalesce(%s, etl_started_at),
-            etl_finished_at = coalesce(%s, etl_finished_at),
-            error_msg = %s
-        where s3_path = %s;
+def iter_s3_records(bucket: str, s3_key: str, on_malformed=None):
+    """
+    raw jsonl.gz 或合併後的 Parquet (src.etl.parquet_compaction) 都轉成同樣格式的 dict
+    Parquet 不會登記到 raw_batches, Lambda worker 只會拿到 raw 檔案; 讀 Parquet 的是本機的 parquet_compaction --reload
+    on_malformed(line_no, line, error): 不是合法 JSON 的行交給它處理 (行號從 1 開始) 後繼續下一行, 沒給就往外拋
     """
-    params = (status, started_at, finished_at, error_msg, s3_path)
-    pg.execute_cmd(stmt, params)
+    if s3_key.endswith(".parquet"):
+        yield from parquet_compaction.iter_parquet_records(get_s3(), bucket, s3_key)
+        return
+    obj = get_s3().get_object(Bucket=bucket, Key=s3_key)
+    # 邊下載邊解壓邊寫入, 記憶體只跟 chunk 大小與 ETL_BATCH_SIZE 有關, 跟檔案大小無關
+    lines = iter_s3_gzip_lines(obj["Body"], STREAM_CHUNK_SIZE, STREAM_PREFETCH_CHUNKS)
+    for line_no, line in enumerate(lines, start=1):
+        try:
+            record = loads(line)
+        except ValueError as e:  # json / orjson 的 JSONDecodeError 都是 ValueError
+            if on_malformed is None:
+                raise
+            on_malformed(line_no, line, e)
+            continue
+        yield record
+
+def quarantine_line(line_no: int, line: bytes, error: Exception, s3_key: str):
+    """解析不了的原始行連同行號寫進 etl.quarantine_rows, 修正後可依 s3_path + line_no 找回來源"""
+    raw = line.decode("utf-8", errors="replace")
+    quarantine_row("arxiv_papers", {"line_no": line_no, "raw_line": raw}, error, s3_key)
 
-def load_s3_gzip_to_pg(bucket: str, s3_key: str, etl_stage: str = "initial_load"):
-    obj = s3.get_object(Bucket=bucket, Key=s3_key)
+def add_keywords(batch: list, batch_history: list, keyword_stats: "keywords.DocumentFrequency | None") -> tuple[list, list]:
+    """
+    整批算出關鍵字 (title / summary 的 TF-IDF) 後換掉 tuple 裡的空陣列, history 與主表相同
+    keyword_stats: 這個檔案累加中的 corpus 統計, 檔案完成時才跟 leases.finish 一起寫入
+    corpus 統計讀取失敗時維持空陣列照常寫入, 之後可用 python -m src.etl.keywords --backfill 補上
+    """
+    try:
+        found = keyword_extractor.extract(
+            pg, [r[1] for r in batch], [r[4] for r in batch], keyword_stats, db_slot=db_writer_slots,
+        )
+    except psycopg2.Error as e:
+        logger.warning(f"Keyword extraction skipped for {len(batch)} rows: {str(e).strip()}")
+        return batch, batch_history
+    i, j = PAPER_KEYWORDS_INDEX, HISTORY_KEYWORDS_INDEX
+    batch = [r[:i] + (k,) + r[i + 1:] for r, k in zip(batch, found)]
+    # append 模式每筆 paper 都有對應的 history, 順序相同
+    batch_history = [r[:j] + (k,) + r[j + 1:] for r, k in zip(batch_history, found)]
+    return batch, batch_history
+
+def load_s3_gzip_to_pg(bucket: str, s3_key: str, etl_stage: str = "initial_load",
+                       keyword_stats: "keywords.DocumentFrequency | None" = None):
+    """keyword_stats: 有的話把這個檔案的關鍵字 df 累加進去, 由呼叫端在完成時寫入 (apply_stats)"""
     batch, batch_history = [], []
+    upsert = WRITE_MODE == "upsert"
+    counts = Counter()
+
+    def flush():
+        nonlocal batch, batch_history
+        if keyword_extractor is not None:
+            batch, batch_history = add_keywords(batch, batch_history, keyword_stats)
+        if upsert:
+            counts["quarantined"] += safe_insert(
+                "arxiv_papers",
+                batch,
+                s3_key,
+                write=lambda rows: counts.update(upsert_papers(rows, etl_stage)),
+                columns=UPSERT_COLUMNS,
+            )
+        else:
+            counts["quarantined"] += safe_insert("arxiv_papers", batch, s3_key)
+            counts["quarantined"] += safe_insert("arxiv_papers_history", batch_history, s3_key)
+
+    decoder = RecordDecoder(s3_key, etl_stage, with_history=not upsert, with_hash=upsert)
+    total = 0
 
-    with gzip.GzipFile(fileobj=io.BytesIO(obj["Body"].read()), mode="rb") as f:
-        for line in f:
-            record = json.loads(line.decode("utf-8"))
-            batch.append(parse_record(record, s3_key))
-            batch_history.append(parse_history_record(record, s3_key, "insert", etl_stage))
-            if len(batch) >= ETL_BATCH_SIZE:
-                safe_insert("arxiv_papers", batch)
-                safe_insert("arxiv_papers_history", batch_history)
-                batch, batch_history = [], []
+    def malformed(line_no, line, error):
+        nonlocal total
+        total += 1
+        quarantine_line(line_no, line, error, s3_key)
+        counts["quarantined"] += 1
+
+    for record in iter_s3_records(bucket, s3_key, on_malformed=malformed):
+        total += 1
+        try:
+            paper, history = decoder.decode(record)
+        except RecordError as e:
+            quarantine_row("arxiv_papers", record if isinstance(record, dict) else {"record": record}, e, s3_key)
+            counts["quarantined"] += 1
+            continue
+        batch.append(paper)
+        if history is not None:
+            batch_history.append(history)
+        if len(batch) >= ETL_BATCH_SIZE:
+            flush()
+            batch, batch_history = [], []
 
     if batch:
-        safe_insert("arxiv_papers", batch)
-        safe_insert("arxiv_papers_history", batch_history)
+        flush()
+    if upsert:
+        unchanged = total - counts["insert"] - counts["update"] - counts["quarantined"]
+        logger.info(f"{s3_key}: {counts['insert']} inserted, {counts['update']} updated, {unchanged} unchanged")
+    if counts["quarantined"]:
+        logger.warning(f"{s3_key}: {counts['quarantined']} rows quarantined in etl.quarantine_rows")
     return datetime.now(timezone.utc)
 
-def invoke_next_lambda():
-    """Call Lambda 把剩下的做完"""
-    lambda_client = boto3.client("lambda")
+def dispatch_workers():
+    """依待處理量與最近的處理時間啟動需要的 ETL worker (src.etl.dispatcher)"""
     try:
-        response = lambda_client.invoke(
-            FunctionName=AWS_LAMBDA_FUNCTION_NAME,
-            InvocationType="Event",
-            Payload=json.dumps({"trigger": "auto"}).encode()
-        )
-        logger.info(f"Successfully invoked next Lambda: {response['StatusCode']}")
+        dispatcher.dispatch(pg, boto3.client("lambda"), AWS_LAMBDA_FUNCTION_NAME, cfg.etl)
     except Exception as e:
-        logger.error(f"Failed to invoke next Lambda: {e}", exc_info=True)
+        logger.error(f"Failed to dispatch ETL workers: {e}", exc_info=True)
 
 
 def get_pending_gz_count(pg: PsqlEngine):
-    """取得還沒做完的 GZ 檔案數"""
-    stmt = """
-        SELECT COUNT(*) AS cnt
-        FROM etl.raw_batches
-        WHERE etl_status = 'pending';
-    """
-    result = pg.execute_query(stmt)
-    return result[0].cnt if result else 0
+    """取得還沒做完的 GZ 檔案數 (含 lease 到期、還可以重試的檔案)"""
+    return leases.claimable_count(pg, MAX_ATTEMPTS)
+
+def process_gz(key: str, worker_id: str):
+    """處理單一檔案並更新它自己的狀態, 成功回傳 key, 失敗回傳 None"""
+    logger.info(f"Processing {key}")
+    try:
+        keyword_stats = keywords.DocumentFrequency() if keyword_extractor is not None else None
+        finished_at = load_s3_gzip_to_pg(BUCKET_NAME, key, keyword_stats=keyword_stats)
+        # 關鍵字統計跟完成狀態一起 commit, 失敗重跑的檔案不會重複累加
+        on_finish = (lambda cur: keywords.apply_stats(cur, keyword_stats)) if keyword_stats is not None else None
+        leases.finish(pg, worker_id, key, finished_at, on_finish=on_finish)
+        return key
+    except Exception as e:
+        logger.error(f"Error processing {key}: {e}", exc_info=True)
+        leases.fail(pg, worker_id, key, datetime.now(timezone.utc), str(e), MAX_ATTEMPTS)
+        return None
 
-def run_lambda():
-    processed = []
-    pending_gz = get_pending_gz(pg, PENDING_GZ_BATCH) # 狀態會改為 "processing"
+def run_lambda(event: dict | None = None, context=None):
+    """
+    dispatcher 啟動的 worker 的 event 帶有 worker_id, 先處理事先認領好的檔案
+    context: Lambda context, 有的話做完認領的檔案後, 依剩餘時間一次認領一個繼續做 (耗時以 EWMA 估計),
+             放不下就停止, 沒開始的認領放回 pending 再交給 dispatcher
+    手動 / 排程觸發 (沒有 context) 時自己認領 pending_gz_batch 個
+    """
+    apply_config(get_config())
+    # arxiv_papers_history 依 etl_timestamp 每月一個 partition
+    partitions.ensure_partitions_once(pg, cfg.partitions.months_ahead)
+    event = event or {}
+    worker_id = event.get("worker_id")
+    pending_gz = leases.owned(pg, worker_id) if worker_id else []
+    worker_id = worker_id or leases.new_worker_id()
+    if not pending_gz and context is None:
+        pending_gz = get_pending_gz(pg, PENDING_GZ_BATCH, worker_id) # 狀態會改為 "processing"
     pending_gz = [r.__dict__ if hasattr(r, "__dict__") else dict(r._asdict()) for r in pending_gz]
+    retried = [r['s3_path'] for r in pending_gz if r['attempts'] > 1]
+    if retried:
+        logger.info(f"Retrying {len(retried)} files from expired or failed attempts: {retried}")
+    claimed = deque(r['s3_path'] for r in pending_gz)
+
+    def next_key():
+        if claimed:
+            return claimed.popleft()
+        if context is None:
+            return None
+        rows = get_pending_gz(pg, 1, worker_id)
+        if rows and rows[0].attempts > 1:
+            logger.info(f"Retrying {rows[0].s3_path} (attempt {rows[0].attempts})")
+        return rows[0].s3_path if rows else None
+
+    budget = TimeBudget(context, safety_seconds=cfg.lambda_.time_safety_margin_seconds, estimate=file_seconds)
+    with leases.LeaseHeartbeat(pg, worker_id, LEASE_SECONDS, HEARTBEAT_SECONDS):
+        results = budget.run(next_key, lambda key: process_gz(key, worker_id), concurrency=FILE_CONCURRENCY)
+    processed = [key for _, key in results if key]
+    if claimed:
+        # 時間不夠沒開始的檔案, 放回 pending 讓 dispatcher 交給其他 worker
+        logger.info(f"Time budget reached, release {len(claimed)} claimed files")
+        leases.release(pg, worker_id)
+    if budget.stopped_early:
+        logger.info(f"Time budget reached after {budget.started} files (estimate={file_seconds.value}s per file)")
 
-    for pending_gz_dict in pending_gz:
-        key = pending_gz_dict['s3_path']
-        logger.info(f"Processing {key}")
-        try:
-            finished_at = load_s3_gzip_to_pg(BUCKET_NAME, key)
-            update_etl_status(pg, key, "finished", finished_at=finished_at)
-            processed.append(key)
-        except Exception as e:
-            logger.error(f"Error processing {key}: {e}", exc_info=True)
-            update_etl_status(pg, key, "failed", finished_at=datetime.now(timezone.utc), error_msg=str(e))
     remaining = get_pending_gz_count(pg)
     logger.info(f"剩餘待處理 GZ 數量: {remaining}")
     if remaining > 0:
-        logger.info("還有檔案沒抓取，觸發下一個 Lambda")
-        invoke_next_lambda()
+        logger.info("還有檔案沒處理，依待處理量啟動 ETL worker")
+        dispatch_workers()
     else:
         logger.info("已完成所有檔案")
 
@@ -0,0 +1,112 @@
+"""
+dispatcher.py
+依 etl.raw_batches 的待處理量決定同時要跑幾個 ETL Lambda
+- 待處理檔案數 x 最近每個檔案的平均處理時間 / file_concurrency = 剩餘工作量 (秒)
+- 目標 worker 數 = 剩餘工作量 / dispatch_target_seconds (希望幾秒內做完), 上限為 dispatch_max_workers
+  與 DB 連線預算 (dispatch_db_connections / 每個 worker 的連線數)
+- 扣掉目前還持有 lease 的 worker, 不足的部分先替每個新 worker 認領互不重疊的檔案 (lease_owner = 新 worker id),
+  再以 Event 非同步 invoke, payload 帶 worker_id; 新 worker 直接處理已認領的檔案
+- 每個 worker 結束時都會呼叫 dispatch, 待處理量下降時目標變小, 結束的 worker 不再補上, 自然縮減
+- 同一時間只有一個 dispatcher 做決定 (advisory lock), invoke 失敗的檔案會放回 pending
+"""
+
+import json
+import logging
+import math
+from dataclasses import dataclass
+
+from src.core.config import EtlConfig
+from src.core.pg_engine import PsqlEngine
+from src.etl import leases
+
+# pg_try_advisory_xact_lock 的 key, 任意固定值
+DISPATCH_LOCK_KEY = 7_304_221
+# 沒有最近的處理紀錄時假設每個檔案的處理秒數
+DEFAULT_FILE_SECONDS = 10.0
+
+STATS_STMT = """
+    SELECT
+        (SELECT COUNT(*) FROM etl.raw_batches
+         WHERE (etl_status = 'pending' OR (etl_status = 'processing' AND lease_expires_at < now()))
+           AND attempts < %(max_attempts)s) AS backlog,
+        (SELECT COUNT(DISTINCT lease_owner) FROM etl.raw_batches
+         WHERE etl_status = 'processing' AND lease_expires_at >= now()) AS active_workers,
+        (SELECT EXTRACT(EPOCH FROM avg(etl_finished_at - etl_started_at)) FROM etl.raw_batches
+         WHERE etl_status = 'finished'
+           AND etl_finished_at >= now() - %(window_minutes)s * interval '1 minute') AS avg_file_sec
+"""
+
+
+@dataclass
+class DispatchPlan:
+    backlog: int
+    active_workers: int
+    avg_file_sec: float
+    target_workers: int
+    launch: int
+    claim_size: int
+
+
+def worker_connections(conf: EtlConfig) -> int:
+    """每個 ETL worker 的連線池大小 (寫入連線 + 狀態更新一條), 同 arxiv_etl.apply_config"""
+    return (conf.db_writers or conf.file_concurrency) + 1
+
+
+def plan(backlog: int, active_workers: int, avg_file_sec: float | None, conf: EtlConfig) -> DispatchPlan:
+    """純計算, 不碰 DB: 回傳目標 worker 數、要新開幾個與每個新 worker 認領的檔案數"""
+    avg_file_sec = avg_file_sec or DEFAULT_FILE_SECONDS
+    ceiling = max(1, min(conf.dispatch_max_workers, conf.dispatch_db_connections // worker_connections(conf)))
+    target = 0
+    if backlog > 0:
+        work_sec = backlog * avg_file_sec / conf.file_concurrency
+        target = min(ceiling, max(1, math.ceil(work_sec / conf.dispatch_target_seconds)))
+    launch = max(0, target - active_workers)
+    # 待處理的檔案平均分給新 worker, 每個最多 pending_gz_batch 個
+    claim_size = min(conf.pending_gz_batch, math.ceil(backlog / launch)) if launch else 0
+    return DispatchPlan(backlog, active_workers, round(avg_file_sec, 3), target, launch, claim_size)
+
+
+def dispatch(pg: PsqlEngine, lambda_client, function_name: str, conf: EtlConfig) -> DispatchPlan | None:
+    """
+    計算並啟動需要的 ETL worker, 回傳這次的 DispatchPlan
+    其他 dispatcher 正在執行時直接跳過 (回傳 None)
+    """
+    assignments = []
+    with pg.transaction() as cur:
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (DISPATCH_LOCK_KEY,))
+        if not cur.fetchone().locked:
+            logging.info("Another dispatcher is running, skip")
+            return None
+        cur.execute(STATS_STMT, {"max_attempts": conf.max_attempts, "window_minutes": conf.dispatch_window_minutes})
+        stats = cur.fetchone()
+        avg_file_sec = float(stats.avg_file_sec) if stats.avg_file_sec else None
+        result = plan(stats.backlog, stats.active_workers, avg_file_sec, conf)
+        # 在同一個 transaction 裡替每個新 worker 認領, 檔案不會重疊, 也會被算進之後的 active_workers
+        for _ in range(result.launch):
+            worker_id = leases.new_worker_id()
+            cur.execute(leases.CLAIM_STMT, {
+                "worker_id": worker_id, "num": result.claim_size,
+                "lease_seconds": conf.lease_seconds, "max_attempts": conf.max_attempts,
+            })
+            claimed = len(cur.fetchall())
+            if not claimed:
+                break
+            assignments.append((worker_id, claimed))
+
+    logging.info(
+        f"Dispatch: backlog={result.backlog}, active={result.active_workers}, avg_file_sec={result.avg_file_sec}, "
+        f"target={result.target_workers}, launch={len(assignments)} x {result.claim_size} files"
+    )
+    for worker_id, claimed in assignments:
+        try:
+            lambda_client.invoke(
+                FunctionName=function_name,
+                InvocationType="Event",
+                Payload=json.dumps({"trigger": "dispatch", "worker_id": worker_id, "claimed": claimed}).encode(),
+            )
+        except Exception as e:
+            logging.error(f"Failed to invoke ETL worker {worker_id}: {e}")
+            # 放回 pending; 這裡也失敗的話 lease 到期後會被其他 worker 重新認領
+            leases.release(pg, worker_id)
+    result.launch = len(assignments)
+    return result
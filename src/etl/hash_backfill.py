@@ -0,0 +1,78 @@
+"""
+hash_backfill.py
+替 content_hash 為 NULL 的既有文章 (migration 003 之前寫入的) 補上 content_hash
+- etl.write_mode 改成 upsert 之前先執行一次, 否則第一次重新載入會把每篇既有文章都視為變動, 全部更新 (version + 1) 並寫一份 history
+- hash 由主表欄位還原 raw record 的值後計算, 與 RecordDecoder 的結果相同 (published / updated 轉回 UTC 的 isoformat)
+- 依 entry_id 的 keyset 分批, 可以中斷後重跑 (只處理仍為 NULL 的)
+
+python -m src.etl.hash_backfill --batch-size 5000
+"""
+
+import argparse
+import json
+import logging
+import time
+from datetime import datetime, timezone
+
+import psycopg2.extras
+
+from src.core.pg_engine import PsqlEngine
+from src.etl.record_decoder import HASH_FIELDS, _hash_digest
+
+SELECT_STMT = f"""
+    SELECT entry_id, {", ".join(HASH_FIELDS)} FROM arxiv_papers
+    WHERE entry_id > %s AND content_hash IS NULL
+    ORDER BY entry_id LIMIT %s
+"""
+UPDATE_HASH_STMT = """
+    UPDATE arxiv_papers AS p SET content_hash = v.content_hash
+    FROM (VALUES %s) AS v (entry_id, content_hash)
+    WHERE p.entry_id = v.entry_id AND p.content_hash IS NULL
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def _raw_value(value):
+    """DB 的 timestamptz 轉回 collector 寫進 raw jsonl 的字串 (arxiv.Result 的 UTC datetime.isoformat())"""
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).isoformat()
+    return value
+
+
+def row_hash(row: tuple) -> str:
+    """row: (entry_id, *HASH_FIELDS), 與 content_hash(record) 相同"""
+    return _hash_digest([_raw_value(v) for v in row[1:]])
+
+
+def backfill(pg: PsqlEngine, batch_size: int) -> dict:
+    start = time.monotonic()
+    updated, last = 0, ""
+    while True:
+        with pg.transaction(cursor_factory=None) as cur:
+            cur.execute(SELECT_STMT, (last, batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            psycopg2.extras.execute_values(
+                cur, UPDATE_HASH_STMT, [(r[0], row_hash(r)) for r in rows], page_size=len(rows),
+            )
+            updated += cur.rowcount
+        last = rows[-1][0]
+        logger.info(f"Backfilled content_hash for {updated} papers")
+    return {"updated": updated, "seconds": round(time.monotonic() - start, 1)}
+
+
+def main():
+    from src.core.db import get_pg
+
+    parser = argparse.ArgumentParser(description="Backfill arxiv_papers.content_hash before enabling upsert mode")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    print(json.dumps(backfill(get_pg(), args.batch_size), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+keywords.py
+ETL 的關鍵字擷取: 每個寫入批次一次算完 title / summary 的 TF-IDF, 取分數最高的 top_k 個字填進 arxiv_papers.keywords
+- 整批文字接成一個字串只做一次 regex 斷字, 之後都是 NumPy 陣列運算: (文章, 字) 的稀疏詞頻矩陣以 COO 陣列表示,
+  詞頻、document frequency、分數與每篇的 top_k 都是整批一起算, 沒有逐筆文章的 Python 迴圈
+- IDF 用整個 corpus 的統計 (migration 010): etl.keyword_df 每個字出現在幾篇文章, etl.keyword_corpus 總文章數
+- 批次只讀取統計, 這個檔案的 df 在記憶體累加 (DocumentFrequency), 計分時加上還沒寫入的部分;
+  檔案完成時由 apply_stats 一次寫入, 跟 leases.finish 同一個 transaction, 失敗重跑的檔案不會重複累加
+- upsert 模式重新載入 (內容沒變) 的文章仍會再算一次, df 與總文章數一起變大, 影響不大;
+  需要精確值時用 --backfill 從 arxiv_papers 整個重算
+- 回填既有文章: python -m src.etl.keywords --backfill (重算 IDF 後填入 keywords 為空的文章, --all 全部重算)
+  只更新 arxiv_papers, history 不回填
+- 速度比較: python -m src.utils.benchmark.bench_keywords --records 20000
+
+extractor = KeywordExtractor(top_k=8)
+stats = DocumentFrequency()
+keywords = extractor.extract(pg, titles, summaries, stats)   # [[...], ...] 與輸入同順序
+leases.finish(pg, worker_id, s3_key, finished_at, on_finish=lambda cur: apply_stats(cur, stats))
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import psycopg2.extras
+
+from src.core.config import KeywordsConfig
+from src.core.pg_engine import PsqlEngine
+
+# arXiv Atom feed 是 XML 1.0, 文字裡不會出現 \x01, 拿來當文章之間的分隔
+DOC_SEP = "\x01"
+# 英文字母開頭、至少 3 個字元的字 (可含數字與連字號, 如 state-of-the-art / gpt-4)
+# 斷字在 UTF-8 bytes 上做: 比 str 的 regex 快, 之後的 NumPy bytes 陣列 (S dtype) 排序也比 unicode 陣列快;
+# 長度有上限, 讓陣列的寬度不會被少數超長的字撐大 (超長的字被切開後多半只出現一次, 會被 min_df 濾掉)
+TOKEN_RE = re.compile(rb"[a-z][a-z0-9]{2,29}(?:-[a-z0-9]{1,15}){0,3}|\x01")
+
+# 英文停用字 + 論文摘要的套語 + 常見的 LaTeX 指令
+STOPWORDS = frozenset("""
+    about above across after again against all almost along also although always among amongst and another any
+    are around because been before being below between both but can cannot could did does doing done down during
+    each either else enough even ever every few for from further had has have having her here hers herself him
+    himself his how however into its itself just least less many may might more most much must neither nor not
+    now off often once one only onto other others otherwise our ours ourselves out over own per perhaps rather
+    same several she should since some such than that the their theirs them themselves then there thereby
+    therefore these they this those though through throughout thus together too toward towards under until upon
+    use used uses using very via was were what whatever when where whereas whether which while who whom whose
+    why will with within without would yet you your yours yourself
+    able abstract achieve achieved achieves address addresses aim algorithm algorithms analysis
+    approach approaches based benchmark benchmarks better case cases compared comparison consider considered
+    data demonstrate demonstrated demonstrates describe described different discuss effective effectiveness
+    efficient evaluate evaluated evaluation example existing experiment experimental experiments extensive find
+    findings first focus framework general given good high important improve improved improves
+    improvement including introduce introduced key known large largely lead leads learn make makes method methods
+    model models new novel number obtain obtained paper particular performance present presented previous problem
+    problems propose proposed proposes provide provided provides recent related respectively result results second
+    set setting show showed shown shows significant significantly similar simple small source state study studies
+    task tasks technique techniques terms three two type types understanding well work works
+    cdot emph frac infty ldots left mathbb mathbf mathcal mathrm operatorname right sqrt textbf textit
+""".split())
+_STOPWORDS = np.array(sorted(w.encode() for w in STOPWORDS), dtype=bytes)
+
+DF_ADD_STMT = """
+    INSERT INTO etl.keyword_df AS k (term, df) VALUES %s
+    ON CONFLICT (term) DO UPDATE SET df = k.df + EXCLUDED.df
+"""
+CORPUS_ADD_STMT = """
+    UPDATE etl.keyword_corpus SET num_docs = num_docs + %s, updated_at = now()
+"""
+UPDATE_KEYWORDS_STMT = """
+    UPDATE arxiv_papers AS p SET keywords = v.keywords
+    FROM (VALUES %s) AS v (entry_id, keywords)
+    WHERE p.entry_id = v.entry_id
+"""
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TermMatrix:
+    """整批文章的稀疏詞頻矩陣 (COO): 第 i 個非零值是文章 doc[i] 裡字 terms[term[i]] 的加權詞頻 tf[i]"""
+    terms: np.ndarray   # 批次內出現的字, 已排序
+    doc: np.ndarray     # 依 (doc, term) 排序
+    term: np.ndarray
+    tf: np.ndarray
+    num_docs: int
+
+    def document_frequency(self) -> np.ndarray:
+        """每個字出現在幾篇文章 (每個 (doc, term) 只有一個非零值)"""
+        return np.bincount(self.term, minlength=len(self.terms))
+
+
+def tokenize(texts: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """整批文字一次斷字, 回傳 (字 (bytes 陣列), 所屬文章的 index)"""
+    tokens = np.array(TOKEN_RE.findall(DOC_SEP.join(texts).lower().encode("utf-8")), dtype=bytes)
+    sep = tokens == DOC_SEP.encode()
+    return tokens[~sep], np.cumsum(sep)[~sep]
+
+
+def term_matrix(titles: list[str], summaries: list[str], title_weight: float = 2.0) -> TermMatrix:
+    """title 的字詞頻乘上 title_weight, 與 summary 合併成一個矩陣"""
+    title_tokens, title_doc = tokenize(titles)
+    summary_tokens, summary_doc = tokenize(summaries)
+    tokens = np.concatenate([title_tokens, summary_tokens])
+    doc = np.concatenate([title_doc, summary_doc]).astype(np.int64)
+    weight = np.concatenate([np.full(len(title_tokens), title_weight), np.ones(len(summary_tokens))])
+    terms, term = np.unique(tokens, return_inverse=True)
+    # 停用字只要在不重複的字裡找, 再把剩下的字重新編號
+    content = ~np.isin(terms, _STOPWORDS)
+    keep = content[term]
+    terms, term = terms[content].astype(str), (np.cumsum(content) - 1)[term[keep]]
+    doc, weight = doc[keep], weight[keep]
+    if not len(terms):
+        empty = np.array([], dtype=np.int64)
+        return TermMatrix(terms, empty, empty, np.array([], dtype=float), len(titles))
+    # (doc, term) 編成一個整數, 相同的加總就是詞頻
+    pairs, inverse = np.unique(doc * len(terms) + term, return_inverse=True)
+    tf = np.bincount(inverse, weights=weight)
+    return TermMatrix(terms, pairs // len(terms), pairs % len(terms), tf, len(titles))
+
+
+def top_keywords(m: TermMatrix, df: np.ndarray, num_docs: int, top_k: int, min_df: int = 2) -> list[list[str]]:
+    """
+    df: corpus 裡每個 m.terms 出現的文章數 (對齊 m.terms), num_docs: corpus 總文章數
+    分數 = (1 + log tf) * (log((1 + N) / (1 + df)) + 1), 只在 corpus 出現少於 min_df 篇的字 (多半是拼字 / 公式碎片) 不列入
+    """
+    idf = np.log((1 + num_docs) / (1 + df)) + 1
+    score = (1 + np.log(m.tf)) * idf[m.term]
+    ok = df[m.term] >= min_df
+    doc, term, score = m.doc[ok], m.term[ok], score[ok]
+    # 依文章、分數由高到低排序, 每篇文章內的名次 = 位置 - 該文章的起點
+    # 輸入已依 (doc, term) 排序且 lexsort 是 stable sort, 同分時依字母, 結果固定
+    order = np.lexsort((-score, doc))
+    doc, term = doc[order], term[order]
+    rank = np.arange(len(doc)) - np.searchsorted(doc, doc)
+    keep = rank < top_k
+    words = m.terms[term[keep]].tolist()
+    bounds = np.searchsorted(doc[keep], np.arange(m.num_docs + 1)).tolist()
+    return [words[lo:hi] for lo, hi in zip(bounds, bounds[1:])]
+
+
+def _align(terms: np.ndarray, found_terms: list[str], found_df: list[int]) -> np.ndarray:
+    """DB 回傳的 (term, df) 依 terms 的順序排好, 沒有的為 0"""
+    df = np.zeros(len(terms), dtype=np.int64)
+    if found_terms:
+        df[np.searchsorted(terms, np.array(found_terms, dtype=str))] = found_df
+    return df
+
+
+class DocumentFrequency:
+    """多個批次的 document frequency 在記憶體合併 (terms 已排序, df 與其對齊), 一個檔案或一次重算共用一個"""
+
+    def __init__(self):
+        self.terms = np.array([], dtype=str)
+        self.df = np.array([], dtype=np.int64)
+        self.num_docs = 0
+
+    def add(self, m: TermMatrix) -> None:
+        self.terms, inverse = np.unique(np.concatenate([self.terms, m.terms]), return_inverse=True)
+        self.df = np.bincount(inverse, weights=np.concatenate([self.df, m.document_frequency()])).astype(np.int64)
+        self.num_docs += m.num_docs
+
+    def lookup(self, terms: np.ndarray) -> np.ndarray:
+        """已排序的 terms 各自累加了多少篇, 沒有的為 0"""
+        if not len(self.terms):
+            return np.zeros(len(terms), dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.terms, terms), len(self.terms) - 1)
+        return np.where(self.terms[pos] == terms, self.df[pos], 0)
+
+
+def apply_stats(cur, stats: DocumentFrequency) -> bool:
+    """
+    把累加的 df 與文章數寫進 corpus 統計, 在呼叫端的 transaction 裡執行 (ETL 是 leases.finish 的 on_finish)
+    terms 已排序, 所有 worker 依相同順序鎖 keyword_df 的列, 不會互相 deadlock; 單列的 keyword_corpus 最後才更新
+    寫入失敗時退回 savepoint 並回傳 False, 同一個 transaction 的其他更新照常 commit
+    """
+    if not stats.num_docs:
+        return True
+    cur.execute("SAVEPOINT keyword_stats")
+    try:
+        psycopg2.extras.execute_values(
+            cur, DF_ADD_STMT, list(zip(stats.terms.tolist(), stats.df.tolist())), page_size=10000,
+        )
+        cur.execute(CORPUS_ADD_STMT, (stats.num_docs,))
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT keyword_stats")
+        logger.warning(f"Keyword statistics skipped for {stats.num_docs} papers: {str(e).strip()}")
+        return False
+    cur.execute("RELEASE SAVEPOINT keyword_stats")
+    return True
+
+
+def load_stats(pg: PsqlEngine, terms: np.ndarray) -> tuple[np.ndarray, int]:
+    """只讀取 corpus 統計 (backfill 用, 文章已經算進統計裡)"""
+    with pg.transaction(cursor_factory=None) as cur:
+        cur.execute("SELECT term, df FROM etl.keyword_df WHERE term = ANY(%s)", (terms.tolist(),))
+        rows = cur.fetchall()
+        cur.execute("SELECT num_docs FROM etl.keyword_corpus")
+        num_docs = cur.fetchone()[0]
+    return _align(terms, [r[0] for r in rows], [r[1] for r in rows]), num_docs
+
+
+class KeywordExtractor:
+    def __init__(self, top_k: int = 8, title_weight: float = 2.0, min_df: int = 2):
+        self.top_k = top_k
+        self.title_weight = title_weight
+        self.min_df = min_df
+
+    @classmethod
+    def from_config(cls, conf: KeywordsConfig) -> "KeywordExtractor":
+        return cls(top_k=conf.top_k, title_weight=conf.title_weight, min_df=conf.min_df)
+
+    def extract(self, pg: PsqlEngine, titles: list[str], summaries: list[str],
+                stats: DocumentFrequency | None = None, db_slot=None) -> list[list[str]]:
+        """
+        回傳每篇文章的關鍵字 (分數由高到低), 與輸入同順序
+        stats: ETL 新寫入的文章, 這一批先累加進去, IDF 用 DB 的統計加上 stats (還沒寫入 DB 的部分);
+               None 時只讀取 DB 的統計 (backfill, 文章已經算進統計裡)
+        db_slot: 存取 DB 時要持有的 semaphore (ETL 的 db_writer_slots), 斷字與計分不佔用
+        """
+        m = term_matrix(titles, summaries, self.title_weight)
+        if stats is not None:
+            stats.add(m)
+        if not len(m.terms):
+            return [[] for _ in range(m.num_docs)]
+        with db_slot or contextlib.nullcontext():
+            df, num_docs = load_stats(pg, m.terms)
+        if stats is not None:
+            df, num_docs = df + stats.lookup(m.terms), num_docs + stats.num_docs
+        return top_keywords(m, df, num_docs, self.top_k, self.min_df)
+
+
+# -------------------------------
+# Backfill
+# -------------------------------
+def iter_papers(pg: PsqlEngine, batch_size: int, only_missing: bool = False):
+    """依 entry_id 的 keyset 分批讀 (entry_id, title, summary)"""
+    where = "AND coalesce(cardinality(keywords), 0) = 0" if only_missing else ""
+    last = ""
+    while True:
+        with pg.transaction(cursor_factory=None) as cur:
+            cur.execute(
+                f"SELECT entry_id, coalesce(title, ''), coalesce(summary, '') FROM arxiv_papers "
+                f"WHERE entry_id > %s {where} ORDER BY entry_id LIMIT %s",
+                (last, batch_size),
+            )
+            rows = cur.fetchall()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+def rebuild_stats(pg: PsqlEngine, extractor: KeywordExtractor, batch_size: int) -> int:
+    """
+    從 arxiv_papers 重算 document frequency, 在記憶體合併後一次取代 etl.keyword_df / keyword_corpus
+    執行期間 ETL 累加的統計會被覆蓋, 建議在 ETL 沒有執行時跑
+    """
+    stats = DocumentFrequency()
+    for rows in iter_papers(pg, batch_size):
+        stats.add(term_matrix([r[1] for r in rows], [r[2] for r in rows], extractor.title_weight))
+    with pg.transaction(cursor_factory=None) as cur:
+        cur.execute("TRUNCATE etl.keyword_df")
+        pg.copy_rows(cur, "etl.keyword_df", zip(stats.terms.tolist(), stats.df.tolist()), ["term", "df"])
+        cur.execute("UPDATE etl.keyword_corpus SET num_docs = %s, updated_at = now()", (stats.num_docs,))
+    logger.info(f"Rebuilt keyword statistics: {len(stats.terms)} terms over {stats.num_docs} papers")
+    return stats.num_docs
+
+
+def backfill(pg: PsqlEngine, extractor: KeywordExtractor, batch_size: int, all_papers: bool = False,
+             rebuild: bool = True) -> dict:
+    """重算 corpus 統計後, 替 keywords 為空的文章 (all_papers 時全部) 填入關鍵字"""
+    start = time.monotonic()
+    num_docs = rebuild_stats(pg, extractor, batch_size) if rebuild else None
+    updated = 0
+    for rows in iter_papers(pg, batch_size, only_missing=not all_papers):
+        found = extractor.extract(pg, [r[1] for r in rows], [r[2] for r in rows])
+        with pg.transaction(cursor_factory=None) as cur:
+            psycopg2.extras.execute_values(
+                cur, UPDATE_KEYWORDS_STMT, list(zip((r[0] for r in rows), found)),
+                template="(%s, %s::text[])", page_size=len(rows),
+            )
+        updated += len(rows)
+        logger.info(f"Backfilled keywords for {updated} papers")
+    return {"corpus_docs": num_docs, "updated": updated, "seconds": round(time.monotonic() - start, 1)}
+
+
+def main():
+    from src.core.config_loader import get_config
+    from src.core.db import get_pg
+
+    parser = argparse.ArgumentParser(description="Backfill arxiv_papers.keywords with TF-IDF keywords")
+    parser.add_argument("--backfill", action="store_true", help="重算 IDF 並填入 keywords 為空的文章")
+    parser.add_argument("--all", action="store_true", help="連已經有 keywords 的文章也重算")
+    parser.add_argument("--keep-stats", action="store_true", help="不重算 IDF, 沿用目前的 etl.keyword_df")
+    parser.add_argument("--batch-size", type=int, help="覆蓋 config 的 keywords.backfill_batch_size")
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.error("nothing to do, use --backfill")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    conf = get_config().keywords
+    result = backfill(
+        get_pg(), KeywordExtractor.from_config(conf), args.batch_size or conf.backfill_batch_size,
+        all_papers=args.all, rebuild=not args.keep_stats,
+    )
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+leases.py
+etl.raw_batches 的 lease 認領 (migration 006)
+- claim: 認領 pending 或 lease 已到期的檔案, 記錄 worker id 與到期時間, attempts + 1
+- LeaseHeartbeat: 背景 thread 定期延長這個 worker 所有執行中檔案的 lease
+- finish / fail: 只更新自己還持有 lease 的檔案; 失敗時 attempts 未達上限放回 pending, 否則標成 failed
+- lease 到期且 attempts 已達上限的檔案, 下一次 claim 時標成 failed
+- finish 成功時送出 NOTIFY FINISHED_CHANNEL (payload 為 s3_path), 查詢 API 收到後清空 response cache;
+  檔案層級的彙總 (關鍵字 corpus 統計) 透過 on_finish 跟完成狀態在同一個 transaction commit
+Lambda timeout 或 crash 留下的 processing 檔案不需要手動處理, 整體為 at-least-once
+"""
+
+import logging
+import os
+import threading
+import uuid
+
+from src.core.pg_engine import PsqlEngine
+
+CLAIM_STMT = """
+    WITH exhausted AS (
+        UPDATE etl.raw_batches
+        SET etl_status = 'failed',
+            etl_finished_at = now(),
+            error_msg = coalesce(error_msg, 'lease expired') || ' (gave up after ' || attempts || ' attempts)',
+            lease_owner = NULL,
+            lease_expires_at = NULL
+        WHERE etl_status = 'processing'
+          AND lease_expires_at < now()
+          AND attempts >= %(max_attempts)s
+    )
+    UPDATE etl.raw_batches
+    SET etl_status = 'processing',
+        etl_started_at = now(),
+        lease_owner = %(worker_id)s,
+        lease_expires_at = now() + %(lease_seconds)s * interval '1 second',
+        attempts = attempts + 1
+    WHERE batch_id IN (
+        SELECT batch_id
+        FROM etl.raw_batches
+        WHERE (etl_status = 'pending' OR (etl_status = 'processing' AND lease_expires_at < now()))
+          AND attempts < %(max_attempts)s
+        ORDER BY batch_id
+        FOR UPDATE SKIP LOCKED
+        LIMIT %(num)s
+    )
+    RETURNING s3_path, category, attempts;
+"""
+
+# 檔案寫入完成的通知 channel (src.api.papers 會 LISTEN)
+FINISHED_CHANNEL = "etl_batch_finished"
+
+CLAIMABLE_COUNT_STMT = """
+    SELECT COUNT(*) AS cnt
+    FROM etl.raw_batches
+    WHERE (etl_status = 'pending' OR (etl_status = 'processing' AND lease_expires_at < now()))
+      AND attempts < %s;
+"""
+
+
+def new_worker_id() -> str:
+    """每次執行一個 id: Lambda 名稱 + 隨機字串, 方便從 lease_owner 追到是哪個 Lambda"""
+    return f"{os.getenv('AWS_LAMBDA_FUNCTION_NAME', 'local')}-{uuid.uuid4().hex[:12]}"
+
+
+def claim(pg: PsqlEngine, worker_id: str, num: int, lease_seconds: int, max_attempts: int) -> list:
+    params = {"worker_id": worker_id, "num": num, "lease_seconds": lease_seconds, "max_attempts": max_attempts}
+    return pg.execute_query(CLAIM_STMT, params=params)
+
+
+def owned(pg: PsqlEngine, worker_id: str) -> list:
+    """dispatcher 事先替這個 worker 認領的檔案"""
+    return pg.execute_query(
+        """
+        SELECT s3_path, category, attempts
+        FROM etl.raw_batches
+        WHERE lease_owner = %s AND etl_status = 'processing'
+        ORDER BY batch_id;
+        """,
+        params=(worker_id,),
+    )
+
+
+def claimable_count(pg: PsqlEngine, max_attempts: int) -> int:
+    """還沒做完且可以被認領的檔案數 (pending + lease 到期且還能重試)"""
+    row = pg.execute_query(CLAIMABLE_COUNT_STMT, first=True, params=(max_attempts,))
+    return row.cnt if row else 0
+
+
+def finish(pg: PsqlEngine, worker_id: str, s3_path: str, finished_at, on_finish=None) -> bool:
+    """
+    NOTIFY 在 commit 後才送出, 只有真的由這個 worker 完成時才通知
+    on_finish(cur): 檔案完成時要一起 commit 的更新 (例如關鍵字的 corpus 統計), 只在仍持有 lease 時執行,
+    lease 已被其他 worker 接手或重跑的檔案不會重複套用
+    回傳是否由這個 worker 完成; 寫入失敗往外拋
+    """
+    with pg.transaction(cursor_factory=None) as cur:
+        cur.execute(
+            """
+            UPDATE etl.raw_batches
+            SET etl_status = 'finished', etl_finished_at = %s, error_msg = NULL,
+                lease_owner = NULL, lease_expires_at = NULL
+            WHERE s3_path = %s AND lease_owner = %s
+            RETURNING s3_path
+            """,
+            (finished_at, s3_path, worker_id),
+        )
+        if cur.fetchone() is None:
+            logging.warning(f"{s3_path}: lease is no longer held by {worker_id}, skip finish")
+            return False
+        if on_finish is not None:
+            on_finish(cur)
+        cur.execute("SELECT pg_notify(%s, %s)", (FINISHED_CHANNEL, s3_path))
+    return True
+
+
+def fail(pg: PsqlEngine, worker_id: str, s3_path: str, finished_at, error_msg: str, max_attempts: int) -> None:
+    """attempts 未達上限就放回 pending 讓之後的 worker 重試"""
+    pg.execute_cmd(
+        """
+        UPDATE etl.raw_batches
+        SET etl_status = CASE WHEN attempts < %s THEN 'pending' ELSE 'failed' END,
+            etl_finished_at = %s, error_msg = %s,
+            lease_owner = NULL, lease_expires_at = NULL
+        WHERE s3_path = %s AND lease_owner = %s;
+        """,
+        (max_attempts, finished_at, error_msg, s3_path, worker_id),
+    )
+
+
+def release(pg: PsqlEngine, worker_id: str) -> None:
+    """放掉還沒開始處理的認領 (例如 invoke worker 失敗), 不算一次嘗試"""
+    pg.execute_cmd(
+        """
+        UPDATE etl.raw_batches
+        SET etl_status = 'pending', attempts = greatest(attempts - 1, 0),
+            lease_owner = NULL, lease_expires_at = NULL
+        WHERE lease_owner = %s AND etl_status = 'processing';
+        """,
+        (worker_id,),
+    )
+
+
+class LeaseHeartbeat:
+    """
+    with LeaseHeartbeat(pg, worker_id, lease_seconds, interval):
+        ... 處理檔案 ...
+    每 interval 秒把這個 worker 仍在 processing 的 lease 延長到 now() + lease_seconds
+    """
+
+    def __init__(self, pg: PsqlEngine, worker_id: str, lease_seconds: int, interval: float):
+        self.pg = pg
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.interval = interval
+        self.beats = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="etl-lease-heartbeat", daemon=True)
+
+    def extend(self) -> int:
+        rows = self.pg.execute_query(
+            """
+            UPDATE etl.raw_batches
+            SET lease_expires_at = now() + %s * interval '1 second'
+            WHERE lease_owner = %s AND etl_status = 'processing'
+            RETURNING s3_path;
+            """,
+            params=(self.lease_seconds, self.worker_id),
+        )
+        self.beats += 1
+        return len(rows)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.extend()
+            except Exception as e:
+                # 下一次再試; 一直失敗的話 lease 會到期, 由其他 worker 重做
+                logging.warning(f"Failed to extend ETL leases for {self.worker_id}: {e}")
+
+    def __enter__(self) -> "LeaseHeartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,322 @@
+"""
+parquet_compaction.py
+把 raw/<category>/<date>/ 底下大量 100 筆一個的 jsonl.gz, 合併成較大的 Parquet 檔
+- 輸出為 Hive 分區: compacted/category=<category>/published_month=<YYYY-MM>/part-<date>-<NNNN>.parquet
+  檔名只由 (date, 分區內序號) 決定, 中斷後或 --force 重跑會覆蓋同一批 key, 多出來的舊檔案會刪掉, 不會重複讀到
+- 每個 (category, date) 寫一份 manifest, 記錄合併了哪些 raw key 與輸出的 Parquet key, 已有 manifest 就跳過
+- raw 檔案不會刪除, Lambda 上的 ETL 仍然讀 raw jsonl.gz (Parquet 不會登記到 etl.raw_batches)
+- 重新載入 (schema 變更、補資料) 用 --reload: 依 manifest 直接讀合併後的 Parquet 跑 ETL 的 upsert 流程, 不用再開大量 raw 小檔案
+- ad-hoc 分析: open_dataset() 或 iter_parquet_records() 讀單一檔案
+- pyarrow 不在 Lambda layer 裡, 在本機或其他有裝 pyarrow 的環境執行
+
+python -m src.etl.parquet_compaction --category cs.AI --date 2025-01-01
+python -m src.etl.parquet_compaction --min-age-days 1   # 所有至少一天前的 raw 分區
+python -m src.etl.parquet_compaction --reload --category cs.AI --date 2025-01-01   # 不給分區就重新載入所有 manifest
+"""
+
+import argparse
+import io
+import json
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterator
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError as e:
+    raise ImportError("src.etl.parquet_compaction requires pyarrow, which is not shipped in the Lambda layer") from e
+
+from src.core.config import CompactionConfig
+from src.etl.s3_stream import iter_s3_gzip_lines
+
+# jsonl 欄位 + 來源 raw key; category / published_month 放在分區路徑裡
+SCHEMA = pa.schema([
+    ("entry_id", pa.string()),
+    ("title", pa.string()),
+    ("authors", pa.list_(pa.string())),
+    ("summary", pa.string()),
+    ("primary_category", pa.string()),
+    ("categories", pa.list_(pa.string())),
+    ("published", pa.timestamp("us", tz="UTC")),
+    ("updated", pa.timestamp("us", tz="UTC")),
+    ("journal_ref", pa.string()),
+    ("doi", pa.string()),
+    ("source_key", pa.string()),
+])
+
+TIMESTAMP_FIELDS = ("published", "updated")
+
+
+def raw_prefix(category: str, day: str, raw_root: str = "raw/") -> str:
+    return f"{raw_root}{category.replace('.', '_')}/{day}/"
+
+
+def manifest_key(conf: CompactionConfig, category: str, day: str) -> str:
+    return f"{conf.prefix}_manifests/category={category}/{day}.json"
+
+
+def list_keys(s3, bucket: str, prefix: str) -> list[str]:
+    keys = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
+    return keys
+
+
+def _to_row(record: dict, source_key: str) -> dict:
+    row = {name: record.get(name) for name in SCHEMA.names}
+    for field in TIMESTAMP_FIELDS:
+        if row[field]:
+            row[field] = datetime.fromisoformat(row[field])
+    row["source_key"] = source_key
+    return row
+
+
+class _PartitionWriter:
+    """單一 published_month 分區, 累積到 row_group_size 寫一個 row group, 滿 max_records_per_file 換檔"""
+
+    def __init__(self, s3, bucket: str, conf: CompactionConfig, category: str, month: str, day: str):
+        self.s3 = s3
+        self.bucket = bucket
+        self.conf = conf
+        self.base = f"{conf.prefix}category={category}/published_month={month}/"
+        self.day = day
+        self.rows: list[dict] = []
+        self.file_rows = 0
+        self.seq = 0
+        self.sink = None
+        self.writer = None
+        self.outputs: list[dict] = []
+
+    def add(self, row: dict) -> None:
+        self.rows.append(row)
+        if len(self.rows) >= self.conf.row_group_size:
+            self._write_group()
+
+    def _write_group(self) -> None:
+        if not self.rows:
+            return
+        if self.writer is None:
+            self.sink = io.BytesIO()
+            self.writer = pq.ParquetWriter(self.sink, SCHEMA, compression=self.conf.compression)
+        self.writer.write_table(pa.Table.from_pylist(self.rows, schema=SCHEMA))
+        self.file_rows += len(self.rows)
+        self.rows = []
+        if self.file_rows >= self.conf.max_records_per_file:
+            self._close_file()
+
+    def _close_file(self) -> None:
+        if self.writer is None:
+            return
+        self.writer.close()
+        key = f"{self.base}part-{self.day}-{self.seq:04d}.parquet"
+        self.seq += 1
+        body = self.sink.getvalue()
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType="application/vnd.apache.parquet")
+        self.outputs.append({"key": key, "records": self.file_rows, "bytes": len(body)})
+        self.writer, self.sink, self.file_rows = None, None, 0
+
+    def close(self) -> list[dict]:
+        self._write_group()
+        self._close_file()
+        return self.outputs
+
+
+def delete_stale_outputs(s3, bucket: str, conf: CompactionConfig, category: str, day: str, keep: set[str]) -> int:
+    """
+    刪掉同一個 (category, date) 之前留下、這次沒有覆蓋到的 Parquet 檔
+    (中斷的執行沒有 manifest, 所以直接依檔名找, 不靠舊 manifest)
+    """
+    marker = f"/part-{day}-"
+    stale = [k for k in list_keys(s3, bucket, f"{conf.prefix}category={category}/") if marker in k and k not in keep]
+    for i in range(0, len(stale), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={"Objects": [{"Key": k} for k in stale[i:i + 1000]], "Quiet": True})
+    return len(stale)
+
+
+def compact_partition(s3, bucket: str, conf: CompactionConfig, category: str, day: str, force: bool = False) -> dict | None:
+    """
+    合併一個 (category, date) 的 raw 分區, 回傳 manifest
+    已經有 manifest (且不是 force) 或沒有 raw 檔案時回傳 None
+    """
+    m_key = manifest_key(conf, category, day)
+    if not force and list_keys(s3, bucket, m_key):
+        logging.info(f"{category} {day}: already compacted, skip")
+        return None
+    source_keys = sorted(k for k in list_keys(s3, bucket, raw_prefix(category, day)) if k.endswith(".jsonl.gz"))
+    if not source_keys:
+        return None
+
+    writers: dict[str, _PartitionWriter] = {}
+    records = 0
+    for key in source_keys:
+        body = s3.get_object(Bucket=bucket, Key=key)["Body"]
+        for line in iter_s3_gzip_lines(body):
+            row = _to_row(json.loads(line), key)
+            month = row["published"].strftime("%Y-%m") if row["published"] else "unknown"
+            if month not in writers:
+                writers[month] = _PartitionWriter(s3, bucket, conf, category, month, day)
+            writers[month].add(row)
+            records += 1
+
+    outputs = [out for w in writers.values() for out in w.close()]
+    removed = delete_stale_outputs(s3, bucket, conf, category, day, {out["key"] for out in outputs})
+    manifest = {
+        "category": category,
+        "date": day,
+        "compacted_at": datetime.now(timezone.utc).isoformat(),
+        "records": records,
+        "source_keys": source_keys,
+        "outputs": outputs,
+    }
+    # manifest 最後才寫, 中途失敗下次會整個分區重做
+    s3.put_object(Bucket=bucket, Key=m_key, Body=json.dumps(manifest, ensure_ascii=False).encode("utf-8"),
+                  ContentType="application/json")
+    logging.info(
+        f"{category} {day}: {len(source_keys)} raw files, {records} records -> {len(outputs)} parquet files"
+        + (f" ({removed} stale files removed)" if removed else "")
+    )
+    return manifest
+
+
+def list_raw_partitions(s3, bucket: str, raw_root: str = "raw/") -> Iterator[tuple[str, str]]:
+    """列出所有 raw 分區 (category 目錄名稱, date)"""
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=raw_root, Delimiter="/"):
+        for cat_prefix in page.get("CommonPrefixes", []):
+            cat_dir = cat_prefix["Prefix"][len(raw_root):].rstrip("/")
+            for sub in paginator.paginate(Bucket=bucket, Prefix=cat_prefix["Prefix"], Delimiter="/"):
+                for day_prefix in sub.get("CommonPrefixes", []):
+                    yield cat_dir, day_prefix["Prefix"].rstrip("/").rsplit("/", 1)[-1]
+
+
+def compact_ready_partitions(s3, bucket: str, conf: CompactionConfig, categories: list[str]) -> list[dict]:
+    """
+    合併所有至少 min_age_days 天前的 raw 分區 (當天還會有新檔案進來, 不合併)
+    raw 目錄名稱把 "." 換成 "_", 用 config 裡的領域清單換回來
+    """
+    names = {c.replace(".", "_"): c for c in categories}
+    cutoff = date.today() - timedelta(days=conf.min_age_days)
+    manifests = []
+    for cat_dir, day in list_raw_partitions(s3, bucket):
+        try:
+            if date.fromisoformat(day) > cutoff:
+                continue
+        except ValueError:
+            continue
+        manifest = compact_partition(s3, bucket, conf, names.get(cat_dir, cat_dir), day)
+        if manifest:
+            manifests.append(manifest)
+    return manifests
+
+
+# -------------------------------
+# 讀取
+# -------------------------------
+def iter_parquet_records(s3, bucket: str, key: str, batch_size: int = 10000) -> Iterator[dict]:
+    """
+    讀單一個合併後的 Parquet, 回傳跟 raw jsonl 相同格式的 dict (時間欄位為 ISO 字串)
+    Parquet 的 footer 在檔尾, 所以整個檔案先讀進記憶體, 再依 row group 分批轉成 dict
+    """
+    body = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    for batch in pq.ParquetFile(io.BytesIO(body)).iter_batches(batch_size=batch_size):
+        for row in batch.to_pylist():
+            for field in TIMESTAMP_FIELDS:
+                if row[field] is not None:
+                    row[field] = row[field].isoformat()
+            yield row
+
+
+def read_manifest(s3, bucket: str, key: str) -> dict:
+    return json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+
+
+def reload_partition(s3, bucket: str, conf: CompactionConfig, category: str, day: str) -> dict | None:
+    """
+    把一個 (category, date) 合併後的 Parquet 重新載入 PG, 沒有 manifest 回傳 None
+    走 ETL 同一套解碼 / 隔離 / 寫入 (arxiv_etl.load_s3_gzip_to_pg, etl_stage="reload"), 需先 apply_config
+    只允許 upsert 模式: 內容沒變的文章不會寫入, append 模式則會替每篇已載入的文章再寫一份 history
+    """
+    from src.etl import arxiv_etl
+
+    if arxiv_etl.WRITE_MODE != "upsert":
+        raise ValueError("reload requires etl.write_mode: upsert (run python -m src.etl.hash_backfill first)")
+    m_key = manifest_key(conf, category, day)
+    if not list_keys(s3, bucket, m_key):
+        logging.info(f"{category} {day}: no manifest, compact it first")
+        return None
+    manifest = read_manifest(s3, bucket, m_key)
+    for out in manifest["outputs"]:
+        arxiv_etl.load_s3_gzip_to_pg(bucket, out["key"], etl_stage="reload")
+    logging.info(f"{category} {day}: reloaded {manifest['records']} records from {len(manifest['outputs'])} parquet files")
+    return {"category": category, "date": day, "records": manifest["records"], "files": len(manifest["outputs"])}
+
+
+def list_manifests(s3, bucket: str, conf: CompactionConfig) -> Iterator[tuple[str, str]]:
+    """列出所有已合併的 (category, date), 由 manifest key (_manifests/category=<category>/<date>.json) 解析"""
+    prefix = f"{conf.prefix}_manifests/category="
+    for key in list_keys(s3, bucket, prefix):
+        category, name = key[len(prefix):].split("/", 1)
+        yield category, name.removesuffix(".json")
+
+
+def open_dataset(bucket: str, conf: CompactionConfig, region: str | None = None):
+    """
+    ad-hoc 分析用, 回傳 pyarrow.dataset, 依分區過濾只會讀需要的檔案
+    (_manifests/ 以底線開頭, pyarrow 預設會略過)
+    ds = open_dataset("arvix-paper-bucket", cfg.compaction)
+    df = ds.to_table(filter=(pc.field("category") == "cs.AI") & (pc.field("published_month") == "2025-01")).to_pandas()
+    """
+    import pyarrow.dataset as pds
+    from pyarrow import fs
+
+    partitioning = pds.partitioning(
+        pa.schema([("category", pa.string()), ("published_month", pa.string())]), flavor="hive"
+    )
+    return pds.dataset(
+        f"{bucket}/{conf.prefix}",
+        format="parquet",
+        partitioning=partitioning,
+        filesystem=fs.S3FileSystem(region=region),
+    )
+
+
+def main():
+    import boto3
+    from src.core.config_loader import get_config
+
+    parser = argparse.ArgumentParser(description="Compact raw jsonl.gz batches into Parquet")
+    parser.add_argument("--category", help="領域 (例如 cs.AI), 搭配 --date 只合併一個分區")
+    parser.add_argument("--date", help="raw 分區日期 YYYY-MM-DD")
+    parser.add_argument("--min-age-days", type=int, help="覆蓋 config 的 compaction.min_age_days")
+    parser.add_argument("--force", action="store_true", help="已有 manifest 也重新合併")
+    parser.add_argument("--reload", action="store_true", help="不合併, 把已合併的 Parquet 重新載入 PG (etl.write_mode 需為 upsert)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    cfg = get_config()
+    conf = cfg.compaction
+    if args.min_age_days is not None:
+        conf = conf.model_copy(update={"min_age_days": args.min_age_days})
+    s3 = boto3.client("s3")
+    bucket = cfg.aws.s3_bucket
+    if args.reload:
+        from src.etl import arxiv_etl
+
+        arxiv_etl.apply_config(cfg)
+        partitions = [(args.category, args.date)] if args.category and args.date else list_manifests(s3, bucket, conf)
+        results = [reload_partition(s3, bucket, conf, cat, day) for cat, day in partitions]
+        results = [r for r in results if r]
+        print(json.dumps({"partitions": len(results), "records": sum(r["records"] for r in results)}))
+        return
+    if args.category and args.date:
+        manifests = [compact_partition(s3, bucket, conf, args.category, args.date, force=args.force)]
+    else:
+        categories = [c for sub in cfg.categories.values() for c in sub]
+        manifests = compact_ready_partitions(s3, bucket, conf, categories)
+    manifests = [m for m in manifests if m]
+    print(json.dumps({"partitions": len(manifests), "records": sum(m["records"] for m in manifests)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+s3_stream.py
+直接從 S3 StreamingBody 邊下載邊解壓邊切行, 不把整個檔案讀進記憶體
+背景 thread 負責讀取網路資料 (bounded queue), 主 thread 同時解壓 / 解析 / 寫 DB
+"""
+
+import queue
+import threading
+import time
+import zlib
+from typing import Iterator
+
+from src.core import metrics
+
+_EOF = object()
+
+
+def iter_prefetched_chunks(body, chunk_size: int, prefetch: int) -> Iterator[bytes]:
+    """
+    背景 thread 以 chunk_size 讀 body, 最多先讀 prefetch 個 chunk
+    讀取端發生的例外會在 consumer 端重新拋出
+    """
+    q: queue.Queue = queue.Queue(maxsize=max(prefetch, 1))
+    stop = threading.Event()
+
+    def _put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _reader():
+        try:
+            while not stop.is_set():
+                chunk = body.read(chunk_size)
+                if not chunk:
+                    break
+                if not _put(chunk):
+                    return
+            _put(_EOF)
+        except BaseException as e:  # 交給 consumer 處理
+            _put(e)
+
+    t = threading.Thread(target=_reader, name="s3-prefetch", daemon=True)
+    t.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _EOF:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # consumer 提前結束 (例外或 break) 時讓 reader 停下來
+        stop.set()
+        close = getattr(body, "close", None)
+        if close:
+            close()
+
+
+def iter_gzip_lines(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """增量 gunzip 並切成行 (支援多個 gzip member 串接), 空行略過"""
+    decomp = zlib.decompressobj(wbits=31)
+    in_member = False
+    pending = b""
+    decompress_sec = 0.0
+    for chunk in chunks:
+        while chunk:
+            in_member = True
+            start = time.perf_counter()
+            data = decomp.decompress(chunk)
+            decompress_sec += time.perf_counter() - start
+            if decomp.eof:
+                chunk = decomp.unused_data
+                decomp = zlib.decompressobj(wbits=31)
+                in_member = False
+            else:
+                chunk = b""
+            if not data:
+                continue
+            lines = (pending + data).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield line
+    metrics.GZIP_SECONDS.labels("decompress").observe(decompress_sec)
+    if in_member:
+        raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+    if pending.strip():
+        yield pending
+
+
+def iter_s3_gzip_lines(body, chunk_size: int = 256 * 1024, prefetch: int = 4) -> Iterator[bytes]:
+    """S3 get_object()["Body"] -> 解壓後的每一行 (bytes)"""
+    return iter_gzip_lines(iter_prefetched_chunks(body, chunk_size, prefetch))
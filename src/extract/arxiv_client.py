@@ -0,0 +1,35 @@
+"""
+arxiv_client.py
+共用 rate limiter 的 arxiv.Client
+- arxiv.Client 的 delay_seconds 只管自己這個 instance, 多個領域同時抓時會超過 arXiv 對單一 IP 的限制
+- 每次打 API (含 retry) 前都先向共用的 TokenBucket 拿 token, 自己的 delay 設為 0
+- 每個領域用自己的 instance (requests.Session 不保證 thread-safe), 順便記錄頁數與等待時間
+"""
+
+import time
+
+import arxiv
+
+from src.core import metrics
+from src.core.rate_limit import TokenBucket
+
+
+class RateLimitedClient(arxiv.Client):
+    def __init__(self, limiter: TokenBucket, page_size: int = 100, num_retries: int = 3):
+        super().__init__(page_size=page_size, delay_seconds=0, num_retries=num_retries)
+        self.limiter = limiter
+        self.pages_fetched = 0
+        self.rate_wait_sec = 0.0
+
+    def _parse_feed(self, url: str, first_page: bool = True, _try_index: int = 0):
+        # retry 會遞迴呼叫 _parse_feed, 每次請求都會經過這裡
+        self.rate_wait_sec += self.limiter.acquire()
+        self.pages_fetched += 1
+        if _try_index:
+            return super()._parse_feed(url, first_page=first_page, _try_index=_try_index)
+        # 第一次請求才計時, 包含之後的 retry
+        start = time.perf_counter()
+        try:
+            return super()._parse_feed(url, first_page=first_page, _try_index=_try_index)
+        finally:
+            metrics.ARXIV_PAGE_SECONDS.observe(time.perf_counter() - start)
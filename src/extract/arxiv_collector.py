@@ -1,52 +1,89 @@
-import arxiv
 import json
 import time
 import logging
 import os
-import gzip
-import io
-import boto3
-import yaml
+from itertools import islice
 from datetime import datetime, timezone
+from functools import partial
+from psycopg2.extras import execute_values
+from src.core.config import PipelineConfig
+from src.core import metrics, partitions
+from src.core.config_loader import get_config
 from src.core.db import get_pg
-
-pg = get_pg()
+from src.core.rate_limit import TokenBucket
+from src.core.time_budget import Ewma, TimeBudget
+from src.core.startup import LazyModule, lazy_resource
+from src.extract import checkpoint
+from src.extract.batch_pipeline import BatchPipeline
+from src.extract.dedup_index import DedupIndex, SetIndex
+from src.extract.s3_writer import GzipJsonlWriter
+
+# 較重的套件第一次用到才 import, 縮短 cold start
+arxiv = LazyModule("arxiv")
+arxiv_client = LazyModule("src.extract.arxiv_client")
+boto3 = LazyModule("boto3")
 
 logging.getLogger("boto3").setLevel(logging.WARNING)
 logging.getLogger("botocore").setLevel(logging.WARNING)
 logging.getLogger("arxiv").setLevel(logging.WARNING)
 
-s3 = boto3.client("s3")
-
-def load_config():
-    bucket_name = "arvix-paper-bucket"
-    key = "config/config.yaml"
-    local_path = "/tmp/config.yaml"
+@lazy_resource("s3 client")
+def get_s3():
+    return metrics.instrument_s3(boto3.client("s3"))
 
-    try:
-        s3.download_file(bucket_name, key, local_path)
-        with open(local_path, "r") as f:
-            config = yaml.safe_load(f)
-        return config
-    except Exception as e:
-        logging.error(f"Failed to load config from S3: {e}")
-        raise
+# 以下都在 apply_config (run_lambda 開始時) 才建立
+cfg: PipelineConfig = None
+pg = None
+rate_limiter: TokenBucket = None
+# 每個領域的耗時估計, warm start 沿用
+category_seconds: Ewma = None
+# 去重一次確認幾筆 API 結果 (Bloom filter 可能存在的用一個查詢到 DB 確認)
+DEDUP_CHUNK_SIZE = 100
 
-cfg = load_config()
-    
-MAX_RESULTS_GOAL = cfg["source_papers"]["max_results_goal"]
-BATCH_SIZE = cfg["source_papers"]["batch_size"]
-S3_BUCKET = cfg["aws"]["s3_bucket"]
-AWS_LAMBDA_FUNCTION_NAME = cfg["lambda"]["AWS_LAMBDA_FUNCTION_COLLECT"]
-MAX_ATTEMPTS = cfg["source_papers"]["s3_max_attempts"]
-INITIAL_DELAY_SECONDS = cfg["source_papers"]["initial_delay_seconds"]
-LOOKBACK_MONTHS = cfg["source_papers"]["lookback_months"]
-
-client = arxiv.Client(
-    page_size=MAX_RESULTS_GOAL, 
-    delay_seconds=3,
-    num_retries=3
-)
+def apply_config(conf: PipelineConfig):
+    """
+    把設定套用到 module 變數, 每次 run_lambda 開始時都會呼叫
+    warm Lambda 也能拿到 S3 上最新的 config (ETag 沒變就不會重新下載)
+    """
+    global cfg, pg, rate_limiter, category_seconds, MAX_RESULTS_GOAL, BATCH_SIZE, S3_BUCKET, AWS_LAMBDA_FUNCTION_NAME
+    global MAX_ATTEMPTS, INITIAL_DELAY_SECONDS, LOOKBACK_MONTHS
+    global DEDUP_MODE, DEDUP_CAPACITY, DEDUP_ERROR_RATE, DEDUP_S3_KEY
+    global MULTIPART_THRESHOLD, MULTIPART_PART_SIZE, GZIP_LEVEL, COLLECT_MODE
+    global COLLECT_CONCURRENCY, UPLOAD_WORKERS, UPLOAD_QUEUE_SIZE, COLLECT_MAX_ATTEMPTS
+    if conf is cfg:
+        return
+    cfg = conf
+    source = conf.source_papers
+    MAX_RESULTS_GOAL = source.max_results_goal
+    BATCH_SIZE = source.batch_size
+    S3_BUCKET = conf.aws.s3_bucket
+    AWS_LAMBDA_FUNCTION_NAME = conf.lambda_.AWS_LAMBDA_FUNCTION_COLLECT
+    MAX_ATTEMPTS = source.s3_max_attempts
+    INITIAL_DELAY_SECONDS = source.initial_delay_seconds
+    LOOKBACK_MONTHS = source.lookback_months
+    # set: 載入最近 LOOKBACK_MONTHS 的 entry_id, bloom: S3 上的 Bloom filter 涵蓋全部歷史
+    DEDUP_MODE = source.dedup_mode
+    DEDUP_CAPACITY = source.dedup_capacity
+    DEDUP_ERROR_RATE = source.dedup_error_rate
+    DEDUP_S3_KEY = source.dedup_s3_key
+    # 壓縮後超過 threshold 改用 multipart upload, batch_size 可以開大產生較少較大的檔案
+    MULTIPART_THRESHOLD = source.multipart_threshold_mb * 1024 * 1024
+    MULTIPART_PART_SIZE = source.multipart_part_size_mb * 1024 * 1024
+    GZIP_LEVEL = source.gzip_level
+    # full: 每次抓最新 MAX_RESULTS_GOAL 筆, incremental: 只抓各領域 watermark 之後更新的文章
+    COLLECT_MODE = source.collect_mode
+    # 同時抓幾個領域, 所有請求共用一個 token bucket, 整體仍是每 request_interval_seconds 秒一次
+    COLLECT_CONCURRENCY = source.collect_concurrency
+    # 寫滿的 batch 交給背景 worker 上傳 / 寫 PG, queue 滿了才讓抓取等待
+    UPLOAD_WORKERS = source.upload_workers
+    UPLOAD_QUEUE_SIZE = source.upload_queue_size
+    # 領域失敗時保留 checkpoint 下次繼續, 連續失敗這麼多次才標成 Failed 不再排入
+    COLLECT_MAX_ATTEMPTS = source.collect_max_attempts
+
+    pg = get_pg()
+    rate_limiter = TokenBucket.per_interval(source.request_interval_seconds, source.request_burst)
+    if category_seconds is None or category_seconds.alpha != conf.lambda_.time_estimate_alpha:
+        category_seconds = Ewma(conf.lambda_.time_estimate_alpha)
 
 pg_batch = []
 
@@ -56,7 +93,7 @@ pg_batch = []
 def flatten_categories(cfg):
     """所有領域的 list"""
     cats = []
-    for _, sub in cfg["categories"].items():
+    for _, sub in cfg.categories.items():
         cats.extend(sub)
     return cats
 
@@ -82,27 +119,56 @@ def insert_new_categories(new_cats):
     if not new_cats:
         return
     values = [(cat, '') for cat in new_cats]
-    pg.insert_mogrify("papers.category_progress", values)
+    try:
+        pg.insert_mogrify("papers.category_progress", values)
+    except Exception as e:
+        logging.error(f"Failed to insert new categories: {e}")
 
 def get_pending_categories():
-    """取得還沒做完的領域"""
-    stmt = "SELECT category_name FROM papers.category_progress WHERE status != 'Finished'"
+    """取得還沒做完的領域 (Failed 是失敗次數已達上限, 需手動把 status 清空 ('' 或 NULL) 才會重試)"""
+    stmt = "SELECT category_name FROM papers.category_progress WHERE coalesce(status, '') NOT IN ('Finished', 'Failed')"
     rows = pg.execute_query(stmt)
     return [r[0] for r in rows]
 
-def mark_category_finished(category):
-    """完成一個領域後更新狀態"""
-    stmt = """
-        UPDATE papers.category_progress
-        SET status = 'Finished', updated_at = NOW()
-        WHERE category_name = %s
+def get_category_watermark(category):
+    """取得領域的 high-water mark (已看過最新的 updated 時間), 沒有則回傳 None"""
+    stmt = "SELECT last_updated FROM papers.category_progress WHERE category_name = %s"
+    row = pg.execute_query(stmt, first=True, params=(category,))
+    return row.last_updated if row else None
+
+def build_search(category, watermark=None, until=None):
+    """
+    full: 依投稿時間由新到舊抓 MAX_RESULTS_GOAL 筆
+    incremental: 依最後更新時間由新到舊, 有 watermark 時只查 watermark 到 until 的區間
+    (新投稿的 updated 等於 published, 所以新版本與新文章都會被抓到)
+    有 watermark 時不限筆數, 一路抓到 watermark 為止, 否則超過 MAX_RESULTS_GOAL 的舊更新會永遠漏掉
+    (沒有 watermark 的第一次執行仍只抓最新 MAX_RESULTS_GOAL 筆)
+    從 checkpoint 繼續時沿用上一次的 until, 結果的順序才不會因為新文章而位移
     """
-    pg.execute_cmd(stmt, (category,))
-  
+    if COLLECT_MODE != "incremental":
+        return arxiv.Search(
+            query=f'cat:{category}',
+            max_results=MAX_RESULTS_GOAL,
+            sort_by=arxiv.SortCriterion.SubmittedDate,
+            sort_order=arxiv.SortOrder.Descending
+        )
+    query = f'cat:{category}'
+    if watermark:
+        # arXiv 日期查詢精度到分鐘, 邊界重疊的部分靠 watermark 比較與去重排除
+        start = watermark.astimezone(timezone.utc).strftime("%Y%m%d%H%M")
+        end = (until or datetime.now(timezone.utc)).astimezone(timezone.utc).strftime("%Y%m%d%H%M")
+        query += f' AND lastUpdatedDate:[{start} TO {end}]'
+    return arxiv.Search(
+        query=query,
+        max_results=None if watermark else MAX_RESULTS_GOAL,
+        sort_by=arxiv.SortCriterion.LastUpdatedDate,
+        sort_order=arxiv.SortOrder.Descending
+    )
+
 def insert_category_stats(category_stats):
     """
     將 category_stats 批次寫入 papers.category_run_stats
-    使用 insert_mogrify
+    使用 insert_mogrify, 每個領域只留最近一次的統計
     """
     if not category_stats:
         return
@@ -115,16 +181,36 @@ def insert_category_stats(category_stats):
             stats["time_sec"],
             stats["s3_count"],
             stats["pg_count"],
-            utc_now
+            utc_now,
+            stats["api_requests"],
+            stats["records_per_sec"],
+            stats["rate_wait_sec"],
+            stats["concurrency"],
         ))
 
-    pg.insert_mogrify("papers.category_run_stats", values)
+    try:
+        pg.insert_mogrify(
+            "papers.category_run_stats",
+            values,
+            on_conflict="""ON CONFLICT (category_name) DO UPDATE SET
+                time_sec = EXCLUDED.time_sec,
+                s3_count = EXCLUDED.s3_count,
+                pg_count = EXCLUDED.pg_count,
+                updated_at = EXCLUDED.updated_at,
+                api_requests = EXCLUDED.api_requests,
+                records_per_sec = EXCLUDED.records_per_sec,
+                rate_wait_sec = EXCLUDED.rate_wait_sec,
+                concurrency = EXCLUDED.concurrency""",
+        )
+    except Exception as e:
+        logging.error(f"Failed to insert category stats: {e}")
     
-def load_existing_ids(months: int = LOOKBACK_MONTHS):
+def load_existing_ids(months: int | None = None):
     """
     只抓最近 N 個月內的 entry_id, 防 lambda 記憶體不足
     預設 6 個月, 在 config.yaml 裡面有設
     """
+    months = months or LOOKBACK_MONTHS
     stmt = f"""
         SELECT entry_id
         FROM papers.downloaded_papers
@@ -133,65 +219,104 @@ def load_existing_ids(months: int = LOOKBACK_MONTHS):
     rows = pg.execute_query(stmt)
     return set(r[0] for r in rows)
 
+def load_dedup_index():
+    """
+    依 dedup_mode 回傳去重用的容器, 兩者都是 thread-safe 的 claim_new() / discard()
+    bloom 模式不受 lookback_months 限制
+    """
+    if DEDUP_MODE == "bloom":
+        return DedupIndex(pg, get_s3(), S3_BUCKET, DEDUP_S3_KEY, DEDUP_CAPACITY, DEDUP_ERROR_RATE).load()
+    return SetIndex(load_existing_ids())
+
 
 def add_to_pg_batch(pg_batch, entry_id, category, status, etl_status, etl_batch_id=None, error_msg=""):
     now_utc = datetime.now(timezone.utc)
     pg_batch.append((entry_id, category, status, now_utc, error_msg, etl_status, etl_batch_id))
 
 
-def flush_pg_batch(pg_batch):
-    if not pg_batch:
-        return
-    try:
-        pg.insert_mogrify("papers.downloaded_papers", pg_batch)
-    except Exception as e:
-        logging.error(f"Failed to insert batch into Postgres: {e}")
-    finally:
-        pg_batch = []
-        
-def add_raw_batches_to_pg(batch_id, category, s3_path, record_count, ):
-    stmt = """
-        INSERT INTO etl.raw_batches (batch_id, category, s3_path, record_count)
-        VALUES (%s, %s, %s, %s)
-        ON CONFLICT (batch_id) DO NOTHING;
+def forget_entries(existing_ids, entries):
     """
-    try:
-        pg.execute_cmd(stmt, (batch_id, category, s3_path, record_count))
-    except Exception as e:
-        logging.error(f"Failed to insert into raw_batches: {e}")
+    沒寫進 PG 的 entry_id 從去重集合移除, 下一次從 checkpoint 繼續時才會重新抓
+    entries: pg_batch 的 row (第一欄是 entry_id) 或 entry_id
+    """
+    for entry in entries:
+        existing_ids.discard(entry if isinstance(entry, str) else entry[0])
 
-def upload_batch_to_s3(s3_prefix, batch_data, batch_num, category):
-    if not batch_data:
-        return
-    jsonl_content = "\n".join([json.dumps(paper, ensure_ascii=False) for paper in batch_data])
-    buffer = io.BytesIO()
-    with gzip.GzipFile(fileobj=buffer, mode='wb') as f:
-        f.write(jsonl_content.encode('utf-8'))
-    gzip_bytes = buffer.getvalue()
-    
+def new_batch_writer(s3_prefix, batch_num, category):
+    """開一個串流寫入 S3 的 batch, key 在開始寫入時決定"""
     utc_now = datetime.now(timezone.utc)
     today_str = utc_now.strftime("%Y-%m-%d")
     utc_timestamp = int(utc_now.timestamp())
     s3_key = f"{s3_prefix}{today_str}/{category.replace('.','_')}_batch_{batch_num}_{utc_timestamp}.jsonl.gz"
-    
-    last_exception = None
-    for attempt in range(MAX_ATTEMPTS):
-        try:
-            s3.put_object(
-                Bucket=S3_BUCKET,
-                Key=s3_key,
-                Body=gzip_bytes,
-                ContentType='application/json',
-                ContentEncoding='gzip'
+    return GzipJsonlWriter(
+        get_s3(),
+        S3_BUCKET,
+        s3_key,
+        multipart_threshold=MULTIPART_THRESHOLD,
+        part_size=MULTIPART_PART_SIZE,
+        compress_level=GZIP_LEVEL,
+        max_attempts=MAX_ATTEMPTS,
+        initial_delay=INITIAL_DELAY_SECONDS,
+    )
+
+def claim_downloaded(cur, pg_batch):
+    """
+    downloaded_papers 的 PK 含 partition key (last_attempt), ON CONFLICT 擋不住同一個 entry_id 重複寫入
+    先登記到不分區的 papers.downloaded_entries (migration 011), 只回傳第一次出現的 entry_id 的 row
+    """
+    if not pg_batch:
+        return pg_batch
+    cur.execute(
+        """
+        INSERT INTO papers.downloaded_entries (entry_id, first_seen)
+        SELECT entry_id, first_seen FROM unnest(%s::varchar[], %s::timestamptz[]) AS t(entry_id, first_seen)
+        ON CONFLICT (entry_id) DO NOTHING
+        RETURNING entry_id
+        """,
+        ([r[0] for r in pg_batch], [r[3] for r in pg_batch]),
+    )
+    claimed = {r[0] for r in cur.fetchall()}
+    rows = []
+    for r in pg_batch:
+        if r[0] in claimed:
+            claimed.discard(r[0])
+            rows.append(r)
+    return rows
+
+def finish_batch(writer, pg_batch, etl_batch_id, category, ckpt, tracker):
+    """
+    完成 S3 上傳, 再以同一個 transaction 寫入 raw_batches、downloaded_papers 與領域的 checkpoint, 回傳上傳筆數
+    寫入失敗會往外拋, 由 BatchPipeline 讓整個領域失敗 (checkpoint 停在前一個完成的 batch)
+    """
+    now_s3_key = writer.close()
+    for i in range(len(pg_batch)):
+        pg_batch[i] = (pg_batch[i][0], pg_batch[i][1], "uploaded", pg_batch[i][3], pg_batch[i][4], pg_batch[i][5], pg_batch[i][6])
+    start = time.perf_counter()
+    with tracker.lock:
+        latest = tracker.advance_to(ckpt)
+        with pg.transaction() as cur:
+            cur.execute(
+                """
+                INSERT INTO etl.raw_batches (batch_id, category, s3_path, record_count)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (batch_id) DO NOTHING;
+                """,
+                (etl_batch_id, category, now_s3_key, len(writer)),
             )
-            break
-        except Exception as e:
-            last_exception = e
-            if attempt < MAX_ATTEMPTS - 1:
-                time.sleep(INITIAL_DELAY_SECONDS * (2 ** attempt))
-            else:
-                raise last_exception
-    return s3_key
+            pg_batch = claim_downloaded(cur, pg_batch)
+            if pg_batch:
+                execute_values(cur, "INSERT INTO papers.downloaded_papers VALUES %s", pg_batch)
+            if latest is not None:
+                checkpoint.save(cur, category, latest)
+        tracker.record(ckpt)
+    metrics.record_rows("papers.downloaded_papers", len(pg_batch), time.perf_counter() - start)
+    return len(writer)
+
+def discard_batch(writer, pg_batch, etl_batch_id, category, ckpt, tracker, existing_ids=None):
+    """pipeline 失敗後沒處理到的 batch, 不寫 PG, 只清掉 S3 上未完成的上傳"""
+    writer.abort()
+    if existing_ids is not None:
+        forget_entries(existing_ids, pg_batch)
 
 def invoke_next_lambda():
     """Call Lambda 把剩下的做完"""
@@ -208,12 +333,169 @@ def invoke_next_lambda():
         logging.error(f"Failed to invoke next Lambda: {e}")
         
         
-def run_lambda():
+def to_paper_data(paper_result):
+    """arxiv.Result 轉成寫進 S3 jsonl 的 dict"""
+    return {
+        "entry_id": paper_result.entry_id,
+        "title": paper_result.title,
+        "authors": [a.name for a in paper_result.authors],
+        "summary": paper_result.summary,
+        "primary_category": paper_result.primary_category,
+        "categories": paper_result.categories,
+        "published": paper_result.published.isoformat(),
+        "updated": paper_result.updated.isoformat(),
+        "journal_ref": paper_result.journal_ref,
+        "doi": paper_result.doi
+    }
+
+def iter_chunks(results, size):
+    """API 結果每 size 筆一組, 去重時整組一次確認"""
+    while True:
+        chunk = list(islice(results, size))
+        if not chunk:
+            return
+        yield chunk
+
+def collect_category(category, existing_ids, concurrency, budget=None):
+    """
+    抓一個領域並串流寫入 S3, 回傳統計資料 (失敗時回傳 None)
+    有上一次留下的 checkpoint 就從該 offset / batch 編號繼續
+    成功才推進 watermark 並標成 Finished; 失敗保留 checkpoint, 連續失敗 COLLECT_MAX_ATTEMPTS 次才標成 Failed
+    Lambda 剩餘時間進入安全餘量 (budget.exhausted) 時寫完目前的 batch 就暫停, 留下 checkpoint 給下一個 Lambda
+    """
+    start_time = time.time()
+    client = arxiv_client.RateLimitedClient(rate_limiter, page_size=MAX_RESULTS_GOAL, num_retries=3)
+    s3_count = 0
+    pg_count = 0
+    writer = None
+    pg_batch = []
+    uploader = None
+    stats = None
+    paused = False
+    # 這一組已登記為新的、但還沒放進 batch 的 id, 暫停或失敗時放回去, 下次從 checkpoint 繼續時才會重新抓
+    unprocessed = set()
+    try:
+        S3_PREFIX = f"raw/{category.replace('.','_')}/"
+        watermark = get_category_watermark(category) if COLLECT_MODE == "incremental" else None
+        resume = checkpoint.load(pg, category)
+        if resume is None:
+            resume = checkpoint.Checkpoint(until=datetime.now(timezone.utc))
+            logging.info(f"{category}: Started (watermark={watermark})")
+        else:
+            logging.info(
+                f"{category}: Resumed from checkpoint offset={resume.offset}, batch={resume.batch} (watermark={watermark})"
+            )
+        search = build_search(category, watermark, resume.until)
+        tracker = checkpoint.CheckpointTracker(resume)
+        newest_published = resume.newest_published
+        newest_updated = resume.newest_updated
+        # incremental 模式同一天會跑很多次, batch_id 要帶時間才不會跟前一次撞到
+        # (從 checkpoint 繼續時 batch 編號接續, 但 run_stamp 是新的, 不會撞到上次已寫入的 batch)
+        run_stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+        batch_count = resume.batch
+        # 已處理到的 API 結果位置 (含重複而略過的), checkpoint 記錄這個值
+        offset = resume.offset
+        uploader = BatchPipeline(
+            finish_batch,
+            workers=UPLOAD_WORKERS,
+            max_pending=UPLOAD_QUEUE_SIZE,
+            discard=partial(discard_batch, existing_ids=existing_ids),
+            name=category,
+        )
+        while True:
+            try:
+                stop = False
+                for chunk in iter_chunks(client.results(search, offset=offset), DEDUP_CHUNK_SIZE):
+                    if watermark:
+                        # 依 updated 由新到舊排序, watermark 之後都是看過的區間
+                        seen = next((i for i, r in enumerate(chunk) if r.updated <= watermark), None)
+                        if seen is not None:
+                            chunk, stop = chunk[:seen], True
+                    new_ids = set(existing_ids.claim_new(r.entry_id for r in chunk))
+                    unprocessed = set(new_ids)
+                    for paper_result in chunk:
+                        if budget is not None and budget.exhausted():
+                            paused = stop = True
+                            break
+                        offset += 1
+                        newest_published = max(filter(None, (newest_published, paper_result.published)))
+                        newest_updated = max(filter(None, (newest_updated, paper_result.updated)))
+                        entry_id = paper_result.entry_id
+                        if entry_id not in new_ids:
+                            continue
+                        unprocessed.discard(entry_id)
+                        paper_data = to_paper_data(paper_result)
+                        if writer is None:
+                            writer = new_batch_writer(S3_PREFIX, batch_count, category)
+                        # 直接序列化進 gzip 串流, 不在記憶體保留整批 record
+                        writer.write(paper_data)
+                        etl_batch_id = f"{category.replace('.','_')}_{run_stamp}_batch_{batch_count}"
+
+                        add_to_pg_batch(pg_batch, entry_id, category, "pending", "pending", etl_batch_id)
+                        pg_count += 1
+                        if len(writer) >= BATCH_SIZE:
+                            # 交給背景 worker 上傳至 S3 並記錄到 PG, 這裡繼續抓下一筆
+                            batch_count += 1
+                            ckpt = checkpoint.Checkpoint(offset, batch_count, resume.until, newest_published, newest_updated)
+                            uploader.submit(writer, pg_batch, etl_batch_id, category, ckpt, tracker)
+                            writer = None
+                            pg_batch = []
+                    if stop:
+                        break
+                break
+            except arxiv.UnexpectedEmptyPageError as e:
+                logging.error(f"Error fetching results at offset {offset}, ignore..., detail: {e}")
+                offset += 1
+                continue
+        forget_entries(existing_ids, unprocessed)
+        if writer is not None:
+            batch_count += 1
+            ckpt = checkpoint.Checkpoint(offset, batch_count, resume.until, newest_published, newest_updated)
+            uploader.submit(writer, pg_batch, etl_batch_id, category, ckpt, tracker)
+            writer = None
+            pg_batch = []
+            logging.info(etl_batch_id)
+        # 全部 batch 都寫入成功才推進 watermark
+        s3_count = sum(uploader.close())
+        if uploader.blocked_sec >= 1:
+            logging.info(f"{category}: waited {uploader.blocked_sec:.1f}s for background uploads")
+        if paused:
+            logging.info(f"{category} -> Paused at offset {offset} (Lambda time budget), resume from checkpoint")
+        else:
+            checkpoint.complete(pg, category, newest_published, newest_updated)
+            logging.info(f"{category} -> Finished")
+        elapsed = time.time() - start_time
+        stats = {
+            "time_sec": elapsed,
+            "s3_count": s3_count,
+            "pg_count": pg_count,
+            "api_requests": client.pages_fetched,
+            "records_per_sec": pg_count / elapsed if elapsed > 0 else 0.0,
+            "rate_wait_sec": client.rate_wait_sec,
+            "concurrency": concurrency,
+        }
+    except Exception as e:
+        logging.error(f"Error during category {category}: {e}")
+        if writer is not None:
+            writer.abort()
+        forget_entries(existing_ids, pg_batch)
+        forget_entries(existing_ids, unprocessed)
+        if uploader is not None:
+            uploader.abort()
+        status = checkpoint.fail(pg, category, str(e)[:1000], COLLECT_MAX_ATTEMPTS)
+        logging.info(f"{category} -> {status or 'will retry from checkpoint'}")
+    return stats
+
+def run_lambda(context=None):
     """
     Lambda 入口
+    context: Lambda context, 有的話依剩餘時間一個接一個抓領域 (耗時以 EWMA 估計), 放不下就交給下一個 Lambda
+    沒有 context (本機執行) 時抓 num_categories_per_run 個
     """
-    
-    num_per_run = cfg["lambda"]["num_categories_per_run"]
+    apply_config(get_config())
+    # downloaded_papers 依 last_attempt 每月一個 partition, 先確定未來的月份都已建立
+    partitions.ensure_partitions_once(pg, cfg.partitions.months_ahead)
+    num_per_run = cfg.lambda_.num_categories_per_run
     all_categories = flatten_categories(cfg)  # YAML 裡所有領域
     existing_cats = get_existing_categories()
 
@@ -228,100 +510,46 @@ def run_lambda():
         logging.info("All categories are finished.")
         return {"status": "finished"}
 
-    category_list = select_next_categories(pending_cats, num_per_run)
-
-    logging.info(f"這次執行的領域：{category_list}")
-        
-    existing_ids = load_existing_ids()
-    category_stats = {}
-    for category in category_list:
-        start_time = time.time()
-        s3_count = 0
-        pg_count = 0
-        try:
-            S3_PREFIX = f"raw/{category.replace('.','_')}/"
-            search = arxiv.Search(
-                query=f'cat:{category}',
-                max_results=MAX_RESULTS_GOAL,
-                sort_by=arxiv.SortCriterion.SubmittedDate,
-                sort_order=arxiv.SortOrder.Descending
-            )
-            logging.info(f"{category}: Started")
-            batch = []
-            batch_ids = set()
-            pg_batch = []
-            batch_count = 0
-            total_count = 0
-            while True:
-                try:
-                    results_generator = client.results(search, offset=total_count)
-                    for paper_result in results_generator:
-                        entry_id = paper_result.entry_id
-                        if entry_id in existing_ids or entry_id in batch_ids:
-                            # logging.info(f"Skipping duplicate: {entry_id}")
-                            continue
-                        existing_ids.add(entry_id)
-                        batch_ids.add(entry_id)
-                        paper_data = {
-                            "entry_id": entry_id,
-                            "title": paper_result.title,
-                            "authors": [a.name for a in paper_result.authors],
-                            "summary": paper_result.summary,
-                            "primary_category": paper_result.primary_category,
-                            "categories": paper_result.categories,
-                            "published": paper_result.published.isoformat(),
-                            "updated": paper_result.updated.isoformat(),
-                            "journal_ref": paper_result.journal_ref,
-                            "doi": paper_result.doi
-                        }
-                        utc_now = datetime.now(timezone.utc)
-                        today_str = utc_now.strftime("%Y-%m-%d")
-                        batch.append(paper_data)
-                        total_count += 1
-                        etl_batch_id = f"{category.replace('.','_')}_{today_str}_batch_{batch_count}"
-                        
-                        add_to_pg_batch(pg_batch, entry_id, category, "pending", "pending", etl_batch_id)
-                        pg_count += 1
-                        if len(batch) >= BATCH_SIZE:
-                            # 上傳至 S3
-                            now_s3_key = upload_batch_to_s3(S3_PREFIX, batch, batch_count, category)
-                            s3_count += len(batch)
-                            for i in range(len(pg_batch)):
-                                pg_batch[i] = (pg_batch[i][0], pg_batch[i][1], "uploaded", pg_batch[i][3], pg_batch[i][4], pg_batch[i][5], pg_batch[i][6])
-                                
-                            # 寫入 ETL raw_batches 表
-                            add_raw_batches_to_pg(etl_batch_id, category, now_s3_key, len(batch))
-                            # 批次推送到 PG
-                            flush_pg_batch(pg_batch)
-                            batch = []
-                            pg_batch = []
-                            batch_count += 1
-                    break
-                except arxiv.UnexpectedEmptyPageError as e:
-                    logging.error(f"Error fetching results at offset {total_count}, ignore..., detail: {e}")
-                    total_count += 1
-                    continue
-            if batch:
-                now_s3_key = upload_batch_to_s3(S3_PREFIX, batch, batch_count, category)
-                s3_count += len(batch)
-                for i in range(len(pg_batch)):
-                    pg_batch[i] = (pg_batch[i][0], pg_batch[i][1], "uploaded", pg_batch[i][3], pg_batch[i][4], pg_batch[i][5], pg_batch[i][6])
-                add_raw_batches_to_pg(etl_batch_id, category, now_s3_key, len(batch))
-                flush_pg_batch(pg_batch)
-                logging.info(etl_batch_id)
-            elapsed = time.time() - start_time
-            category_stats[category] = {"time_sec": elapsed, "s3_count": s3_count, "pg_count": pg_count}
-        except Exception as e:
-            logging.error(f"Error during category {category}: {e}")
-        mark_category_finished(category)
-        logging.info(f"{category} -> Finished")
+    if context is None:
+        pending_cats = select_next_categories(pending_cats, num_per_run)
+    budget = TimeBudget(
+        context,
+        safety_seconds=cfg.lambda_.time_safety_margin_seconds,
+        estimate=category_seconds,
+        max_items=None if context is not None else num_per_run,
+    )
+    logging.info(
+        f"這次執行的領域：{pending_cats if context is None else '依剩餘時間決定'} "
+        f"(estimate={category_seconds.value}, remaining={budget.remaining_seconds()})"
+    )
+
+    existing_ids = load_dedup_index()
+    workers = min(COLLECT_CONCURRENCY, len(pending_cats))
+    if workers > 1:
+        logging.info(f"Collecting categories with {workers} threads")
+    queue = iter(pending_cats)
+    results = budget.run(
+        lambda: next(queue, None),
+        lambda cat: collect_category(cat, existing_ids, workers, budget),
+        concurrency=workers,
+    )
+    category_stats = {cat: stats for cat, stats in results if stats}
+    if budget.stopped_early:
+        logging.info(f"Time budget reached after {budget.started} categories, hand off to the next Lambda")
 
     for cat, stats in category_stats.items():
-        logging.info(f"{cat} -> Time: {stats['time_sec']:.2f}s, S3: {stats['s3_count']}, PostgreSQL: {stats['pg_count']}")
+        logging.info(
+            f"{cat} -> Time: {stats['time_sec']:.2f}s, S3: {stats['s3_count']}, PostgreSQL: {stats['pg_count']}, "
+            f"{stats['records_per_sec']:.1f} records/s, requests: {stats['api_requests']}, "
+            f"rate limit wait: {stats['rate_wait_sec']:.1f}s"
+        )
 
     # 批次寫入各領域統計資料
     insert_category_stats(category_stats)
 
+    if isinstance(existing_ids, DedupIndex):
+        existing_ids.save()
+
     remaining = get_pending_categories()
     if remaining:
         logging.info("還有領域沒抓取，觸發下一個 Lambda")
@@ -0,0 +1,98 @@
+"""
+batch_pipeline.py
+Collector 的 producer / consumer pipeline
+- producer (抓 arXiv 的迴圈) 把寫滿的 batch 丟進 bounded queue 就繼續抓下一筆
+- 背景 worker 負責完成 S3 上傳 (含重試) 與寫入 PG
+- queue 滿了 submit() 會等待 (backpressure), 上傳跟不上時不會無限制吃記憶體
+- worker 失敗時記下第一個錯誤, 之後的 batch 交給 discard 清理, producer 下一次 submit() 或 close() 會拋出該錯誤
+"""
+
+import logging
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class BatchPipeline:
+    def __init__(self, handler, workers: int = 1, max_pending: int = 2, discard=None, name: str = "batch"):
+        """
+        handler: 處理一個 batch 的函式, 回傳值會收集起來由 close() 回傳
+        discard: 發生錯誤後, 還沒處理的 batch 交給它清理 (例如 abort multipart upload)
+        """
+        self.handler = handler
+        self.discard = discard
+        self.name = name
+        self.blocked_sec = 0.0  # producer 因 queue 滿而等待的時間
+        self._queue = queue.Queue(maxsize=max(max_pending, 1))
+        self._results = []
+        self._error: BaseException | None = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"{name}-uploader-{i}", daemon=True)
+            for i in range(max(workers, 1))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, *args) -> None:
+        """排入一個 batch, queue 滿時等待; 背景已失敗則直接拋出錯誤"""
+        self.raise_if_failed()
+        start = time.monotonic()
+        self._queue.put(args)
+        self.blocked_sec += time.monotonic() - start
+
+    def raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            if self._error is not None:
+                self._discard(item)
+                continue
+            try:
+                result = self.handler(*item)
+                with self._lock:
+                    self._results.append(result)
+            except BaseException as e:
+                logging.error(f"{self.name}: background batch failed: {e}")
+                with self._lock:
+                    if self._error is None:
+                        self._error = e
+                self._discard(item)
+
+    def _discard(self, item) -> None:
+        if self.discard is None:
+            return
+        try:
+            self.discard(*item)
+        except Exception as e:
+            logging.error(f"{self.name}: failed to discard batch: {e}")
+
+    def _stop(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for t in self._threads:
+            t.join()
+
+    def close(self) -> list:
+        """等所有 batch 處理完, 回傳各 batch 的結果; 有任何失敗就拋出第一個錯誤"""
+        self._stop()
+        self.raise_if_failed()
+        return self._results
+
+    def abort(self) -> None:
+        """producer 出錯時呼叫: 還沒開始處理的 batch 全部 discard, 等 worker 結束"""
+        with self._lock:
+            if self._error is None:
+                self._error = RuntimeError(f"{self.name}: pipeline aborted")
+        self._stop()
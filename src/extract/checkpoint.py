@@ -0,0 +1,121 @@
+"""
+checkpoint.py
+collector 各領域的抓取進度 (papers.category_progress 的 ckpt_* 欄位, migration 007)
+- 每個 batch 寫入 raw_batches / downloaded_papers 時, 在同一個 transaction 更新 checkpoint (save)
+- 上傳 worker 可能不依順序完成, CheckpointTracker 只讓 checkpoint 推進到「前面的 batch 都已寫入」的位置
+- 重新執行時從 checkpoint 的 offset / batch 編號繼續 (load), 領域完成時推進 watermark 並清空 (complete)
+- 失敗時保留 checkpoint 並累加 attempts, 達上限才標成 Failed (fail)
+"""
+
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+
+from src.core.pg_engine import PsqlEngine
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    offset: int = 0                         # 已處理到的 API 結果位置 (下一次從這裡開始)
+    batch: int = 0                          # 下一個 batch 編號
+    until: datetime | None = None           # incremental 查詢區間的結束時間
+    newest_published: datetime | None = None
+    newest_updated: datetime | None = None
+
+
+class CheckpointTracker:
+    """
+    with tracker.lock:
+        latest = tracker.advance_to(ckpt)     # 這個 batch 寫入後可以推進到的 checkpoint (None = 還不能推進)
+        ... 在同一個 transaction 寫入 batch 與 latest ...
+        tracker.record(ckpt)
+    lock 包住整個 transaction, 寫進 DB 的 checkpoint 才會依序推進
+    """
+
+    def __init__(self, start: Checkpoint):
+        self.committed = start
+        self.lock = threading.Lock()
+        self._ready: dict[int, Checkpoint] = {}  # 已寫入但前面還有 batch 沒完成: batch 編號 -> 寫入後的 checkpoint
+
+    def _latest(self, ready: dict[int, Checkpoint]) -> Checkpoint | None:
+        latest = None
+        nxt = self.committed.batch
+        while nxt in ready:
+            latest = ready[nxt]
+            nxt = latest.batch
+        return latest
+
+    def advance_to(self, ckpt: Checkpoint) -> Checkpoint | None:
+        return self._latest({**self._ready, ckpt.batch - 1: ckpt})
+
+    def record(self, ckpt: Checkpoint) -> None:
+        self._ready[ckpt.batch - 1] = ckpt
+        latest = self._latest(self._ready)
+        if latest is not None:
+            for batch in range(self.committed.batch, latest.batch):
+                self._ready.pop(batch, None)
+            self.committed = latest
+
+
+def load(pg: PsqlEngine, category: str) -> Checkpoint | None:
+    """上一次沒做完留下的 checkpoint, 沒有則回傳 None"""
+    row = pg.execute_query(
+        """
+        SELECT ckpt_offset, ckpt_batch, ckpt_until, ckpt_published, ckpt_updated
+        FROM papers.category_progress
+        WHERE category_name = %s AND ckpt_offset IS NOT NULL
+        """,
+        first=True,
+        params=(category,),
+    )
+    if not row:
+        return None
+    return Checkpoint(row.ckpt_offset, row.ckpt_batch, row.ckpt_until, row.ckpt_published, row.ckpt_updated)
+
+
+def save(cur, category: str, ckpt: Checkpoint) -> None:
+    """用呼叫端的 cursor 寫入, 跟 batch 的資料一起 commit"""
+    cur.execute(
+        """
+        UPDATE papers.category_progress
+        SET ckpt_offset = %s, ckpt_batch = %s, ckpt_until = %s,
+            ckpt_published = %s, ckpt_updated = %s, ckpt_at = now()
+        WHERE category_name = %s
+        """,
+        (ckpt.offset, ckpt.batch, ckpt.until, ckpt.newest_published, ckpt.newest_updated, category),
+    )
+
+
+def complete(pg: PsqlEngine, category: str, newest_published, newest_updated) -> None:
+    """推進 watermark (只會往前), 清空 checkpoint 並標成 Finished"""
+    pg.execute_cmd(
+        """
+        UPDATE papers.category_progress
+        SET last_published = GREATEST(last_published, %s),
+            last_updated = GREATEST(last_updated, %s),
+            ckpt_offset = NULL, ckpt_batch = NULL, ckpt_until = NULL,
+            ckpt_published = NULL, ckpt_updated = NULL, ckpt_at = NULL,
+            attempts = 0, last_error = NULL,
+            status = 'Finished', updated_at = NOW()
+        WHERE category_name = %s
+        """,
+        (newest_published, newest_updated, category),
+    )
+
+
+def fail(pg: PsqlEngine, category: str, error_msg: str, max_attempts: int) -> str:
+    """保留 checkpoint 讓下一次繼續, 連續失敗 max_attempts 次才標成 Failed; 回傳新的 status"""
+    row = pg.execute_query(
+        """
+        UPDATE papers.category_progress
+        SET attempts = attempts + 1,
+            last_error = %s,
+            status = CASE WHEN attempts + 1 >= %s THEN 'Failed' ELSE '' END,
+            updated_at = NOW()
+        WHERE category_name = %s
+        RETURNING status
+        """,
+        first=True,
+        params=(error_msg, max_attempts, category),
+    )
+    return row.status if row else ""
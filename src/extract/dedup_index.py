@@ -0,0 +1,182 @@
+"""
+dedup_index.py
+以 Bloom filter 取代把 entry_id 全部載入 set 的去重方式
+- filter 以 bytes 存在 S3, cold start 直接下載, 不用每次掃 papers.downloaded_entries
+- 載入後只補上次存檔之後新增的 entry_id (first_seen > covered_until)
+- 重建與精確確認都用不分區的 papers.downloaded_entries, retention DETACH 掉的月份仍算已抓過
+- filter 判斷「可能存在」時才到 DB 做精確確認, 所以誤判不會漏抓
+- claim_new 一次處理一頁 API 結果: 可能存在的 id 用一個 entry_id = ANY(...) 查詢確認,
+  查 DB 時不持有 lock, 多個領域同時抓時不會互相等待 DB I/O
+- dedup_mode: set 用 SetIndex (最近 lookback_months 的 entry_id), 介面相同
+"""
+
+import logging
+import threading
+from datetime import datetime
+from typing import Iterable
+
+from src.core.bloom import BloomFilter
+from src.core.pg_engine import PsqlEngine
+
+
+class SetIndex:
+    """dedup_mode: set 的去重容器, 全部在記憶體, thread-safe"""
+
+    def __init__(self, ids: Iterable[str] = ()):
+        self.ids = set(ids)
+        self._lock = threading.Lock()
+
+    def __contains__(self, entry_id: str) -> bool:
+        return entry_id in self.ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def claim_new(self, entry_ids: Iterable[str]) -> list[str]:
+        """回傳還沒看過的 id (依輸入順序, 不重複) 並登記, 檢查 + 登記是原子操作 (同一篇文章常跨領域)"""
+        with self._lock:
+            new = [e for e in dict.fromkeys(entry_ids) if e not in self.ids]
+            self.ids.update(new)
+        return new
+
+    def discard(self, entry_id: str) -> None:
+        with self._lock:
+            self.ids.discard(entry_id)
+
+
+class DedupIndex:
+    def __init__(self, pg: PsqlEngine, s3, bucket: str, s3_key: str, capacity: int, error_rate: float):
+        self.pg = pg
+        self.s3 = s3
+        self.bucket = bucket
+        self.s3_key = s3_key
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bloom: BloomFilter | None = None
+        self.covered_until: datetime | None = None
+        # 本次執行新增的 id, 還沒寫進 DB 前精確確認查不到, 要另外記
+        self.session_ids: set[str] = set()
+        self.db_checks = 0
+        self.dirty = False
+        # 保護 bloom / session_ids, 不在持有時做 DB I/O
+        self._lock = threading.Lock()
+
+    # -------------------------------
+    # 載入 / 建立
+    # -------------------------------
+    def load(self) -> "DedupIndex":
+        loaded_at = self.pg.execute_query("SELECT now() AS ts", first=True).ts
+        self._download()
+        if self.bloom is None or self.bloom.count > self.bloom.capacity:
+            # 沒有存檔或已超過設計容量 (誤判率上升), 從 DB 全量重建
+            capacity = max(self.capacity, self.bloom.count * 2 if self.bloom else 0)
+            logging.info(f"Rebuilding dedup bloom filter, capacity={capacity}")
+            self.bloom = BloomFilter.for_capacity(capacity, self.error_rate)
+            self._add_from_db(None)
+        else:
+            self._add_from_db(self.covered_until)
+        self.covered_until = loaded_at
+        logging.info(f"Dedup index ready: {self.bloom.count} ids, {len(self.bloom.bits) / 1024 / 1024:.1f} MB")
+        return self
+
+    def _download(self) -> None:
+        from botocore.exceptions import ClientError
+        try:
+            obj = self.s3.get_object(Bucket=self.bucket, Key=self.s3_key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return
+            raise
+        try:
+            self.bloom = BloomFilter.from_bytes(obj["Body"].read())
+            covered_until = obj.get("Metadata", {}).get("covered-until")
+            self.covered_until = datetime.fromisoformat(covered_until) if covered_until else None
+        except ValueError as e:
+            logging.warning(f"Invalid dedup index blob, rebuild: {e}")
+            self.bloom, self.covered_until = None, None
+
+    def _add_from_db(self, since: datetime | None) -> None:
+        """
+        用 server-side cursor 串流讀 entry_id, 不會一次載入記憶體
+        不讀分區的 downloaded_papers: retention DETACH 的月份會從重建的 filter 消失, 被當成沒抓過而重抓
+        """
+        stmt = "SELECT entry_id FROM papers.downloaded_entries"
+        params = None
+        if since is not None:
+            stmt += " WHERE first_seen > %s"
+            params = (since,)
+        added = 0
+        with self.pg.connection() as conn:
+            with conn.cursor(name="dedup_index_ids") as cur:
+                cur.itersize = 50000
+                cur.execute(stmt, params)
+                # 上次存檔前就加入的 id 也會讀到, 只計算 filter 裡原本沒有的
+                for (entry_id,) in cur:
+                    added += self.bloom.add(entry_id)
+        if added:
+            self.dirty = True
+        logging.info(f"Dedup index: added {added} ids from DB (since={since})")
+
+    # -------------------------------
+    # 查詢 / 新增 (介面跟 SetIndex 相同)
+    # -------------------------------
+    def _existing_in_db(self, entry_ids: list[str]) -> set[str]:
+        """Bloom filter 可能誤判, 一次查詢確認哪些真的在 DB; 查詢失敗往外拋, 不會把沒看過的 id 當成重複"""
+        self.db_checks += 1
+        with self.pg.transaction(cursor_factory=None) as cur:
+            cur.execute(
+                "SELECT entry_id FROM papers.downloaded_entries WHERE entry_id = ANY(%s)",
+                (entry_ids,),
+            )
+            return {r[0] for r in cur.fetchall()}
+
+    def claim_new(self, entry_ids: Iterable[str]) -> list[str]:
+        """
+        回傳還沒看過的 id (依輸入順序, 不重複) 並登記
+        1. 持有 lock: 排除本次已登記的, Bloom filter 判斷「一定沒有」的直接是新的
+        2. 不持有 lock: 「可能存在」的一次查 DB 確認
+        3. 持有 lock: 再排除這段期間被其他領域登記的, 剩下的登記到 session_ids 與 Bloom filter
+        """
+        with self._lock:
+            candidates = [e for e in dict.fromkeys(entry_ids) if e not in self.session_ids]
+            maybe = [e for e in candidates if e in self.bloom]
+        in_db = self._existing_in_db(maybe) if maybe else set()
+        with self._lock:
+            new = [e for e in candidates if e not in in_db and e not in self.session_ids]
+            for entry_id in new:
+                self.session_ids.add(entry_id)
+                self.bloom.add(entry_id)
+            if new:
+                self.dirty = True
+        return new
+
+    def __contains__(self, entry_id: str) -> bool:
+        with self._lock:
+            if entry_id in self.session_ids:
+                return True
+            if entry_id not in self.bloom:
+                return False
+        return bool(self._existing_in_db([entry_id]))
+
+    def discard(self, entry_id: str) -> None:
+        """
+        沒寫進 DB 的 id (batch 失敗) 從本次記錄移除
+        Bloom filter 無法刪除, 但之後判斷「可能存在」時會到 DB 確認, 所以仍會被重新抓取
+        """
+        with self._lock:
+            self.session_ids.discard(entry_id)
+
+    def save(self) -> None:
+        """寫回 S3, 下次 cold start 直接使用"""
+        if not self.dirty:
+            return
+        metadata = {"covered-until": self.covered_until.isoformat()} if self.covered_until else {}
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=self.s3_key,
+            Body=self.bloom.to_bytes(),
+            ContentType="application/octet-stream",
+            Metadata=metadata,
+        )
+        self.dirty = False
+        logging.info(f"Dedup index saved: {self.bloom.count} ids, {self.db_checks} DB checks this run")
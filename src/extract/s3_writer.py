@@ -0,0 +1,155 @@
+"""
+s3_writer.py
+串流寫出 jsonl.gz 到 S3
+- 每筆 record 一進來就序列化並丟進 zlib 增量壓縮, 記憶體只保留壓縮後的資料
+- 壓縮後超過 multipart_threshold 改用 multipart upload, 每滿 part_size 就上傳一段
+- 檔案內容與原本 upload_batch_to_s3 相同 (以 "\n" 分隔, 結尾沒有換行)
+"""
+
+import json
+import logging
+import time
+import zlib
+
+from src.core import metrics
+
+# S3 multipart 除了最後一段, 每段至少 5 MB
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def with_retries(fn, max_attempts: int, initial_delay: float):
+    """指數退避重試, 最後一次失敗就往外拋"""
+    for attempt in range(max_attempts):
+        try:
+            return fn()
+        except Exception:
+            if attempt < max_attempts - 1:
+                time.sleep(initial_delay * (2 ** attempt))
+            else:
+                raise
+
+
+class GzipJsonlWriter:
+    def __init__(
+        self,
+        s3,
+        bucket: str,
+        key: str,
+        multipart_threshold: int = 8 * 1024 * 1024,
+        part_size: int = 8 * 1024 * 1024,
+        compress_level: int = 6,
+        max_attempts: int = 3,
+        initial_delay: float = 5,
+    ):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.multipart_threshold = max(multipart_threshold, MIN_PART_SIZE)
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.max_attempts = max_attempts
+        self.initial_delay = initial_delay
+        # wbits=31 -> gzip header
+        self._compressor = zlib.compressobj(compress_level, zlib.DEFLATED, 31)
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+        self.record_count = 0
+        self.compressed_bytes = 0
+        self.compress_seconds = 0.0
+        self.closed = False
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    def write(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False).encode("utf-8")
+        if self.record_count:
+            line = b"\n" + line
+        start = time.perf_counter()
+        self._buffer += self._compressor.compress(line)
+        self.compress_seconds += time.perf_counter() - start
+        self.record_count += 1
+        if self._upload_id is None and len(self._buffer) >= self.multipart_threshold:
+            self._upload_id = self._retry(
+                lambda: self.s3.create_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    ContentType="application/json",
+                    ContentEncoding="gzip",
+                )["UploadId"]
+            )
+            logging.info(f"Switch to multipart upload: {self.key}")
+        while self._upload_id is not None and len(self._buffer) >= self.part_size:
+            self._upload_part(self.part_size)
+
+    def _retry(self, fn):
+        return with_retries(fn, self.max_attempts, self.initial_delay)
+
+    def _upload_part(self, size: int) -> None:
+        body = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        part_number = len(self._parts) + 1
+        resp = self._retry(
+            lambda: self.s3.upload_part(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                PartNumber=part_number,
+                Body=body,
+            )
+        )
+        self._parts.append({"ETag": resp["ETag"], "PartNumber": part_number})
+        self.compressed_bytes += len(body)
+
+    def close(self) -> str | None:
+        """寫完剩下的資料並完成上傳, 回傳 S3 key; 沒有任何 record 則不上傳回傳 None"""
+        if self.closed:
+            return self.key if self.record_count else None
+        self.closed = True
+        if not self.record_count:
+            return None
+        start = time.perf_counter()
+        self._buffer += self._compressor.flush()
+        self.compress_seconds += time.perf_counter() - start
+        metrics.GZIP_SECONDS.labels("compress").observe(self.compress_seconds)
+        try:
+            if self._upload_id is None:
+                body = bytes(self._buffer)
+                self._retry(
+                    lambda: self.s3.put_object(
+                        Bucket=self.bucket,
+                        Key=self.key,
+                        Body=body,
+                        ContentType="application/json",
+                        ContentEncoding="gzip",
+                    )
+                )
+                self.compressed_bytes += len(body)
+            else:
+                if self._buffer:
+                    self._upload_part(len(self._buffer))
+                self._retry(
+                    lambda: self.s3.complete_multipart_upload(
+                        Bucket=self.bucket,
+                        Key=self.key,
+                        UploadId=self._upload_id,
+                        MultipartUpload={"Parts": self._parts},
+                    )
+                )
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+        return self.key
+
+    def abort(self) -> None:
+        """放棄上傳, multipart 未完成的分段要清掉避免持續計費"""
+        self.closed = True
+        self._buffer = bytearray()
+        if self._upload_id is not None:
+            try:
+                self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+            except Exception as e:
+                logging.error(f"Failed to abort multipart upload {self.key}: {e}")
+            self._upload_id = None
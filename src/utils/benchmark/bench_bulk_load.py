@@ -0,0 +1,90 @@
+"""
+bench_bulk_load.py
+比較 insert_mogrify 與 copy_merge 的寫入速度 (rows/sec)
+需要一個可連線的 PostgreSQL (讀 .env 的 POSTGRES_*), 會建立 bench_ 開頭的暫時資料表, 結束後刪除
+
+python -m src.utils.benchmark.bench_bulk_load --rows 20000 --chunk 100
+"""
+
+import argparse
+import json
+import random
+import string
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from psycopg2.extras import Json
+
+from src.core.db import get_pg
+
+TABLES = {
+    "arxiv_papers": "bench_arxiv_papers",
+    "arxiv_papers_history": "bench_arxiv_papers_history",
+}
+
+
+def _text(n: int) -> str:
+    return "".join(random.choices(string.ascii_letters + "  \t\n\\\"'", k=n))
+
+
+def synthetic_rows(n: int, s3_key: str = "raw/bench/bench.jsonl.gz"):
+    """產生跟 parse_record / parse_history_record 相同格式的 tuple"""
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    papers, history = [], []
+    for i in range(n):
+        published = base + timedelta(minutes=i)
+        entry_id = f"http://arxiv.org/abs/bench.{i:07d}v1"
+        title, summary = _text(80), _text(1200)
+        authors = [_text(12) for _ in range(random.randint(1, 8))]
+        categories = random.sample(["cs.AI", "cs.LG", "cs.CL", "stat.ML", "math.ST"], 2)
+        now = datetime.now(timezone.utc)
+        papers.append((
+            entry_id, title, authors, json.dumps({}), summary, categories[0], categories,
+            published.isoformat(), published.isoformat(), None, None, json.dumps({}),
+            published.date(), published.date(), now, 1, [], None, s3_key,
+        ))
+        history.append((
+            str(uuid.uuid4()), entry_id, int(now.timestamp()), now, "bench", title, authors,
+            Json({}), summary, categories[0], categories, published.isoformat(),
+            published.isoformat(), None, None, Json({}), [], None, s3_key, "insert",
+        ))
+    return papers, history
+
+
+def run(rows: int, chunk: int) -> dict:
+    pg = get_pg()
+    for src, dst in TABLES.items():
+        pg.execute_cmd(f"DROP TABLE IF EXISTS {dst}; CREATE TABLE {dst} (LIKE {src} INCLUDING ALL);")
+
+    papers, history = synthetic_rows(rows)
+    results = {}
+    try:
+        for method in ("mogrify", "copy"):
+            for dst in TABLES.values():
+                pg.execute_cmd(f"TRUNCATE {dst}")
+            write = pg.insert_mogrify if method == "mogrify" else pg.copy_merge
+            start = time.perf_counter()
+            for i in range(0, rows, chunk):
+                write(TABLES["arxiv_papers"], papers[i:i + chunk])
+                write(TABLES["arxiv_papers_history"], history[i:i + chunk])
+            elapsed = time.perf_counter() - start
+            loaded = pg.execute_query(f"SELECT COUNT(*) AS cnt FROM {TABLES['arxiv_papers']}", first=True).cnt
+            results[method] = {
+                "rows": rows * 2,
+                "loaded_papers": loaded,
+                "seconds": round(elapsed, 3),
+                "rows_per_sec": round(rows * 2 / elapsed, 1),
+            }
+    finally:
+        for dst in TABLES.values():
+            pg.execute_cmd(f"DROP TABLE IF EXISTS {dst}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--chunk", type=int, default=100, help="對應 etl.etl_batch_size")
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.chunk), indent=2))
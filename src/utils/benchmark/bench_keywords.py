@@ -0,0 +1,108 @@
+"""
+bench_keywords.py
+比較逐筆 Python 迴圈 (Counter 算詞頻、逐字查 df) 與 src.etl.keywords 整批向量化的關鍵字擷取速度 (records/sec)
+corpus 統計事先在記憶體算好, 只計時「一批 title / summary -> 每篇的關鍵字」, 不需要 PostgreSQL
+開始前會確認兩邊的結果相同
+
+python -m src.utils.benchmark.bench_keywords --records 20000 --batch-sizes 100,1000
+"""
+
+import argparse
+import json
+import math
+import re
+import random
+import time
+from collections import Counter
+
+import numpy as np
+
+from src.etl.keywords import STOPWORDS, TOKEN_RE, term_matrix, top_keywords
+from src.utils.benchmark.bench_search import vocabulary
+
+TOP_K = 8
+MIN_DF = 2
+TITLE_WEIGHT = 2.0
+# 逐筆實作用 str 的 regex (規則相同)
+LEGACY_TOKEN_RE = re.compile(TOKEN_RE.pattern.decode())
+
+
+def synthetic_papers(n: int, seed: int = 0) -> tuple[list[str], list[str]]:
+    """字詞頻率偏向常見字, 摘要長度接近真實資料"""
+    rng = random.Random(seed)
+    vocab = vocabulary(seed)
+    weights = [1 / (i + 1) for i in range(len(vocab))]
+    titles = [" ".join(rng.choices(vocab, weights, k=rng.randint(6, 14))).title() for _ in range(n)]
+    summaries = [" ".join(rng.choices(vocab, weights, k=rng.randint(100, 220))) + "." for _ in range(n)]
+    return titles, summaries
+
+
+def corpus_stats(titles: list[str], summaries: list[str]) -> tuple[np.ndarray, np.ndarray, int]:
+    m = term_matrix(titles, summaries, TITLE_WEIGHT)
+    return m.terms, m.document_frequency(), m.num_docs
+
+
+# -------------------------------
+# 逐筆實作, 作為比較基準
+# -------------------------------
+def legacy_keywords(titles: list[str], summaries: list[str], df: dict, num_docs: int) -> list[list[str]]:
+    result = []
+    for title, summary in zip(titles, summaries):
+        tf = Counter()
+        for word in LEGACY_TOKEN_RE.findall(title.lower()):
+            if word not in STOPWORDS:
+                tf[word] += TITLE_WEIGHT
+        for word in LEGACY_TOKEN_RE.findall(summary.lower()):
+            if word not in STOPWORDS:
+                tf[word] += 1
+        scored = []
+        for word, count in tf.items():
+            d = df.get(word, 0)
+            if d >= MIN_DF:
+                scored.append((-(1 + math.log(count)) * (math.log((1 + num_docs) / (1 + d)) + 1), word))
+        scored.sort()
+        result.append([word for _, word in scored[:TOP_K]])
+    return result
+
+
+def vectorized_keywords(titles: list[str], summaries: list[str], stats) -> list[list[str]]:
+    terms, df, num_docs = stats
+    m = term_matrix(titles, summaries, TITLE_WEIGHT)
+    # ETL 裡這一步是 keyword_df 的查詢, 這裡改成在記憶體的排序陣列裡找
+    batch_df = df[np.searchsorted(terms, m.terms)]
+    return top_keywords(m, batch_df, num_docs, TOP_K, MIN_DF)
+
+
+def run(records: int, batch_sizes: list[int], repeat: int) -> dict:
+    titles, summaries = synthetic_papers(records)
+    stats = corpus_stats(titles, summaries)
+    df = dict(zip(stats[0].tolist(), stats[1].tolist()))
+    expected = legacy_keywords(titles[:1000], summaries[:1000], df, stats[2])
+    assert vectorized_keywords(titles[:1000], summaries[:1000], stats) == expected
+
+    results = {"records": records, "corpus_terms": len(df), "top_k": TOP_K}
+    for size in batch_sizes:
+        batches = [(titles[i:i + size], summaries[i:i + size]) for i in range(0, records, size)]
+        legacy = min(_timed(lambda: [legacy_keywords(t, s, df, stats[2]) for t, s in batches]) for _ in range(repeat))
+        vectorized = min(_timed(lambda: [vectorized_keywords(t, s, stats) for t, s in batches]) for _ in range(repeat))
+        results[f"batch_{size}"] = {
+            "legacy_records_per_sec": round(records / legacy, 1),
+            "vectorized_records_per_sec": round(records / vectorized, 1),
+            "speedup": round(legacy / vectorized, 2),
+        }
+    return results
+
+
+def _timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--batch-sizes", default="100,1000", help="每批文章數, 逗號分隔 (對應 etl.etl_batch_size)")
+    parser.add_argument("--repeat", type=int, default=3, help="每種方式跑幾次取最快")
+    args = parser.parse_args()
+    print(json.dumps(run(args.records, [int(x) for x in args.batch_sizes.split(",")], args.repeat), indent=2))
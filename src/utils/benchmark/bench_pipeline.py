@@ -0,0 +1,328 @@
+"""
+bench_pipeline.py
+Collector / ETL 熱路徑的離線 benchmark, 不需要網路與 AWS
+- arXiv API: fake_arxiv.FakeArxivServer (本機合成 Atom feed)
+- S3: moto
+- PostgreSQL: 本機 (讀 .env 的 POSTGRES_*), 使用獨立的 --dbname (預設 arxiv_bench)
+  資料庫不存在會自動建立並套用 create_table.sql 與 migrations, 每個 stage 前會清空 arxiv_papers / arxiv_papers_history
+
+每個資料量 x stage 記錄 records/sec, 每個 batch 的 p50 / p99 latency (ms) 與 peak RSS
+結果寫成 JSON (含 git commit), 不同版本的結果可以直接比較
+
+python -m src.utils.benchmark.bench_pipeline --sizes 1000,10000,50000
+python -m src.utils.benchmark.bench_pipeline --sizes 5000 --stages fetch,parse_record,etl_load
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import resource
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import psycopg2
+from psycopg2 import sql
+
+from src.core.config import PROJECT_ROOT, PipelineConfig, settings, yaml_config
+from src.core.db import get_pg
+from src.etl.record_decoder import RecordDecoder
+from src.utils.benchmark.fake_arxiv import FakeArxivServer
+
+BUCKET = "bench-arxiv-bucket"
+CATEGORY = "cs.AI"
+STAGES = ["fetch", "s3_upload", "parse_record", "db_mogrify", "db_copy", "db_upsert", "db_upsert_unchanged", "etl_load"]
+SQL_DIR = PROJECT_ROOT / "src" / "utils" / "initial"
+
+
+# -------------------------------
+# 量測工具
+# -------------------------------
+class RssSampler:
+    """背景每 interval 秒讀一次 RSS, 記錄區間內的最高值 (MB)"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.start_mb = self.peak_mb = self.current_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current_mb() -> float:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+        except OSError:
+            # 非 Linux: 只拿得到整個 process 的最高值
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, self.current_mb())
+
+    def __enter__(self) -> "RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, self.current_mb())
+
+
+def percentile(sorted_values: list[float], pct: float) -> float | None:
+    """nearest-rank percentile"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return round(sorted_values[rank - 1], 3)
+
+
+def summarize(stage: str, records: int, latencies_ms: list[float], elapsed: float, rss: RssSampler, **extra) -> dict:
+    latencies_ms = sorted(latencies_ms)
+    return {
+        "stage": stage,
+        "records": records,
+        "batches": len(latencies_ms),
+        "seconds": round(elapsed, 3),
+        "records_per_sec": round(records / elapsed, 1) if elapsed > 0 else None,
+        "p50_ms": percentile(latencies_ms, 50),
+        "p99_ms": percentile(latencies_ms, 99),
+        "peak_rss_mb": round(rss.peak_mb, 1),
+        "rss_growth_mb": round(rss.peak_mb - rss.start_mb, 1),
+        **extra,
+    }
+
+
+def run_batches(stage: str, items: list, batch_size: int, fn, **extra) -> dict:
+    """items 依 batch_size 切開, 每個 batch 呼叫 fn(batch) 並計時"""
+    latencies = []
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        for i in range(0, len(items), batch_size):
+            t = time.perf_counter()
+            fn(items[i:i + batch_size])
+            latencies.append((time.perf_counter() - t) * 1000)
+        elapsed = time.perf_counter() - start
+    return summarize(stage, len(items), latencies, elapsed, rss, batch_size=batch_size, **extra)
+
+
+# -------------------------------
+# 環境準備
+# -------------------------------
+def ensure_database(dbname: str):
+    """建立 benchmark 專用資料庫與資料表 (已存在則沿用)"""
+    conn = psycopg2.connect(
+        dbname="postgres",
+        user=settings.POSTGRES_USER,
+        password=settings.POSTGRES_PASSWORD,
+        host=settings.POSTGRES_SERVER,
+        port=settings.POSTGRES_PORT,
+    )
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (dbname,))
+        if cur.fetchone() is None:
+            cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(dbname)))
+    conn.close()
+
+    pg = get_pg(dbname=dbname)
+    if pg.execute_query("SELECT to_regclass('public.arxiv_papers') AS t", first=True).t is None:
+        scripts = [SQL_DIR / "create_table.sql", *sorted((SQL_DIR / "migrations").glob("*.sql"))]
+        for path in scripts:
+            with pg.transaction() as cur:
+                cur.execute(path.read_text(encoding="utf-8"))
+    return pg
+
+
+def reset_tables(pg):
+    with pg.transaction() as cur:
+        cur.execute("TRUNCATE arxiv_papers, arxiv_papers_history")
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# -------------------------------
+# Stages
+# -------------------------------
+def bench_fetch(server: FakeArxivServer, size: int, batch_size: int, page_size: int) -> tuple[dict, list[dict]]:
+    """透過 RateLimitedClient 抓 fake feed 並轉成 jsonl dict; latency 為每 batch_size 筆的時間"""
+    import arxiv
+
+    from src.core.rate_limit import TokenBucket
+    from src.extract.arxiv_client import RateLimitedClient
+    from src.extract.arxiv_collector import to_paper_data
+
+    client = RateLimitedClient(TokenBucket(rate=1e9, capacity=1e9), page_size=min(page_size, size), num_retries=0)
+    client.query_url_format = server.query_url_format
+    search = arxiv.Search(query=f"cat:{CATEGORY}", max_results=size)
+    records, latencies = [], []
+    with RssSampler() as rss:
+        start = last = time.perf_counter()
+        for result in client.results(search):
+            records.append(to_paper_data(result))
+            if len(records) % batch_size == 0:
+                now = time.perf_counter()
+                latencies.append((now - last) * 1000)
+                last = now
+        elapsed = time.perf_counter() - start
+        if len(records) % batch_size:
+            latencies.append((time.perf_counter() - last) * 1000)
+    stats = summarize("fetch", len(records), latencies, elapsed, rss, batch_size=batch_size, api_requests=client.pages_fetched)
+    return stats, records
+
+
+def bench_s3_upload(s3, records: list[dict], batch_size: int, size: int) -> tuple[dict, list[str]]:
+    from src.extract.s3_writer import GzipJsonlWriter
+
+    keys = []
+
+    def upload(batch):
+        writer = GzipJsonlWriter(s3, BUCKET, f"raw/bench/{size}/batch_{len(keys)}.jsonl.gz")
+        for record in batch:
+            writer.write(record)
+        keys.append(writer.close())
+
+    return run_batches("s3_upload", records, batch_size, upload), keys
+
+
+def run_size(pg, s3, server: FakeArxivServer, conf: PipelineConfig, size: int, stages: list[str]) -> list[dict]:
+    from src.etl import arxiv_etl
+
+    batch_size = conf.source_papers.batch_size
+    etl_batch_size = conf.etl.etl_batch_size
+    server.papers_per_category = size
+    results = []
+
+    fetch_stats, records = bench_fetch(server, size, batch_size, conf.source_papers.max_results_goal)
+    if "fetch" in stages:
+        results.append(fetch_stats)
+    upload_stats, keys = bench_s3_upload(s3, records, batch_size, size)
+    if "s3_upload" in stages:
+        results.append(upload_stats)
+
+    def parse(batch):
+        decoder = RecordDecoder("bench", "bench", with_hash=True)
+        for record in batch:
+            decoder.decode(record)
+
+    if "parse_record" in stages:
+        results.append(run_batches("parse_record", records, etl_batch_size, parse))
+
+    decoder = RecordDecoder("bench", "bench", with_hash=True)
+    decoded = [decoder.decode(r) for r in records]
+    hashed = [paper for paper, _ in decoded]
+    pairs = [(paper[:-1], history) for paper, history in decoded]
+
+    for method, write in (("mogrify", pg.insert_mogrify), ("copy", pg.copy_merge)):
+        if f"db_{method}" not in stages:
+            continue
+        reset_tables(pg)
+
+        def write_pairs(batch, write=write):
+            write("arxiv_papers", [p for p, _ in batch])
+            write("arxiv_papers_history", [h for _, h in batch])
+
+        results.append(run_batches(f"db_{method}", pairs, etl_batch_size, write_pairs))
+
+    if "db_upsert" in stages or "db_upsert_unchanged" in stages:
+        reset_tables(pg)
+        upsert = lambda batch: arxiv_etl.upsert_papers(batch, "bench")  # noqa: E731
+        first = run_batches("db_upsert", hashed, etl_batch_size, upsert)
+        if "db_upsert" in stages:
+            results.append(first)
+        if "db_upsert_unchanged" in stages:
+            # 同一批資料再載入一次, 應該幾乎沒有寫入
+            results.append(run_batches("db_upsert_unchanged", hashed, etl_batch_size, upsert))
+
+    if "etl_load" in stages:
+        reset_tables(pg)
+        latencies = []
+        with RssSampler() as rss:
+            start = time.perf_counter()
+            for key in keys:
+                t = time.perf_counter()
+                arxiv_etl.load_s3_gzip_to_pg(BUCKET, key, etl_stage="bench")
+                latencies.append((time.perf_counter() - t) * 1000)
+            elapsed = time.perf_counter() - start
+        results.append(summarize(
+            "etl_load", len(records), latencies, elapsed, rss,
+            files=len(keys), load_method=arxiv_etl.LOAD_METHOD, write_mode=arxiv_etl.WRITE_MODE,
+        ))
+
+    for stats in results:
+        stats["size"] = size
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for collector / ETL hot paths")
+    parser.add_argument("--sizes", default="1000,10000,50000", help="逗號分隔的資料量")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"要跑的 stage: {','.join(STAGES)}")
+    parser.add_argument("--dbname", default="arxiv_bench", help="benchmark 專用資料庫, 會被清空")
+    parser.add_argument("--out", default="bench_results", help="結果輸出的目錄或 .json 檔")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    stages = [s for s in args.stages.split(",") if s]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {sorted(unknown)}")
+
+    # moto 需要假的 credentials, 避免用到真的 AWS
+    os.environ.update(AWS_ACCESS_KEY_ID="bench", AWS_SECRET_ACCESS_KEY="bench", AWS_DEFAULT_REGION="ap-northeast-1")
+    import boto3
+    from moto import mock_aws
+
+    from src.etl import arxiv_etl
+
+    # 每個檔案一行的 INFO log 會影響計時
+    logging.getLogger().setLevel(logging.WARNING)
+    conf = PipelineConfig.model_validate(yaml_config)
+    pg = ensure_database(args.dbname)
+    arxiv_etl.apply_config(conf)
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "batch_size": conf.source_papers.batch_size,
+            "page_size": conf.source_papers.max_results_goal,
+            "etl_batch_size": conf.etl.etl_batch_size,
+            "load_method": conf.etl.load_method,
+            "write_mode": conf.etl.write_mode,
+        },
+        "results": [],
+    }
+    with mock_aws(), FakeArxivServer() as server:
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": "ap-northeast-1"})
+        for size in sizes:
+            for stats in run_size(pg, s3, server, conf, size, stages):
+                report["results"].append(stats)
+                print(json.dumps(stats, ensure_ascii=False))
+
+    out = Path(args.out)
+    if out.suffix != ".json":
+        out = out / f"pipeline_{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"results saved to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+bench_record_decoder.py
+比較原本的 parse_record / parse_history_record / content_hash 與 RecordDecoder 的解碼速度 (records/sec)
+產生一個 --records 筆的 jsonl.gz (格式同 collector 上傳到 S3 的檔案), 先解壓成行, 只計時「一行 -> DB tuple」
+不需要 PostgreSQL / S3; 開始前會確認兩邊產生的 tuple 內容相同
+
+python -m src.utils.benchmark.bench_record_decoder --records 100000
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from psycopg2.extras import Json
+
+from src.etl.record_decoder import HASH_FIELDS, RecordDecoder, loads
+from src.etl.s3_stream import iter_gzip_lines
+from src.utils.benchmark.fake_arxiv import WORDS
+
+S3_KEY = "raw/cs_AI/2025-01-01/bench.jsonl.gz"
+
+
+# -------------------------------
+# 原本 arxiv_etl 的實作, 作為比較基準
+# -------------------------------
+def legacy_parse_record(record: dict, s3_key: str):
+    published_date = record.get("published")
+    updated_date = record.get("updated")
+    if published_date:
+        published_date = datetime.fromisoformat(published_date).date()
+    if updated_date:
+        updated_date = datetime.fromisoformat(updated_date).date()
+    return (
+        record.get("entry_id"),
+        record.get("title"),
+        record.get("authors", []),
+        json.dumps({}),
+        record.get("summary"),
+        record.get("primary_category"),
+        record.get("categories", []),
+        record.get("published"),
+        record.get("updated"),
+        record.get("journal_ref"),
+        record.get("doi"),
+        json.dumps({}),
+        published_date,
+        updated_date,
+        datetime.now(timezone.utc),
+        1,
+        [],
+        None,
+        s3_key
+    )
+
+
+def legacy_content_hash(record: dict) -> str:
+    payload = json.dumps([record.get(f) for f in HASH_FIELDS], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def legacy_parse_history_record(record: dict, s3_key: str, operation: str, etl_stage: str):
+    summary = (record.get("summary") or "").replace('\x00', '').replace('\n', ' ').replace('\r', ' ')
+    return (
+        str(uuid.uuid4()),
+        record.get("entry_id"),
+        int(datetime.now(timezone.utc).timestamp()),
+        datetime.now(timezone.utc),
+        etl_stage,
+        record.get("title"),
+        record.get("authors", []),
+        Json({}),
+        summary,
+        record.get("primary_category"),
+        record.get("categories", []),
+        record.get("published"),
+        record.get("updated"),
+        record.get("journal_ref"),
+        record.get("doi"),
+        Json({}),
+        [],
+        None,
+        s3_key,
+        operation
+    )
+
+
+# -------------------------------
+# 測試資料
+# -------------------------------
+def synthetic_gz(n: int, seed: int = 0) -> bytes:
+    """collector 上傳的 jsonl.gz (to_paper_data 的欄位), 摘要長度接近真實資料"""
+    rng = random.Random(seed)
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    lines = []
+    for i in range(n):
+        published = base - timedelta(minutes=i)
+        lines.append(json.dumps({
+            "entry_id": f"http://arxiv.org/abs/2501.{i:05d}v1",
+            "title": " ".join(rng.choices(WORDS, k=10)),
+            "authors": [" ".join(rng.choices(WORDS, k=2)).title() for _ in range(rng.randint(1, 8))],
+            "summary": " ".join(rng.choices(WORDS, k=150)) + "\n" + " ".join(rng.choices(WORDS, k=20)),
+            "primary_category": "cs.AI",
+            "categories": ["cs.AI", rng.choice(["cs.LG", "cs.CL", "stat.ML"])],
+            "published": published.isoformat(),
+            "updated": (published + timedelta(days=rng.randint(0, 30))).isoformat(),
+            "journal_ref": None,
+            "doi": None,
+        }, ensure_ascii=False))
+    return gzip.compress("\n".join(lines).encode("utf-8"))
+
+
+def _legacy(lines: list[bytes], upsert: bool) -> None:
+    for line in lines:
+        record = json.loads(line)
+        if upsert:
+            legacy_parse_record(record, S3_KEY) + (legacy_content_hash(record),)
+        else:
+            legacy_parse_record(record, S3_KEY)
+            legacy_parse_history_record(record, S3_KEY, "insert", "bench")
+
+
+def _decoder(lines: list[bytes], upsert: bool) -> None:
+    decoder = RecordDecoder(S3_KEY, "bench", with_history=not upsert, with_hash=upsert)
+    decode = decoder.decode
+    for line in lines:
+        decode(loads(line))
+
+
+def check_equivalent(lines: list[bytes]) -> None:
+    """兩邊的 tuple 除了 etl_timestamp / history_id / version 之外必須相同"""
+    decoder = RecordDecoder(S3_KEY, "bench", with_hash=True)
+    for line in lines[:1000]:
+        record = json.loads(line)
+        paper, history = decoder.decode(loads(line))
+        old_paper = legacy_parse_record(record, S3_KEY) + (legacy_content_hash(record),)
+        old_history = legacy_parse_history_record(record, S3_KEY, "insert", "bench")
+        assert paper[:14] + paper[15:] == old_paper[:14] + old_paper[15:], record["entry_id"]
+        assert history[4:7] + history[8:15] + history[16:] == old_history[4:7] + old_history[8:15] + old_history[16:]
+
+
+def run(records: int, repeat: int) -> dict:
+    body = synthetic_gz(records)
+    lines = list(iter_gzip_lines(iter([body])))
+    check_equivalent(lines)
+    results = {"records": records, "gz_bytes": len(body), "json_loads": loads.__module__}
+    for mode, upsert in (("append", False), ("upsert", True)):
+        for name, fn in (("legacy", _legacy), ("decoder", _decoder)):
+            best = min(_timed(fn, lines, upsert) for _ in range(repeat))
+            results[f"{mode}_{name}"] = {"seconds": round(best, 3), "records_per_sec": round(records / best, 1)}
+        results[f"{mode}_speedup"] = round(
+            results[f"{mode}_decoder"]["records_per_sec"] / results[f"{mode}_legacy"]["records_per_sec"], 2
+        )
+    return results
+
+
+def _timed(fn, lines: list[bytes], upsert: bool) -> float:
+    start = time.perf_counter()
+    fn(lines, upsert)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3, help="每種方式跑幾次取最快")
+    args = parser.parse_args()
+    print(json.dumps(run(args.records, args.repeat), indent=2))
@@ -0,0 +1,213 @@
+"""
+bench_search.py
+比較 title / summary 的 ILIKE 全表掃描與 search_vector 全文檢索 (migration 009) 的查詢延遲
+- 在 benchmark 專用資料庫 (預設 arxiv_bench, 會被清空) 以 SQL 直接產生 --rows 筆文章, 字詞頻率接近 Zipf 分布
+- 每種查詢 (常見字 / 少見字 / 多字 / 片語 / 加上領域篩選) 各跑 --repeat 次, 記錄 p50 / p95 / 平均 (ms)
+- 全文檢索走 src.api.papers.search_papers (含 ts_rank 排序與 ts_headline), 結果存成 bench_results/search_*.json
+
+python -m src.utils.benchmark.bench_search --rows 1000000
+python -m src.utils.benchmark.bench_search --reuse     # 沿用上一次產生的資料
+"""
+
+import argparse
+import json
+import logging
+import platform
+import random
+import statistics
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from src.api import papers
+from src.utils.benchmark.bench_pipeline import SQL_DIR, ensure_database, git_commit, percentile
+from src.utils.benchmark.fake_arxiv import WORDS
+
+CATEGORIES = ["cs.AI", "cs.LG", "cs.CL", "cs.CV", "stat.ML", "math.OC", "quant-ph", "hep-th"]
+VOCAB_SIZE = 20000
+# 在 1% 的文章摘要裡放入固定片語, 片語查詢才有可預期的命中數
+PHRASE = "graph neural network"
+CHUNK_ROWS = 100_000
+
+GENERATE_STMT = """
+    INSERT INTO arxiv_papers (
+        entry_id, title, authors, summary, primary_category, categories,
+        published, updated, published_date, updated_date, version
+    )
+    SELECT
+        'http://arxiv.org/abs/bench.' || lpad(g::text, 8, '0') || 'v1',
+        -- generate_series 的長度參考 g, 每一列都會重新抽字; ORDER BY w.i 讓 string_agg 屬於子查詢
+        (SELECT string_agg(v.vocab[1 + floor(power(random(), 3) * %(vocab_size)s)::int], ' ' ORDER BY w.i)
+         FROM generate_series(1, 8 + g %% 5) AS w(i)),
+        ARRAY['Author ' || (g %% 50000)::text, 'Author ' || ((g * 7) %% 50000)::text],
+        (SELECT string_agg(v.vocab[1 + floor(power(random(), 3) * %(vocab_size)s)::int], ' ' ORDER BY w.i)
+         FROM generate_series(1, 80 + g %% 60) AS w(i))
+            || CASE WHEN g %% 100 = 0 THEN ' we propose a ' || %(phrase)s || ' for this task' ELSE '' END,
+        v.categories[1 + g %% %(num_categories)s],
+        ARRAY[v.categories[1 + g %% %(num_categories)s], v.categories[1 + (g / 7) %% %(num_categories)s]],
+        ts, ts, ts::date, ts::date, 1
+    FROM (SELECT %(vocab)s::text[] AS vocab, %(categories)s::text[] AS categories) v,
+         generate_series(%(start)s, %(stop)s) AS g,
+         LATERAL (SELECT timestamptz '2015-01-01' + (g %% 3650) * interval '1 day' AS ts) t
+"""
+
+
+def vocabulary(seed: int = 0) -> list[str]:
+    """fake_arxiv 的常見字排在前面 (出現頻率最高), 之後是隨機產生的字"""
+    rng = random.Random(seed)
+    words = list(WORDS)
+    seen = set(words)
+    while len(words) < VOCAB_SIZE:
+        word = "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(4, 10)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def load_rows(pg, rows: int) -> float:
+    """清空 arxiv_papers 後產生 rows 筆, 回傳秒數 (含 search_vector 計算與索引維護)"""
+    vocab = vocabulary()
+    with pg.transaction() as cur:
+        cur.execute("TRUNCATE arxiv_papers CASCADE")
+    start = time.perf_counter()
+    for lo in range(1, rows + 1, CHUNK_ROWS):
+        hi = min(lo + CHUNK_ROWS - 1, rows)
+        with pg.transaction() as cur:
+            cur.execute(GENERATE_STMT, {
+                "vocab": vocab, "vocab_size": VOCAB_SIZE - 1, "phrase": PHRASE,
+                "categories": CATEGORIES, "num_categories": len(CATEGORIES),
+                "start": lo, "stop": hi,
+            })
+        logging.warning(f"generated {hi}/{rows} rows")
+    with pg.transaction() as cur:
+        cur.execute("ANALYZE arxiv_papers")
+    return time.perf_counter() - start
+
+
+def cases(vocab: list[str]) -> list[dict]:
+    rare = vocab[VOCAB_SIZE // 2]
+    return [
+        {"name": "common_term", "q": "learning", "ilike": ["learning"]},
+        {"name": "rare_term", "q": rare, "ilike": [rare]},
+        {"name": "two_terms", "q": "graph transformer", "ilike": ["graph", "transformer"]},
+        {"name": "phrase", "q": f'"{PHRASE}"', "ilike": [PHRASE]},
+        {"name": "term_in_category", "q": "quantum", "ilike": ["quantum"], "primary_category": "quant-ph"},
+    ]
+
+
+def ilike_query(case: dict, limit: int) -> tuple[str, list]:
+    """改版前的做法: 每個字都要出現在 title 或 summary, 依發表時間排序"""
+    where, params = [], []
+    for term in case["ilike"]:
+        where.append("(title ILIKE %s OR summary ILIKE %s)")
+        params += [f"%{term}%", f"%{term}%"]
+    if case.get("primary_category"):
+        where.append("primary_category = %s")
+        params.append(case["primary_category"])
+    stmt = (
+        f"SELECT entry_id, title FROM arxiv_papers WHERE {' AND '.join(where)} "
+        f"ORDER BY published_date DESC LIMIT %s"
+    )
+    return stmt, params + [limit]
+
+
+def _latency(fn, repeat: int) -> dict:
+    fn()  # 第一次只暖 cache, 不計入
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(percentile(samples, 50), 2),
+        "p95_ms": round(percentile(samples, 95), 2),
+        "mean_ms": round(statistics.fmean(samples), 2),
+        "repeat": repeat,
+    }
+
+
+def run(pg, repeat: int, baseline_repeat: int, limit: int) -> list[dict]:
+    results = []
+    for case in cases(vocabulary()):
+        flt = papers.PaperFilter(primary_category=case.get("primary_category"))
+        matches = pg.execute_query(
+            "SELECT COUNT(*) AS cnt FROM arxiv_papers WHERE search_vector @@ websearch_to_tsquery('english', %s)"
+            + (" AND primary_category = %s" if flt.primary_category else ""),
+            first=True,
+            params=(case["q"], flt.primary_category) if flt.primary_category else (case["q"],),
+        ).cnt
+
+        def fts():
+            return papers.search_papers(pg, case["q"], flt, None, limit)
+
+        def ilike():
+            stmt, params = ilike_query(case, limit)
+            with pg.transaction() as cur:
+                cur.execute(stmt, params)
+                return cur.fetchall()
+
+        result = {
+            "case": case["name"],
+            "query": case["q"],
+            "primary_category": flt.primary_category,
+            "matches": matches,
+            "fts": _latency(fts, repeat),
+            "ilike": _latency(ilike, baseline_repeat),
+        }
+        result["speedup_p50"] = round(result["ilike"]["p50_ms"] / max(result["fts"]["p50_ms"], 0.01), 1)
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text search vs ILIKE latency on arxiv_papers")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20, help="全文檢索每種查詢跑幾次")
+    parser.add_argument("--baseline-repeat", type=int, default=3, help="ILIKE 每種查詢跑幾次 (全表掃描較慢)")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--reuse", action="store_true", help="不重新產生資料, 沿用資料庫裡現有的文章")
+    parser.add_argument("--dbname", default="arxiv_bench", help="benchmark 專用資料庫, 會被清空")
+    parser.add_argument("--out", default="bench_results", help="結果輸出的目錄或 .json 檔")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    pg = ensure_database(args.dbname)
+    # 既有的 benchmark 資料庫可能是在 migration 009 之前建立的
+    with pg.transaction() as cur:
+        cur.execute((SQL_DIR / "migrations" / "009_arxiv_papers_search.sql").read_text(encoding="utf-8"))
+
+    load_sec = None if args.reuse else round(load_rows(pg, args.rows), 1)
+    stats = pg.execute_query(
+        """
+        SELECT (SELECT COUNT(*) FROM arxiv_papers) AS rows,
+               pg_size_pretty(pg_relation_size('idx_search_vector')) AS index_size,
+               pg_size_pretty(pg_total_relation_size('arxiv_papers')) AS table_size
+        """,
+        first=True,
+    )
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "rows": stats.rows,
+        "load_sec": load_sec,
+        "index_size": stats.index_size,
+        "table_size": stats.table_size,
+        "limit": args.limit,
+        "results": run(pg, args.repeat, args.baseline_repeat, args.limit),
+    }
+
+    out = Path(args.out)
+    if out.suffix != ".json":
+        out = out / f"search_{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"results saved to {out}")
+
+
+if __name__ == "__main__":
+    main()
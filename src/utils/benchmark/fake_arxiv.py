@@ -0,0 +1,116 @@
+"""
+fake_arxiv.py
+離線用的 arXiv API: 在本機起一個 HTTP server, 依 search_query / start / max_results 回傳合成的 Atom feed
+內容由 (category, index) 決定, 同樣的參數每次產生一樣的資料, benchmark 結果可以互相比較
+
+with FakeArxivServer(papers_per_category=10000) as server:
+    client = arxiv.Client(page_size=1000, delay_seconds=0)
+    client.query_url_format = server.query_url_format
+"""
+
+import random
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+BASE_TIME = datetime(2025, 1, 1, tzinfo=timezone.utc)
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+WORDS = (
+    "learning neural graph model transformer data optimal bound stochastic quantum robust "
+    "network inference kernel sparse adaptive agent language vision policy theorem"
+).split()
+
+
+def _sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def synthetic_entry(category: str, index: int) -> str:
+    """第 index 篇 (由新到舊) 的 <entry>, 摘要長度接近真實資料 (~1 KB)"""
+    rng = random.Random(f"{category}:{index}")
+    arxiv_id = f"http://arxiv.org/abs/{category.replace('.', '')}.{index:07d}v1"
+    published = BASE_TIME - timedelta(minutes=index)
+    updated = published + timedelta(days=rng.randint(0, 30))
+    authors = "".join(
+        f"<author><name>{escape(_sentence(rng, 2).title())}</name></author>" for _ in range(rng.randint(1, 8))
+    )
+    extra = rng.sample(["cs.AI", "cs.LG", "cs.CL", "stat.ML", "math.ST"], 2)
+    categories = "".join(f'<category term="{c}" scheme="http://arxiv.org/schemas/atom"/>' for c in [category, *extra])
+    return (
+        f"<entry><id>{arxiv_id}</id>"
+        f"<updated>{updated.strftime(TIME_FORMAT)}</updated>"
+        f"<published>{published.strftime(TIME_FORMAT)}</published>"
+        f"<title>{escape(_sentence(rng, 10))}</title>"
+        f"<summary>{escape(_sentence(rng, 150))}</summary>"
+        f"{authors}"
+        f'<link href="{arxiv_id}" rel="alternate" type="text/html"/>'
+        f'<link title="pdf" href="{arxiv_id.replace("abs", "pdf")}" rel="related" type="application/pdf"/>'
+        f'<arxiv:primary_category xmlns:arxiv="http://arxiv.org/schemas/atom" term="{category}" '
+        f'scheme="http://arxiv.org/schemas/atom"/>'
+        f"{categories}</entry>"
+    )
+
+
+def synthetic_feed(category: str, start: int, max_results: int, total: int) -> str:
+    entries = "".join(synthetic_entry(category, i) for i in range(start, min(start + max_results, total)))
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">'
+        f"<title>arXiv Query</title><id>fake</id><updated>{BASE_TIME.strftime(TIME_FORMAT)}</updated>"
+        f"<opensearch:totalResults>{total}</opensearch:totalResults>"
+        f"<opensearch:startIndex>{start}</opensearch:startIndex>"
+        f"<opensearch:itemsPerPage>{max_results}</opensearch:itemsPerPage>"
+        f"{entries}</feed>"
+    )
+
+
+class FakeArxivServer:
+    def __init__(self, papers_per_category: int = 1000, host: str = "127.0.0.1"):
+        self.papers_per_category = papers_per_category
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                match = re.search(r"cat:(\S+)", query.get("search_query", [""])[0])
+                category = match.group(1) if match else "cs.AI"
+                start = int(query.get("start", ["0"])[0])
+                max_results = int(query.get("max_results", ["100"])[0])
+                body = synthetic_feed(category, start, max_results, server.papers_per_category).encode("utf-8")
+                server.requests += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "application/atom+xml")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._httpd = ThreadingHTTPServer((host, 0), Handler)
+        self._thread = None
+
+    @property
+    def query_url_format(self) -> str:
+        """設給 arxiv.Client.query_url_format"""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api/query?{{}}"
+
+    def start(self) -> "FakeArxivServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "FakeArxivServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -14,30 +14,78 @@ CREATE TABLE etl.raw_batches (
     etl_status varchar(20) DEFAULT 'pending',  -- pending, processing, success, failed
     etl_started_at timestamptz NULL,
     etl_finished_at timestamptz NULL,
-    error_msg text NULL
+    error_msg text NULL,
+    lease_owner text NULL,                     -- 認領的 ETL worker id
+    lease_expires_at timestamptz NULL,         -- lease 到期時間, 到期後可被重新認領
+    attempts int NOT NULL DEFAULT 0            -- 已認領次數, 達 etl.max_attempts 標成 failed
 );
+CREATE INDEX idx_raw_batches_claimable ON etl.raw_batches (batch_id) WHERE etl_status IN ('pending', 'processing');
+
+-- 建立 etl.quarantine_rows：ETL 寫入失敗的單筆資料 (二分重試後仍失敗)
+CREATE TABLE etl.quarantine_rows (
+    id BIGSERIAL PRIMARY KEY,
+    table_name TEXT NOT NULL,            -- 原本要寫入的資料表
+    entry_id TEXT,
+    s3_path TEXT,                        -- 來源 raw / parquet 檔案
+    error_msg TEXT,
+    row_data JSONB,                      -- 欄位名稱 -> 值
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+CREATE INDEX idx_quarantine_s3_path ON etl.quarantine_rows (s3_path);
+
+-- 建立 etl.keyword_df / etl.keyword_corpus：關鍵字擷取的 document frequency 與總文章數 (ETL 每個檔案完成時累加)
+CREATE TABLE etl.keyword_df (
+    term TEXT PRIMARY KEY,
+    df BIGINT NOT NULL                   -- 包含這個字的文章數
+);
+CREATE TABLE etl.keyword_corpus (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),  -- 只有一列
+    num_docs BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+INSERT INTO etl.keyword_corpus (id, num_docs) VALUES (TRUE, 0);
 
 -- 建立 papers.downloaded_papers：儲存下載成功或失敗的論文記錄
+-- 依 last_attempt 每月一個 partition, 由 python -m src.core.partitions 建立 (Lambda 啟動時也會檢查)
 CREATE TABLE papers.downloaded_papers (
-    entry_id varchar(50) PRIMARY KEY,          -- arXiv ID，例如 2501.12345v2
+    entry_id varchar(50) NOT NULL,             -- arXiv ID，例如 2501.12345v2
     category varchar(50) NOT NULL,             -- cs_AI, cs_LG, ...
     status varchar(20) NOT NULL DEFAULT 'downloaded',  -- downloaded, failed, etc.
-    last_attempt timestamptz NULL,             -- 最後嘗試時間
+    last_attempt timestamptz NOT NULL DEFAULT now(),  -- 最後嘗試時間 (partition key)
     error_msg text NULL,                       -- 下載錯誤訊息
     etl_status varchar(20) DEFAULT 'pending',  -- pending, success, failed
     etl_batch_id varchar(50) NULL,             -- 對應 raw_batches 批次
     etl_processed_at timestamptz NULL,         -- ETL 完成時間
+    PRIMARY KEY (entry_id, last_attempt),      -- partition key 必須在 PK 裡
     CONSTRAINT downloaded_papers_etl_batch_fkey
         FOREIGN KEY (etl_batch_id)
         REFERENCES etl.raw_batches(batch_id)
         ON DELETE SET NULL
+) PARTITION BY RANGE (last_attempt);
+CREATE TABLE papers.downloaded_papers_default PARTITION OF papers.downloaded_papers DEFAULT;
+
+-- 建立 papers.downloaded_entries：每個 entry_id 一列, downloaded_papers 分區後的 PK 含 last_attempt, 改由這裡去重
+CREATE TABLE papers.downloaded_entries (
+    entry_id varchar(50) PRIMARY KEY,          -- arXiv ID
+    first_seen timestamptz NOT NULL DEFAULT now()  -- 第一次寫入 downloaded_papers 的時間
 );
+CREATE INDEX idx_downloaded_entries_first_seen ON papers.downloaded_entries (first_seen);
 
 -- 建立 papers.category_progress：紀錄各領域的處理進度
 CREATE TABLE papers.category_progress (
     category_name TEXT PRIMARY KEY,  -- 領域名稱
-    status TEXT DEFAULT '',          -- NULL 或 'Finished'
-    updated_at TIMESTAMP DEFAULT NOW()
+    status TEXT DEFAULT '',          -- '', 'Finished' 或 'Failed' (失敗次數達上限)
+    updated_at TIMESTAMP DEFAULT NOW(),
+    last_published TIMESTAMPTZ NULL, -- 已看過最新的 published
+    last_updated TIMESTAMPTZ NULL,   -- 已看過最新的 updated (incremental 模式的 watermark)
+    ckpt_offset INT NULL,            -- checkpoint: 已處理到的 API 結果位置
+    ckpt_batch INT NULL,             -- checkpoint: 下一個 batch 編號
+    ckpt_until TIMESTAMPTZ NULL,     -- checkpoint: incremental 查詢區間的結束時間
+    ckpt_published TIMESTAMPTZ NULL, -- checkpoint: 目前看過最新的 published
+    ckpt_updated TIMESTAMPTZ NULL,   -- checkpoint: 目前看過最新的 updated
+    ckpt_at TIMESTAMPTZ NULL,
+    attempts INT NOT NULL DEFAULT 0, -- 連續失敗次數
+    last_error TEXT NULL
 );
 
 -- 建立 papers.category_run_stats：記錄各領域執行時間與數據量統計
@@ -46,7 +94,11 @@ CREATE TABLE papers.category_run_stats (
     time_sec FLOAT,
     s3_count INT,
     pg_count INT,
-    updated_at TIMESTAMP DEFAULT NOW()
+    updated_at TIMESTAMP DEFAULT NOW(),
+    api_requests INT,                -- 呼叫 arXiv API 次數 (含 retry)
+    records_per_sec FLOAT,           -- 新文章數 / 執行時間
+    rate_wait_sec FLOAT,             -- 等待共用 rate limiter 的時間
+    concurrency INT                  -- 同時抓取的領域數
 );
 
 -- 建立 arxiv_papers：主表，存放論文的最新版本資訊
@@ -69,23 +121,32 @@ CREATE TABLE arxiv_papers (
     version INT DEFAULT 1,
     keywords TEXT[],       -- NLP 關鍵字
     topic TEXT,            -- 細分小領域
-    s3_path TEXT
+    s3_path TEXT,
+    content_hash TEXT,     -- 內容欄位的 hash, upsert 模式用來判斷是否有變動
+    -- 全文檢索 (title 權重 A, summary 權重 B), 寫入時由 PG 計算
+    search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english'::regconfig, coalesce(summary, '')), 'B')
+    ) STORED
 );
 
 -- 建立索引：加速查詢 arxiv_papers
-CREATE INDEX idx_category ON arxiv_papers (primary_category);
-CREATE INDEX idx_published ON arxiv_papers (published_date);
+-- 查詢 API 的 keyset 分頁: ORDER BY published_date DESC, entry_id DESC
+CREATE INDEX idx_published_entry ON arxiv_papers (published_date, entry_id);
+CREATE INDEX idx_category_published_entry ON arxiv_papers (primary_category, published_date, entry_id);
 CREATE INDEX idx_authors ON arxiv_papers USING GIN (authors);
 CREATE INDEX idx_categories ON arxiv_papers USING GIN (categories);
 CREATE INDEX idx_links ON arxiv_papers USING GIN (links);
 CREATE INDEX idx_affiliations ON arxiv_papers USING GIN (affiliations);
+CREATE INDEX idx_search_vector ON arxiv_papers USING GIN (search_vector);
 
 -- 建立 arxiv_papers_history：用於紀錄歷史版本與 ETL 操作歷程
+-- 依 etl_timestamp 每月一個 partition, 保留期限外的月份整個 DETACH / DROP
 CREATE TABLE arxiv_papers_history (
-    history_id TEXT PRIMARY KEY,         -- 唯一歷史紀錄ID，由 Python 生成
+    history_id TEXT NOT NULL,            -- 唯一歷史紀錄ID，由 Python 生成
     entry_id TEXT NOT NULL,              -- 對應主表
-    version BIGINT NOT NULL,             -- 版本
-    etl_timestamp TIMESTAMPTZ DEFAULT now(),
+    version BIGINT NOT NULL,             -- 版本 (寫入時的 epoch 秒, append / upsert 模式相同)
+    etl_timestamp TIMESTAMPTZ NOT NULL DEFAULT now(),  -- partition key
     etl_stage TEXT,                      -- ETL 階段描述
     title TEXT,
     authors TEXT[],
@@ -101,5 +162,8 @@ CREATE TABLE arxiv_papers_history (
     keywords TEXT[],
     topic TEXT,
     s3_path TEXT,
-    operation_type TEXT NOT NULL DEFAULT 'insert'  -- insert / update / delete
-);
+    operation_type TEXT NOT NULL DEFAULT 'insert',  -- insert / update / delete
+    PRIMARY KEY (history_id, etl_timestamp)
+) PARTITION BY RANGE (etl_timestamp);
+CREATE TABLE arxiv_papers_history_default PARTITION OF arxiv_papers_history DEFAULT;
+CREATE INDEX idx_history_entry_id ON arxiv_papers_history (entry_id);
@@ -0,0 +1,4 @@
+-- 各領域的 high-water mark, incremental 模式只抓這之後更新的文章
+ALTER TABLE papers.category_progress
+    ADD COLUMN IF NOT EXISTS last_published TIMESTAMPTZ NULL,  -- 已看過最新的 published
+    ADD COLUMN IF NOT EXISTS last_updated TIMESTAMPTZ NULL;    -- 已看過最新的 updated (watermark)
@@ -0,0 +1,6 @@
+-- 平行抓取各領域時的吞吐量統計
+ALTER TABLE papers.category_run_stats
+    ADD COLUMN IF NOT EXISTS api_requests INT,       -- 呼叫 arXiv API 次數 (含 retry)
+    ADD COLUMN IF NOT EXISTS records_per_sec FLOAT,  -- 新文章數 / 執行時間
+    ADD COLUMN IF NOT EXISTS rate_wait_sec FLOAT,    -- 等待共用 rate limiter 的時間
+    ADD COLUMN IF NOT EXISTS concurrency INT;        -- 同時抓取的領域數
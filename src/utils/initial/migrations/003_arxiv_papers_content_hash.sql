@@ -0,0 +1,5 @@
+-- upsert 模式用 content_hash 判斷文章內容是否變動
+-- 既有資料為 NULL, 第一次重新載入時會被視為變動更新一次 (version + 1)
+-- 改成 upsert 前先用 python -m src.etl.hash_backfill 補上, 避免全部文章重寫一次並各寫一份 history
+ALTER TABLE arxiv_papers
+    ADD COLUMN IF NOT EXISTS content_hash TEXT;
@@ -0,0 +1,12 @@
+-- ETL 寫入失敗的單筆資料 (二分重試後仍失敗), 保留錯誤訊息與來源檔案方便修正後重跑
+CREATE TABLE IF NOT EXISTS etl.quarantine_rows (
+    id BIGSERIAL PRIMARY KEY,
+    table_name TEXT NOT NULL,            -- 原本要寫入的資料表
+    entry_id TEXT,
+    s3_path TEXT,                        -- 來源 raw / parquet 檔案
+    error_msg TEXT,
+    row_data JSONB,                      -- 欄位名稱 -> 值
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_quarantine_s3_path ON etl.quarantine_rows (s3_path);
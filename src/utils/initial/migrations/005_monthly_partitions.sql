@@ -0,0 +1,90 @@
+-- arxiv_papers_history 依 etl_timestamp, papers.downloaded_papers 依 last_attempt 改成每月一個 range partition
+-- - partition key 必須包含在 primary key 裡, 所以 PK 改成 (history_id, etl_timestamp) / (entry_id, last_attempt)
+-- - 先把資料搬進 DEFAULT partition, 之後執行 python -m src.core.partitions 會把每個月份拆成自己的 partition
+--   並預先建立未來幾個月 (Lambda 每次啟動也會檢查)
+-- - 已經是 partitioned table 就跳過, 可以重複執行
+
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'public.arxiv_papers_history'::regclass) = 'p' THEN
+        RAISE NOTICE 'arxiv_papers_history is already partitioned';
+        RETURN;
+    END IF;
+
+    ALTER TABLE arxiv_papers_history RENAME TO arxiv_papers_history_legacy;
+    ALTER TABLE arxiv_papers_history_legacy RENAME CONSTRAINT arxiv_papers_history_pkey TO arxiv_papers_history_legacy_pkey;
+
+    CREATE TABLE arxiv_papers_history (
+        history_id TEXT NOT NULL,
+        entry_id TEXT NOT NULL,
+        version BIGINT NOT NULL,
+        etl_timestamp TIMESTAMPTZ NOT NULL DEFAULT now(),
+        etl_stage TEXT,
+        title TEXT,
+        authors TEXT[],
+        affiliations JSONB,
+        summary TEXT,
+        primary_category TEXT,
+        categories TEXT[],
+        published TIMESTAMPTZ,
+        updated TIMESTAMPTZ,
+        journal_ref TEXT,
+        doi TEXT,
+        links JSONB,
+        keywords TEXT[],
+        topic TEXT,
+        s3_path TEXT,
+        operation_type TEXT NOT NULL DEFAULT 'insert',
+        PRIMARY KEY (history_id, etl_timestamp)
+    ) PARTITION BY RANGE (etl_timestamp);
+    CREATE TABLE arxiv_papers_history_default PARTITION OF arxiv_papers_history DEFAULT;
+    CREATE INDEX idx_history_entry_id ON arxiv_papers_history (entry_id);
+
+    INSERT INTO arxiv_papers_history (
+        history_id, entry_id, version, etl_timestamp, etl_stage, title, authors, affiliations,
+        summary, primary_category, categories, published, updated, journal_ref, doi, links,
+        keywords, topic, s3_path, operation_type
+    )
+    SELECT
+        history_id, entry_id, version, coalesce(etl_timestamp, now()), etl_stage, title, authors, affiliations,
+        summary, primary_category, categories, published, updated, journal_ref, doi, links,
+        keywords, topic, s3_path, operation_type
+    FROM arxiv_papers_history_legacy;
+
+    DROP TABLE arxiv_papers_history_legacy;
+END $$;
+
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'papers.downloaded_papers'::regclass) = 'p' THEN
+        RAISE NOTICE 'papers.downloaded_papers is already partitioned';
+        RETURN;
+    END IF;
+
+    ALTER TABLE papers.downloaded_papers RENAME TO downloaded_papers_legacy;
+    ALTER TABLE papers.downloaded_papers_legacy RENAME CONSTRAINT downloaded_papers_pkey TO downloaded_papers_legacy_pkey;
+    ALTER TABLE papers.downloaded_papers_legacy RENAME CONSTRAINT downloaded_papers_etl_batch_fkey TO downloaded_papers_legacy_etl_batch_fkey;
+
+    CREATE TABLE papers.downloaded_papers (
+        entry_id varchar(50) NOT NULL,
+        category varchar(50) NOT NULL,
+        status varchar(20) NOT NULL DEFAULT 'downloaded',
+        last_attempt timestamptz NOT NULL DEFAULT now(),
+        error_msg text NULL,
+        etl_status varchar(20) DEFAULT 'pending',
+        etl_batch_id varchar(50) NULL,
+        etl_processed_at timestamptz NULL,
+        PRIMARY KEY (entry_id, last_attempt),
+        CONSTRAINT downloaded_papers_etl_batch_fkey
+            FOREIGN KEY (etl_batch_id)
+            REFERENCES etl.raw_batches(batch_id)
+            ON DELETE SET NULL
+    ) PARTITION BY RANGE (last_attempt);
+    CREATE TABLE papers.downloaded_papers_default PARTITION OF papers.downloaded_papers DEFAULT;
+
+    INSERT INTO papers.downloaded_papers
+    SELECT entry_id, category, status, coalesce(last_attempt, now()), error_msg, etl_status, etl_batch_id, etl_processed_at
+    FROM papers.downloaded_papers_legacy;
+
+    DROP TABLE papers.downloaded_papers_legacy;
+END $$;
@@ -0,0 +1,15 @@
+-- ETL 以 lease 認領檔案: 認領時記錄 worker 與到期時間, 執行中定期延長
+-- 到期沒延長 (Lambda timeout / crash) 的檔案會被其他 worker 重新認領, attempts 達上限才標成 failed
+ALTER TABLE etl.raw_batches
+    ADD COLUMN IF NOT EXISTS lease_owner TEXT NULL,             -- 認領的 worker id
+    ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ NULL, -- lease 到期時間
+    ADD COLUMN IF NOT EXISTS attempts INT NOT NULL DEFAULT 0;   -- 已認領次數
+
+-- 舊版卡在 processing 的檔案沒有 lease, 視為已到期讓新版重新認領
+UPDATE etl.raw_batches
+SET lease_expires_at = now()
+WHERE etl_status = 'processing' AND lease_expires_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_raw_batches_claimable
+    ON etl.raw_batches (batch_id)
+    WHERE etl_status IN ('pending', 'processing');
@@ -0,0 +1,12 @@
+-- collector 每個 batch 寫入 PG 時, 在同一個 transaction 記錄領域的抓取進度 (checkpoint)
+-- Lambda timeout / 失敗後重新執行時從 checkpoint 繼續, 領域完成時清空
+-- 失敗的領域不再標成 Finished, attempts 達 source_papers.collect_max_attempts 才標成 Failed
+ALTER TABLE papers.category_progress
+    ADD COLUMN IF NOT EXISTS ckpt_offset INT NULL,              -- 已處理到的 API 結果位置 (下一次從這裡開始)
+    ADD COLUMN IF NOT EXISTS ckpt_batch INT NULL,               -- 下一個 batch 編號
+    ADD COLUMN IF NOT EXISTS ckpt_until TIMESTAMPTZ NULL,       -- incremental 查詢區間的結束時間, 續抓時沿用
+    ADD COLUMN IF NOT EXISTS ckpt_published TIMESTAMPTZ NULL,   -- 目前看過最新的 published
+    ADD COLUMN IF NOT EXISTS ckpt_updated TIMESTAMPTZ NULL,     -- 目前看過最新的 updated
+    ADD COLUMN IF NOT EXISTS ckpt_at TIMESTAMPTZ NULL,          -- checkpoint 寫入時間
+    ADD COLUMN IF NOT EXISTS attempts INT NOT NULL DEFAULT 0,   -- 連續失敗次數
+    ADD COLUMN IF NOT EXISTS last_error TEXT NULL;
@@ -0,0 +1,6 @@
+-- 查詢 API 以 (published_date, entry_id) 做 keyset 分頁 (由新到舊), 加上依 primary_category 篩選的版本
+-- 兩個複合索引的前綴涵蓋原本的 idx_published / idx_category, 舊索引移除以免 ETL 寫入時多維護兩個索引
+CREATE INDEX IF NOT EXISTS idx_published_entry ON arxiv_papers (published_date, entry_id);
+CREATE INDEX IF NOT EXISTS idx_category_published_entry ON arxiv_papers (primary_category, published_date, entry_id);
+DROP INDEX IF EXISTS idx_published;
+DROP INDEX IF EXISTS idx_category;
@@ -0,0 +1,11 @@
+-- title / summary 的全文檢索: 加權 tsvector (title = A, summary = B) 與 GIN 索引
+-- generated column 由 PG 在每次 INSERT / UPDATE 時計算, ETL 的 insert_mogrify / copy_merge / upsert 都不需要改
+-- (欄位在最後面, 依欄位順序寫入的 INSERT 不會對應到它)
+-- 加欄位會重寫整張表, 大表請在離峰時間執行
+ALTER TABLE arxiv_papers
+    ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english'::regconfig, coalesce(summary, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_search_vector ON arxiv_papers USING GIN (search_vector);
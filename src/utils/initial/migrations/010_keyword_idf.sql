@@ -0,0 +1,14 @@
+-- ETL 關鍵字擷取 (src/etl/keywords.py) 用的 corpus 統計: 每個字出現在幾篇文章 (document frequency) 與總文章數
+-- ETL 每個檔案完成時累加 (跟 etl.raw_batches 的完成同一個 transaction), python -m src.etl.keywords --backfill 會從 arxiv_papers 整個重算
+CREATE TABLE IF NOT EXISTS etl.keyword_df (
+    term TEXT PRIMARY KEY,
+    df BIGINT NOT NULL                   -- 包含這個字的文章數
+);
+
+CREATE TABLE IF NOT EXISTS etl.keyword_corpus (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),  -- 只有一列
+    num_docs BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+INSERT INTO etl.keyword_corpus (id, num_docs) VALUES (TRUE, 0) ON CONFLICT (id) DO NOTHING;
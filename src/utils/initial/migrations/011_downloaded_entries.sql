@@ -0,0 +1,22 @@
+-- migration 005 把 papers.downloaded_papers 的 PK 改成 (entry_id, last_attempt) 之後, ON CONFLICT 不再依 entry_id 去重
+-- 改由不分區的 papers.downloaded_entries (entry_id PK) 保證每個 entry_id 只有一列:
+-- collector 寫入 downloaded_papers 前先 INSERT ... ON CONFLICT DO NOTHING RETURNING 到這張表, 只寫入回傳的 entry_id
+-- (retention DETACH 舊的 downloaded_papers partition 時這裡保留, 已抓過的文章不會重抓)
+-- 可以重複執行
+CREATE TABLE IF NOT EXISTS papers.downloaded_entries (
+    entry_id varchar(50) PRIMARY KEY,
+    first_seen timestamptz NOT NULL DEFAULT now()
+);
+-- Bloom filter 去重 (dedup_index) 冷啟動時只補 first_seen > 上次存檔時間的 entry_id
+CREATE INDEX IF NOT EXISTS idx_downloaded_entries_first_seen ON papers.downloaded_entries (first_seen);
+
+INSERT INTO papers.downloaded_entries (entry_id, first_seen)
+SELECT entry_id, min(last_attempt)
+FROM papers.downloaded_papers
+GROUP BY entry_id
+ON CONFLICT (entry_id) DO NOTHING;
+
+-- 清掉 PK 變更後重複寫入的列, 每個 entry_id 只留最早的一列
+DELETE FROM papers.downloaded_papers d
+USING papers.downloaded_entries e
+WHERE d.entry_id = e.entry_id AND d.last_attempt > e.first_seen;
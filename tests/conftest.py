@@ -0,0 +1,45 @@
+"""
+共用的 fixture
+需要 PostgreSQL 的測試 (pg fixture) 預設跳過: 設定 POSTGRES_* 並設 PIPELINE_TEST_PG=1 才會執行
+會寫入 etl.raw_batches 等資料表, 請指向測試用的資料庫
+S3 用 moto (s3 fixture), 不會連到真的 AWS
+"""
+
+import os
+
+import psycopg2
+import pytest
+
+
+@pytest.fixture(scope="session")
+def pg():
+    if os.getenv("PIPELINE_TEST_PG") != "1":
+        pytest.skip("set PIPELINE_TEST_PG=1 and POSTGRES_* to run tests against PostgreSQL")
+    from src.core.pg_engine import PsqlEngine
+
+    try:
+        engine = PsqlEngine()
+        with engine.transaction() as cur:
+            cur.execute("SELECT 1")
+    except psycopg2.Error as e:
+        pytest.skip(f"PostgreSQL is not reachable: {e}")
+    return engine
+
+
+BUCKET = "pytest-bucket"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """moto 的 S3 client, 已建立 BUCKET"""
+    # moto 需要假的 credentials, 避免用到真的 AWS
+    for name, value in (("AWS_ACCESS_KEY_ID", "pytest"), ("AWS_SECRET_ACCESS_KEY", "pytest"),
+                        ("AWS_DEFAULT_REGION", "ap-northeast-1")):
+        monkeypatch.setenv(name, value)
+    import boto3
+    from moto import mock_aws
+
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": "ap-northeast-1"})
+        yield client
@@ -0,0 +1,104 @@
+"""src.api.papers: keyset cursor 的編碼 / 解碼, 查詢組裝與 response cache (不需要 PostgreSQL)"""
+
+import base64
+from datetime import date
+
+import pytest
+
+from src.api.papers import (
+    CursorError, PaperFilter, ResponseCache, build_list_query, build_search_query, decode_cursor,
+    decode_search_cursor, encode_cursor,
+)
+
+
+def test_list_cursor_round_trip():
+    cursor = encode_cursor(date(2025, 1, 31), "http://arxiv.org/abs/2501.00001v2")
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+    assert decode_cursor(cursor) == (date(2025, 1, 31), "http://arxiv.org/abs/2501.00001v2")
+
+
+def test_search_cursor_round_trip():
+    cursor = encode_cursor(0.0759909, "http://arxiv.org/abs/2501.00001v1")
+    assert decode_search_cursor(cursor) == (0.0759909, "http://arxiv.org/abs/2501.00001v1")
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    _b64(b"not json"),
+    _b64(b'["2025-01-01"]'),
+    _b64(b'["2025-01-01", "a", "b"]'),
+    _b64(b'["yesterday", "a"]'),
+    _b64(b"42"),
+    _b64(b"\xff\xfe"),
+])
+def test_invalid_list_cursor(cursor):
+    with pytest.raises(CursorError):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize("cursor", [_b64(b'["high", "a"]'), _b64(b'[null, "a"]'), _b64(b"{}")])
+def test_invalid_search_cursor(cursor):
+    with pytest.raises(CursorError):
+        decode_search_cursor(cursor)
+
+
+def test_list_query_without_cursor():
+    stmt, params = build_list_query(PaperFilter(), None, 20)
+    assert "WHERE published_date IS NOT NULL ORDER BY published_date DESC, entry_id DESC LIMIT %s" in stmt
+    assert params == [21]
+
+
+def test_list_query_with_filters_and_cursor():
+    flt = PaperFilter(primary_category="cs.AI", categories=("cs.AI", "cs.LG"), author="Ada Lovelace",
+                      published_from=date(2025, 1, 1), published_to=date(2025, 2, 1))
+    stmt, params = build_list_query(flt, (date(2025, 1, 15), "id-9"), 10)
+    assert stmt.count("%s") == len(params)
+    assert "(published_date, entry_id) < (%s, %s)" in stmt
+    assert params == ["cs.AI", ["cs.AI", "cs.LG"], "Ada Lovelace", date(2025, 1, 1), date(2025, 2, 1),
+                      date(2025, 1, 15), "id-9", 11]
+
+
+def test_search_query_params_line_up():
+    flt = PaperFilter(primary_category="cs.CL")
+    stmt, params = build_search_query("graph neural", flt, (0.5, "id-3"), 5)
+    assert stmt.count("%s") == len(params)
+    assert params[1:] == ["graph neural", "cs.CL", 0.5, "id-3", 6]
+    stmt, params = build_search_query("graph", PaperFilter(), None, 5, headline=False)
+    assert "ts_headline" not in stmt and params == ["graph", 6]
+
+
+def test_response_cache_hits_and_clear():
+    cache = ResponseCache(maxsize=10, ttl=60)
+    calls = []
+    load = lambda: calls.append(1) or len(calls)
+    assert cache.get_or_load("k", load) == 1
+    assert cache.get_or_load("k", load) == 1
+    cache.clear()
+    assert cache.get_or_load("k", load) == 2
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 2, "invalidations": 1}
+
+
+def test_response_cache_drops_results_loaded_before_clear():
+    cache = ResponseCache(maxsize=10, ttl=60)
+
+    def load():
+        cache.clear()  # 查詢期間有檔案寫入完成
+        return "stale"
+
+    assert cache.get_or_load("k", load) == "stale"
+    assert cache.stats()["size"] == 0
+
+
+def test_response_cache_does_not_store_errors():
+    cache = ResponseCache(maxsize=10, ttl=60)
+
+    def fail():
+        raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("k", fail)
+    assert cache.get_or_load("k", lambda: "ok") == "ok"
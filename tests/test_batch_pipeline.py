@@ -0,0 +1,110 @@
+"""src.extract.batch_pipeline: 背景上傳的結果收集、錯誤回傳給 producer 與 queue 滿時的 backpressure"""
+
+import threading
+import time
+
+import pytest
+
+from src.extract.batch_pipeline import BatchPipeline
+
+
+def test_results_are_collected():
+    pipeline = BatchPipeline(lambda i: i * 2, workers=3, max_pending=2)
+    for i in range(10):
+        pipeline.submit(i)
+    assert sorted(pipeline.close()) == [i * 2 for i in range(10)]
+
+
+def test_worker_error_reaches_producer_and_later_batches_are_discarded():
+    started = threading.Event()
+    discarded = []
+
+    def upload(i):
+        if i == 1:
+            started.set()
+            raise RuntimeError("S3 is down")
+        time.sleep(0.01)
+        return i
+
+    pipeline = BatchPipeline(upload, workers=1, max_pending=10, discard=discarded.append)
+    pipeline.submit(0)
+    pipeline.submit(1)
+    assert started.wait(1)
+    time.sleep(0.05)  # 等 worker 記下錯誤
+    # producer 下一次 submit 就拿到背景的錯誤
+    with pytest.raises(RuntimeError, match="S3 is down"):
+        pipeline.submit(2)
+    with pytest.raises(RuntimeError, match="S3 is down"):
+        pipeline.close()
+    assert discarded == [1]
+
+
+def test_queued_batches_after_error_go_to_discard():
+    release = threading.Event()
+    discarded = []
+
+    def upload(i):
+        release.wait(1)
+        if i == 0:
+            raise ValueError("bad batch")
+        return i
+
+    pipeline = BatchPipeline(upload, workers=1, max_pending=5, discard=discarded.append)
+    for i in range(4):
+        pipeline.submit(i)
+    release.set()
+    with pytest.raises(ValueError):
+        pipeline.close()
+    assert sorted(discarded) == [0, 1, 2, 3]
+
+
+def test_full_queue_blocks_producer():
+    """上傳跟不上時 submit 會等待, 不會無限制累積 batch"""
+    def upload(i):
+        time.sleep(0.2)
+        return i
+
+    pipeline = BatchPipeline(upload, workers=1, max_pending=1)
+    start = time.monotonic()
+    pipeline.submit(0)  # worker 拿走, 開始上傳
+    time.sleep(0.02)
+    pipeline.submit(1)  # 放進 queue
+    assert pipeline.blocked_sec < 0.1
+    pipeline.submit(2)  # queue 滿了, 等 batch 0 上傳完
+    assert time.monotonic() - start >= 0.15
+    assert pipeline.blocked_sec >= 0.15
+    assert sorted(pipeline.close()) == [0, 1, 2]
+
+
+def test_blocked_submit_resumes_when_worker_frees_a_slot():
+    release = threading.Event()
+    pipeline = BatchPipeline(lambda i: release.wait(1) and i, workers=1, max_pending=1)
+    pipeline.submit(0)
+    time.sleep(0.02)
+    pipeline.submit(1)
+    done = threading.Event()
+    producer = threading.Thread(target=lambda: (pipeline.submit(2), done.set()))
+    producer.start()
+    assert not done.wait(0.1)
+    release.set()
+    assert done.wait(1)
+    producer.join()
+    assert sorted(pipeline.close()) == [0, 1, 2]
+
+
+def test_abort_discards_pending_batches():
+    release = threading.Event()
+    discarded = []
+    pipeline = BatchPipeline(lambda i: release.wait(1) and i, workers=1, max_pending=5, discard=discarded.append)
+    for i in range(3):
+        pipeline.submit(i)
+    time.sleep(0.02)
+    aborter = threading.Thread(target=pipeline.abort)
+    aborter.start()
+    time.sleep(0.02)  # abort 先記下錯誤, 再讓 batch 0 完成
+    release.set()
+    aborter.join()
+    # 已經開始的 batch 0 照常完成, 還在 queue 的交給 discard
+    assert discarded == [1, 2]
+    with pytest.raises(RuntimeError, match="aborted"):
+        pipeline.close()
@@ -0,0 +1,98 @@
+"""src.core.bloom 與 src.extract.dedup_index: Bloom filter 的序列化、計數與 claim_new 的去重 (不需要 PostgreSQL / S3)"""
+
+import threading
+
+import pytest
+
+from src.core.bloom import BloomFilter
+from src.extract.dedup_index import DedupIndex, SetIndex
+
+
+def test_round_trip():
+    bloom = BloomFilter.for_capacity(1000, 0.01)
+    bloom.update(f"id-{i}" for i in range(500))
+    loaded = BloomFilter.from_bytes(bloom.to_bytes())
+    assert (loaded.num_bits, loaded.num_hashes, loaded.count) == (bloom.num_bits, bloom.num_hashes, bloom.count)
+    assert loaded.bits == bloom.bits
+    assert all(f"id-{i}" in loaded for i in range(500))
+
+
+def test_invalid_blobs():
+    data = BloomFilter.for_capacity(100, 0.01).to_bytes()
+    with pytest.raises(ValueError):
+        BloomFilter.from_bytes(b"XXXX" + data[4:])
+    with pytest.raises(ValueError):
+        BloomFilter.from_bytes(data[:-1])
+
+
+def test_false_positive_rate_near_design():
+    bloom = BloomFilter.for_capacity(10000, 0.01)
+    bloom.update(f"in-{i}" for i in range(10000))
+    false_positives = sum(f"out-{i}" in bloom for i in range(10000))
+    assert false_positives < 10000 * 0.02
+
+
+def test_re_adding_does_not_inflate_count():
+    bloom = BloomFilter.for_capacity(1000, 0.001)
+    assert bloom.add("a") is True
+    assert bloom.add("a") is False
+    bloom.update(f"id-{i}" for i in range(300))
+    count = bloom.count
+    # cold start 重新讀到上次已加入的 id
+    bloom.update(f"id-{i}" for i in range(300))
+    assert bloom.count == count <= 301
+
+
+class StubIndex(DedupIndex):
+    """_existing_in_db 改成查記憶體的 set"""
+
+    def __init__(self, in_db: set[str]):
+        super().__init__(pg=None, s3=None, bucket="bucket", s3_key="key", capacity=1000, error_rate=0.01)
+        self.bloom = BloomFilter.for_capacity(1000, 0.01)
+        self.bloom.update(in_db)
+        self.in_db = in_db
+        self.queried = []
+
+    def _existing_in_db(self, entry_ids):
+        self.db_checks += 1
+        self.queried.append(list(entry_ids))
+        return {e for e in entry_ids if e in self.in_db}
+
+
+def test_claim_new_checks_maybe_ids_in_one_query():
+    index = StubIndex({"old-1", "old-2"})
+    assert index.claim_new(["new-1", "old-1", "new-2", "new-1", "old-2"]) == ["new-1", "new-2"]
+    # Bloom filter 判斷「一定沒有」的不查 DB, 「可能存在」的整頁一次查
+    assert len(index.queried) == 1 and {"old-1", "old-2"} <= set(index.queried[0])
+    assert index.dirty
+    # 本次已登記的不再回傳, 也不用查 DB
+    assert index.claim_new(["new-1", "new-2"]) == []
+    assert "new-1" in index and "old-1" in index and "never" not in index
+
+
+def test_claim_new_after_discard_is_claimed_again():
+    index = StubIndex(set())
+    assert index.claim_new(["a"]) == ["a"]
+    index.discard("a")
+    # filter 裡還有 a, 但 DB 查不到, 仍是新的
+    assert index.claim_new(["a"]) == ["a"]
+
+
+@pytest.mark.parametrize("make", [lambda: StubIndex(set()), SetIndex])
+def test_concurrent_claims_do_not_overlap(make):
+    index = make()
+    ids = [f"id-{i}" for i in range(200)]
+    claimed = []
+    lock = threading.Lock()
+
+    def worker():
+        got = index.claim_new(ids)
+        with lock:
+            claimed.extend(got)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(claimed) == sorted(ids)
@@ -0,0 +1,136 @@
+"""src.extract.checkpoint: batch 不依順序完成時 checkpoint 的推進, 與 ckpt_* 的寫入 / 續抓 / 失敗次數"""
+
+import random
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from src.extract import checkpoint
+from src.extract.checkpoint import Checkpoint, CheckpointTracker
+
+CATEGORY = "pytest.ckpt"
+T0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def ckpt(batch: int) -> Checkpoint:
+    """第 batch - 1 個 batch 寫入後的 checkpoint (每個 batch 100 筆)"""
+    return Checkpoint(offset=batch * 100, batch=batch, until=T0)
+
+
+def commit(tracker: CheckpointTracker, c: Checkpoint) -> Checkpoint | None:
+    """跟 arxiv_collector.finish_batch 相同的呼叫順序, 回傳寫進 DB 的 checkpoint"""
+    with tracker.lock:
+        latest = tracker.advance_to(c)
+        tracker.record(c)
+    return latest
+
+
+def test_in_order_batches_advance_each_time():
+    tracker = CheckpointTracker(Checkpoint(until=T0))
+    assert [commit(tracker, ckpt(b)) for b in (1, 2, 3)] == [ckpt(1), ckpt(2), ckpt(3)]
+    assert tracker.committed == ckpt(3)
+
+
+def test_out_of_order_batches_wait_for_earlier_ones():
+    tracker = CheckpointTracker(Checkpoint(until=T0))
+    # batch 2、1 先完成, batch 0 還沒寫入, checkpoint 不能跳過它
+    assert commit(tracker, ckpt(3)) is None
+    assert commit(tracker, ckpt(2)) is None
+    assert tracker.committed == Checkpoint(until=T0)
+    # batch 0 完成後一次推進到 batch 2 之後
+    assert commit(tracker, ckpt(1)) == ckpt(3)
+    assert tracker.committed == ckpt(3) and not tracker._ready
+
+
+def test_advance_to_does_not_record():
+    tracker = CheckpointTracker(Checkpoint(until=T0))
+    assert tracker.advance_to(ckpt(1)) == ckpt(1)
+    # 寫入失敗 (沒有 record) 時不推進
+    assert tracker.committed == Checkpoint(until=T0)
+    assert commit(tracker, ckpt(2)) is None
+
+
+def test_resume_from_checkpoint_continues_batch_numbers():
+    tracker = CheckpointTracker(ckpt(5))
+    assert commit(tracker, ckpt(7)) is None
+    assert commit(tracker, ckpt(6)) == ckpt(7)
+
+
+def test_concurrent_random_completion_order_ends_at_last_batch():
+    tracker = CheckpointTracker(Checkpoint(until=T0))
+    order = list(range(1, 41))
+    random.Random(0).shuffle(order)
+    written = []
+    lock = threading.Lock()
+
+    def worker(batches):
+        for b in batches:
+            latest = commit(tracker, ckpt(b))
+            if latest is not None:
+                with lock:
+                    written.append(latest.batch)
+
+    threads = [threading.Thread(target=worker, args=(order[i::4],)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert tracker.committed == ckpt(40)
+    # 寫進 DB 的 checkpoint 只會往前 (lock 包住 advance_to 與 record)
+    assert written == sorted(written) and written[-1] == 40
+
+
+# -------------------------------
+# papers.category_progress (需要 PostgreSQL, 見 conftest.pg)
+# -------------------------------
+@pytest.fixture
+def category(pg):
+    def cleanup():
+        pg.execute_cmd("DELETE FROM papers.category_progress WHERE category_name = %s", (CATEGORY,))
+
+    cleanup()
+    pg.execute_cmd("INSERT INTO papers.category_progress (category_name) VALUES (%s)", (CATEGORY,))
+    yield CATEGORY
+    cleanup()
+
+
+def test_save_and_load(pg, category):
+    assert checkpoint.load(pg, category) is None
+    saved = Checkpoint(offset=300, batch=3, until=T0, newest_published=T0, newest_updated=T0)
+    with pg.transaction() as cur:
+        checkpoint.save(cur, category, saved)
+    assert checkpoint.load(pg, category) == saved
+
+
+def test_fail_keeps_checkpoint_until_max_attempts(pg, category):
+    saved = ckpt(2)
+    with pg.transaction() as cur:
+        checkpoint.save(cur, category, saved)
+    assert checkpoint.fail(pg, category, "timeout", max_attempts=3) == ""
+    assert checkpoint.fail(pg, category, "timeout", max_attempts=3) == ""
+    # 失敗後仍從同一個 checkpoint 繼續
+    assert checkpoint.load(pg, category) == saved
+    assert checkpoint.fail(pg, category, "timeout", max_attempts=3) == "Failed"
+    row = pg.execute_query(
+        "SELECT status, attempts, last_error FROM papers.category_progress WHERE category_name = %s",
+        first=True, params=(category,),
+    )
+    assert (row.status, row.attempts, row.last_error) == ("Failed", 3, "timeout")
+
+
+def test_complete_clears_checkpoint_and_advances_watermark(pg, category):
+    later = datetime(2025, 2, 1, tzinfo=timezone.utc)
+    with pg.transaction() as cur:
+        checkpoint.save(cur, category, ckpt(4))
+    checkpoint.fail(pg, category, "boom", max_attempts=3)
+    checkpoint.complete(pg, category, later, later)
+    assert checkpoint.load(pg, category) is None
+    # watermark 只會往前
+    checkpoint.complete(pg, category, T0, T0)
+    row = pg.execute_query(
+        "SELECT status, attempts, last_error, last_published, last_updated FROM papers.category_progress "
+        "WHERE category_name = %s", first=True, params=(category,),
+    )
+    assert (row.status, row.attempts, row.last_error) == ("Finished", 0, None)
+    assert row.last_published == later and row.last_updated == later
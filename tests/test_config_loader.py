@@ -0,0 +1,119 @@
+"""src.core.config_loader: ETag 重新確認、304 沿用、設定錯誤時保留舊設定與 /tmp 的本機 cache (moto, 見 conftest.s3)"""
+
+import pydantic
+import pytest
+
+from src.core.config_loader import ConfigLoader
+from tests.conftest import BUCKET
+
+KEY = "config/config.yaml"
+
+
+class Spy:
+    """記錄每次 get_object 的參數與結果 (200 / 304)"""
+
+    def __init__(self, client):
+        self.client = client
+        self.gets = []
+
+    def get_object(self, **kwargs):
+        try:
+            obj = self.client.get_object(**kwargs)
+        except Exception as e:
+            self.gets.append((kwargs, getattr(e, "response", {}).get("Error", {}).get("Code")))
+            raise
+        self.gets.append((kwargs, 200))
+        return obj
+
+
+def put(s3, batch_size: int):
+    s3.put_object(Bucket=BUCKET, Key=KEY, Body=f"etl:\n  etl_batch_size: {batch_size}\n".encode())
+
+
+@pytest.fixture
+def loader(s3, tmp_path):
+    def make(revalidate_seconds: float = 0):
+        return ConfigLoader(BUCKET, KEY, str(tmp_path / "config.yaml"), revalidate_seconds, s3=Spy(s3))
+    return make
+
+
+def test_first_load_downloads_and_writes_local_cache(s3, loader, tmp_path):
+    put(s3, 100)
+    config = loader().get()
+    assert config.etl.etl_batch_size == 100
+    assert (tmp_path / "config.yaml").exists() and (tmp_path / "config.yaml.etag").exists()
+
+
+def test_no_request_within_revalidate_window(s3, loader):
+    put(s3, 100)
+    cached = loader(revalidate_seconds=3600)
+    first = cached.get()
+    put(s3, 200)
+    assert cached.get() is first
+    assert len(cached.s3.gets) == 1
+    # force 時不管時間直接確認
+    assert cached.get(force=True).etl.etl_batch_size == 200
+
+
+def test_unchanged_object_is_not_downloaded_again(s3, loader):
+    put(s3, 100)
+    cached = loader()
+    first = cached.get()
+    assert cached.get() is first
+    (kwargs, status), = cached.s3.gets[1:]
+    assert kwargs["IfNoneMatch"] == cached._etag and status in ("304", "NotModified")
+
+
+def test_changed_object_is_reloaded(s3, loader):
+    put(s3, 100)
+    cached = loader()
+    cached.get()
+    old_etag = cached._etag
+    put(s3, 250)
+    assert cached.get().etl.etl_batch_size == 250
+    assert cached._etag != old_etag
+    assert cached.s3.gets[-1][1] == 200
+
+
+def test_invalid_config_keeps_previous(s3, loader):
+    put(s3, 100)
+    cached = loader()
+    cached.get()
+    put(s3, 0)  # etl_batch_size 必須 > 0
+    assert cached.get().etl.etl_batch_size == 100
+    # 修正後再次載入
+    put(s3, 300)
+    assert cached.get().etl.etl_batch_size == 300
+
+
+def test_invalid_config_without_previous_raises(s3, loader):
+    put(s3, 0)
+    with pytest.raises(pydantic.ValidationError):
+        loader().get()
+
+
+def test_s3_error_keeps_cached_config(s3, loader):
+    put(s3, 100)
+    cached = loader()
+    cached.get()
+    s3.delete_object(Bucket=BUCKET, Key=KEY)
+    assert cached.get().etl.etl_batch_size == 100
+
+
+def test_new_process_uses_local_cache_with_304(s3, loader):
+    put(s3, 100)
+    loader().get()
+    # 同一個執行環境重新 import: 從 /tmp 讀取, 向 S3 確認只拿到 304
+    reloaded = loader()
+    assert reloaded.get().etl.etl_batch_size == 100
+    (kwargs, status), = reloaded.s3.gets
+    assert "IfNoneMatch" in kwargs and status in ("304", "NotModified")
+
+
+def test_local_cache_for_another_key_is_ignored(s3, loader, tmp_path):
+    put(s3, 100)
+    loader().get()
+    s3.put_object(Bucket=BUCKET, Key="other.yaml", Body=b"etl:\n  etl_batch_size: 7\n")
+    other = ConfigLoader(BUCKET, "other.yaml", str(tmp_path / "config.yaml"), 0, s3=Spy(s3))
+    assert other.get().etl.etl_batch_size == 7
+    assert "IfNoneMatch" not in other.s3.gets[0][0]
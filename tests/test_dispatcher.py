@@ -0,0 +1,64 @@
+"""src.etl.dispatcher.plan: 依待處理量、平均處理時間與 DB 連線預算決定要開幾個 ETL worker (純計算)"""
+
+import pytest
+
+from src.core.config import EtlConfig
+from src.etl.dispatcher import DEFAULT_FILE_SECONDS, plan, worker_connections
+
+
+def conf(**kwargs) -> EtlConfig:
+    base = dict(dispatch_max_workers=5, dispatch_db_connections=100, dispatch_target_seconds=600,
+                file_concurrency=1, pending_gz_batch=10)
+    return EtlConfig(**{**base, **kwargs})
+
+
+@pytest.mark.parametrize("backlog, avg_file_sec, kwargs, target", [
+    (0, 10, {}, 0),                                      # 沒有待處理檔案
+    (1, 10, {}, 1),                                      # 工作量很小也至少 1 個
+    (60, 10, {}, 1),                                     # 600 秒內一個 worker 做得完
+    (61, 10, {}, 2),
+    (300, 10, {}, 5),                                    # 3000 秒 / 600
+    (10_000, 10, {}, 5),                                 # 上限 dispatch_max_workers
+    (10_000, 10, {"dispatch_db_connections": 7}, 3),     # 連線預算: 7 // (db_writers 1 + 1)
+    (10_000, 10, {"file_concurrency": 2, "dispatch_db_connections": 7}, 2),  # 每個 worker 3 條
+    (10_000, 10, {"dispatch_db_connections": 1}, 1),     # 預算不夠一個 worker 時仍保留 1 個
+    (300, 10, {"file_concurrency": 5}, 1),               # worker 內同時處理 5 個檔案
+    (300, None, {}, 5),                                  # 沒有最近的處理紀錄用 DEFAULT_FILE_SECONDS
+    (300, 1, {}, 1),
+])
+def test_target_workers(backlog, avg_file_sec, kwargs, target):
+    assert plan(backlog, 0, avg_file_sec, conf(**kwargs)).target_workers == target
+
+
+@pytest.mark.parametrize("backlog, active, target, launch", [
+    (300, 0, 5, 5),
+    (300, 2, 5, 3),     # 扣掉還持有 lease 的 worker
+    (300, 7, 5, 0),     # 已經超過目標時不再開
+    (30, 3, 1, 0),      # 待處理量下降, 結束的 worker 不再補上
+    (0, 0, 0, 0),
+])
+def test_launch_subtracts_active_workers(backlog, active, target, launch):
+    result = plan(backlog, active, 10, conf())
+    assert (result.target_workers, result.launch) == (target, launch)
+
+
+@pytest.mark.parametrize("backlog, kwargs, launch, claim_size", [
+    (300, {}, 5, 10),                                        # 每個最多 pending_gz_batch
+    (130, {"dispatch_target_seconds": 100}, 5, 10),
+    (12, {"dispatch_target_seconds": 30}, 4, 3),             # 平均分給新 worker
+    (7, {"dispatch_target_seconds": 10}, 5, 2),              # 無條件進位
+    (1, {}, 1, 1),
+])
+def test_claim_size_splits_backlog(backlog, kwargs, launch, claim_size):
+    result = plan(backlog, 0, 10, conf(**kwargs))
+    assert (result.launch, result.claim_size) == (launch, claim_size)
+    assert result.launch * result.claim_size >= min(backlog, result.launch * conf(**kwargs).pending_gz_batch)
+
+
+def test_default_file_seconds_is_reported():
+    assert plan(10, 0, None, conf()).avg_file_sec == DEFAULT_FILE_SECONDS
+
+
+def test_worker_connections_follow_db_writers():
+    assert worker_connections(conf(file_concurrency=4)) == 5
+    assert worker_connections(conf(file_concurrency=4, db_writers=2)) == 3
@@ -0,0 +1,67 @@
+"""src.etl.keywords: 斷字、詞頻矩陣與 TF-IDF top_k, 跟逐筆的實作 (bench_keywords) 比對 (不需要 PostgreSQL)"""
+
+import subprocess
+import sys
+
+import numpy as np
+
+from src.etl.keywords import DocumentFrequency, term_matrix, tokenize, top_keywords
+from src.utils.benchmark.bench_keywords import (
+    MIN_DF, TITLE_WEIGHT, TOP_K, corpus_stats, legacy_keywords, synthetic_papers, vectorized_keywords,
+)
+
+
+def test_tokenize_lowercases_and_tracks_documents():
+    tokens, doc = tokenize(["Graph Neural Nets", "GPT-4 and state-of-the-art", "", "x y z"])
+    assert tokens.tolist() == [b"graph", b"neural", b"nets", b"gpt-4", b"and", b"state-of-the-art"]
+    assert doc.tolist() == [0, 0, 0, 1, 1, 1]
+
+
+def test_term_matrix_weights_title_and_drops_stopwords():
+    m = term_matrix(["Graph Transformers", "Diffusion"], ["the graph of graph models", "diffusion diffusion"], 2.0)
+    assert m.terms.tolist() == ["diffusion", "graph", "transformers"]
+    assert list(zip(m.doc.tolist(), m.terms[m.term].tolist(), m.tf.tolist())) == [
+        (0, "graph", 4.0), (0, "transformers", 2.0), (1, "diffusion", 4.0),
+    ]
+    assert m.document_frequency().tolist() == [1, 1, 1]
+
+
+def test_term_matrix_without_content_words():
+    m = term_matrix(["The"], ["and the of"])
+    assert m.num_docs == 1 and not len(m.terms)
+
+
+def test_top_keywords_matches_legacy():
+    titles, summaries = synthetic_papers(400, seed=3)
+    stats = corpus_stats(titles, summaries)
+    df = dict(zip(stats[0].tolist(), stats[1].tolist()))
+    expected = legacy_keywords(titles[:150], summaries[:150], df, stats[2])
+    assert vectorized_keywords(titles[:150], summaries[:150], stats) == expected
+    assert all(len(words) == TOP_K for words in expected)
+
+
+def test_top_keywords_min_df_and_empty_documents():
+    m = term_matrix(["Rare Common", "", "Common"], ["", "", ""], TITLE_WEIGHT)
+    df = np.array([3, 1])  # common, rare
+    assert top_keywords(m, df, 10, TOP_K, MIN_DF) == [["common"], [], ["common"]]
+
+
+def test_document_frequency_accumulates_batches():
+    titles, summaries = synthetic_papers(300, seed=5)
+    stats = DocumentFrequency()
+    for i in range(0, 300, 70):
+        stats.add(term_matrix(titles[i:i + 70], summaries[i:i + 70], TITLE_WEIGHT))
+    terms, df, num_docs = corpus_stats(titles, summaries)
+    assert stats.num_docs == num_docs == 300
+    assert stats.terms.tolist() == terms.tolist()
+    assert stats.df.tolist() == df.tolist()
+    probe = np.array(["aaaa-missing", terms[0], terms[-1]], dtype=str)
+    probe.sort()
+    assert stats.lookup(probe).tolist() == [dict(zip(terms.tolist(), df.tolist())).get(t, 0) for t in probe]
+    assert DocumentFrequency().lookup(terms[:3]).tolist() == [0, 0, 0]
+
+
+def test_etl_import_does_not_load_numpy():
+    """keywords.enabled 為 false 時 ETL 的 cold start 不需要 numpy"""
+    code = "import sys, src.etl.arxiv_etl; sys.exit('numpy' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
@@ -0,0 +1,120 @@
+"""src.etl.leases 的認領 / 完成 / 失敗 / 到期重新認領 (需要 PostgreSQL, 見 conftest.pg)"""
+
+import time
+
+import pytest
+
+from src.etl import leases
+
+# batch_id 排在一般資料前面, 認領時 (ORDER BY batch_id) 先拿到測試用的列
+PREFIX = "000-pytest-"
+W1, W2 = "pytest-w1", "pytest-w2"
+
+
+@pytest.fixture
+def raw_batches(pg):
+    def add(n: int, **columns):
+        names = ["batch_id", "category", "s3_path", *columns]
+        for i in range(n):
+            values = [f"{PREFIX}{i}", "cs.AI", f"{PREFIX}{i}.jsonl.gz", *columns.values()]
+            pg.execute_cmd(
+                f"INSERT INTO etl.raw_batches ({', '.join(names)}) VALUES ({', '.join(['%s'] * len(names))})",
+                tuple(values),
+            )
+        return [f"{PREFIX}{i}.jsonl.gz" for i in range(n)]
+
+    def rows():
+        return {
+            r.s3_path: r for r in pg.execute_query(
+                "SELECT s3_path, etl_status, lease_owner, attempts, error_msg FROM etl.raw_batches "
+                "WHERE batch_id LIKE %s", params=(PREFIX + "%",),
+            )
+        }
+
+    def cleanup():
+        pg.execute_cmd("DELETE FROM etl.raw_batches WHERE batch_id LIKE %s", (PREFIX + "%",))
+        for worker in (W1, W2):
+            leases.release(pg, worker)
+
+    cleanup()
+    yield add, rows
+    cleanup()
+
+
+def test_claim_is_exclusive(pg, raw_batches):
+    add, rows = raw_batches
+    keys = add(3)
+    first = leases.claim(pg, W1, 2, 60, 3)
+    second = leases.claim(pg, W2, 1, 60, 3)
+    assert sorted(r.s3_path for r in first) == keys[:2]
+    assert [r.s3_path for r in second] == keys[2:]
+    state = rows()
+    assert [state[k].lease_owner for k in keys] == [W1, W1, W2]
+    assert all(state[k].attempts == 1 for k in keys)
+
+
+def test_finish_only_by_owner(pg, raw_batches):
+    add, rows = raw_batches
+    key, = add(1)
+    leases.claim(pg, W1, 1, 60, 3)
+    applied = []
+    assert leases.finish(pg, W2, key, None, on_finish=applied.append) is False
+    assert applied == [] and rows()[key].etl_status == "processing"
+    assert leases.finish(pg, W1, key, None, on_finish=applied.append) is True
+    assert len(applied) == 1
+    assert rows()[key].etl_status == "finished" and rows()[key].lease_owner is None
+
+
+def test_on_finish_error_rolls_back(pg, raw_batches):
+    add, rows = raw_batches
+    key, = add(1)
+    leases.claim(pg, W1, 1, 60, 3)
+
+    def boom(cur):
+        raise RuntimeError("stats failed")
+
+    with pytest.raises(RuntimeError):
+        leases.finish(pg, W1, key, None, on_finish=boom)
+    assert rows()[key].etl_status == "processing" and rows()[key].lease_owner == W1
+
+
+def test_fail_retries_until_max_attempts(pg, raw_batches):
+    add, rows = raw_batches
+    key, = add(1)
+    for attempt in (1, 2):
+        leases.claim(pg, W1, 1, 60, 2)
+        leases.fail(pg, W1, key, None, "boom", 2)
+        assert rows()[key].attempts == attempt
+    assert rows()[key].etl_status == "failed" and rows()[key].error_msg == "boom"
+    leases.claim(pg, W1, 1, 60, 2)
+    assert rows()[key].etl_status == "failed"
+
+
+def test_expired_lease_is_reclaimed(pg, raw_batches):
+    add, rows = raw_batches
+    key, = add(1)
+    leases.claim(pg, W2 + "-crashed", 1, 1, 3)
+    time.sleep(1.1)
+    reclaimed = leases.claim(pg, W2, 1, 60, 3)
+    assert [r.s3_path for r in reclaimed] == [key]
+    assert rows()[key].lease_owner == W2 and rows()[key].attempts == 2
+
+
+def test_release_does_not_count_as_attempt(pg, raw_batches):
+    add, rows = raw_batches
+    key, = add(1)
+    leases.claim(pg, W1, 1, 60, 3)
+    leases.release(pg, W1)
+    assert rows()[key].etl_status == "pending" and rows()[key].attempts == 0
+
+
+def test_heartbeat_extends_own_leases(pg, raw_batches):
+    add, rows = raw_batches
+    keys = add(2)
+    leases.claim(pg, W1, 2, 1, 3)
+    with leases.LeaseHeartbeat(pg, W1, 60, interval=0.2) as hb:
+        time.sleep(1.3)
+    assert hb.beats >= 1
+    # lease 已延長, 到期時間過了也不會被其他 worker 認領
+    leases.claim(pg, W2, 2, 60, 3)
+    assert [rows()[k].lease_owner for k in keys] == [W1, W1]
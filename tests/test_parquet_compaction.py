@@ -0,0 +1,71 @@
+"""src.etl.parquet_compaction: 合併後的 Parquet 經 ETL 讀回的 record 與 raw jsonl 相同, --reload 依 manifest 載入 (moto)"""
+
+import gzip
+import json
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from src.core.config import CompactionConfig
+from src.etl import arxiv_etl, parquet_compaction
+from tests.conftest import BUCKET
+
+CONF = CompactionConfig(row_group_size=4, max_records_per_file=10)
+DAY = "2025-02-01"
+
+
+def record(i: int) -> dict:
+    return {
+        "entry_id": f"http://arxiv.org/abs/2501.{i:05d}v1",
+        "title": f"Paper {i}",
+        "authors": ["Ada Lovelace", "Alan Turing"],
+        "summary": "We study\ngraphs.",
+        "primary_category": "cs.AI",
+        "categories": ["cs.AI", "cs.LG"],
+        # 跨兩個 published_month 分區
+        "published": f"2025-0{1 + i % 2}-01T00:00:00+00:00",
+        "updated": "2025-02-01T12:30:00+00:00",
+        "journal_ref": None,
+        "doi": None,
+    }
+
+
+@pytest.fixture
+def compacted(s3, monkeypatch):
+    """raw 分區 3 個檔案共 30 筆, 合併後回傳 (raw records, manifest)"""
+    monkeypatch.setattr(arxiv_etl, "get_s3", lambda: s3)
+    records = [record(i) for i in range(30)]
+    for n in range(3):
+        body = "".join(json.dumps(r) + "\n" for r in records[n * 10:(n + 1) * 10])
+        key = f"{parquet_compaction.raw_prefix('cs.AI', DAY)}batch-{n}.jsonl.gz"
+        s3.put_object(Bucket=BUCKET, Key=key, Body=gzip.compress(body.encode()))
+    return records, parquet_compaction.compact_partition(s3, BUCKET, CONF, "cs.AI", DAY)
+
+
+def test_etl_reads_parquet_as_raw_records(compacted):
+    records, manifest = compacted
+    # 每個月 15 筆, 每 12 筆 (3 個 row group) 換檔
+    assert manifest["records"] == 30 and len(manifest["outputs"]) == 4
+    read = [r for out in manifest["outputs"] for r in arxiv_etl.iter_s3_records(BUCKET, out["key"])]
+    assert all(r.pop("source_key").startswith("raw/cs_AI/") for r in read)
+    assert sorted(read, key=lambda r: r["entry_id"]) == records
+
+
+def test_reload_loads_manifest_outputs(compacted, s3, monkeypatch):
+    _, manifest = compacted
+    loaded = []
+    monkeypatch.setattr(arxiv_etl, "WRITE_MODE", "upsert", raising=False)
+    monkeypatch.setattr(arxiv_etl, "load_s3_gzip_to_pg", lambda bucket, key, etl_stage: loaded.append((key, etl_stage)))
+
+    result = parquet_compaction.reload_partition(s3, BUCKET, CONF, "cs.AI", DAY)
+    assert result == {"category": "cs.AI", "date": DAY, "records": 30, "files": 4}
+    assert loaded == [(out["key"], "reload") for out in manifest["outputs"]]
+    assert list(parquet_compaction.list_manifests(s3, BUCKET, CONF)) == [("cs.AI", DAY)]
+    assert parquet_compaction.reload_partition(s3, BUCKET, CONF, "cs.AI", "2025-02-02") is None
+
+
+def test_reload_refuses_append_mode(compacted, s3, monkeypatch):
+    monkeypatch.setattr(arxiv_etl, "WRITE_MODE", "append", raising=False)
+    with pytest.raises(ValueError, match="upsert"):
+        parquet_compaction.reload_partition(s3, BUCKET, CONF, "cs.AI", DAY)
@@ -0,0 +1,78 @@
+"""PsqlEngine 的 COPY text format 序列化 (copy_line / CopyStream / copy_rows) 與寫入筆數指標"""
+
+from datetime import date, datetime, timezone
+
+from psycopg2.extras import Json
+
+from src.core import metrics
+from src.core.pg_engine import CopyStream, copy_line
+
+
+def test_copy_line_escapes_special_characters():
+    row = ("a\tb", "line1\nline2\r", "back\\slash", None)
+    assert copy_line(row) == "a\\tb\tline1\\nline2\\r\tback\\\\slash\t\\N\n"
+
+
+def test_copy_line_scalar_types():
+    ts = datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    row = (True, False, 42, 1.5, ts, date(2025, 1, 2))
+    assert copy_line(row) == "t\tf\t42\t1.5\t2025-01-02T03:04:05+00:00\t2025-01-02\n"
+
+
+def test_copy_line_arrays_and_json():
+    row = (["A B", 'say "hi"', None], [], {"k": "值"}, Json({"a": 1}))
+    line = copy_line(row)
+    assert line == '{"A B","say \\\\"hi\\\\"",NULL}\t{}\t{"k": "值"}\t{"a": 1}\n'
+
+
+def test_copy_stream_reads_in_any_size():
+    rows = [(i, f"text {i}", ["x", "y"]) for i in range(100)]
+    expected = "".join(copy_line(r) for r in rows)
+    stream = CopyStream(iter(rows))
+    parts = []
+    while True:
+        part = stream.read(37)
+        if not part:
+            break
+        assert len(part) <= 37
+        parts.append(part)
+    assert "".join(parts) == expected
+    assert CopyStream(iter(rows)).read() == expected
+
+
+def test_copy_rows_round_trip(pg):
+    rows = [
+        ("p1", "tab\there\nnew line", ["A", 'B "quoted"', "back\\slash"], {"x": [1, 2]},
+         datetime(2025, 1, 1, tzinfo=timezone.utc), None),
+        ("p2", None, [], {}, None, 3),
+    ]
+    with pg.transaction(cursor_factory=None) as cur:
+        cur.execute(
+            "CREATE TEMP TABLE copy_test (id text, body text, authors text[], meta jsonb, ts timestamptz, n int) "
+            "ON COMMIT DROP"
+        )
+        pg.copy_rows(cur, "copy_test", rows, ["id", "body", "authors", "meta", "ts", "n"])
+        cur.execute("SELECT id, body, authors, meta, ts, n FROM copy_test ORDER BY id")
+        assert [tuple(r) for r in cur.fetchall()] == rows
+
+
+def test_rows_metric_counts_rows_actually_written(pg, monkeypatch):
+    recorded = []
+    monkeypatch.setattr(metrics, "record_rows", lambda table, rows, seconds: recorded.append((table, rows)))
+    pg._run(lambda cur: cur.execute(
+        "DROP TABLE IF EXISTS pytest_rows; CREATE TABLE pytest_rows (id int PRIMARY KEY, v text)"
+    ), cursor_factory=None)
+    try:
+        pg.insert_mogrify("pytest_rows", [(1, "a"), (2, "b")])
+        # ON CONFLICT DO NOTHING 跳過的不算
+        pg.insert_mogrify("pytest_rows", [(2, "b"), (3, "c")])
+        pg.copy_merge("pytest_rows", [(1, "a"), (3, "c"), (4, "d")])
+        # upsert 內容沒變的不算
+        upsert = (
+            "INSERT INTO pytest_rows AS t SELECT * FROM {staging} ON CONFLICT (id) DO UPDATE SET v = EXCLUDED.v "
+            "WHERE t.v IS DISTINCT FROM EXCLUDED.v RETURNING id"
+        )
+        assert pg.stage_merge("pytest_rows", [(1, "a"), (2, "changed"), (4, "d")], upsert) == [(2,)]
+        assert recorded == [("pytest_rows", 2), ("pytest_rows", 1), ("pytest_rows", 1), ("pytest_rows", 1)]
+    finally:
+        pg._run(lambda cur: cur.execute("DROP TABLE pytest_rows"), cursor_factory=None)
@@ -0,0 +1,88 @@
+"""PsqlEngine._run: COMMIT 之前斷線才重試, COMMIT 時斷線只有 idempotent 的呼叫端重試 (不需要 PostgreSQL)"""
+
+from contextlib import contextmanager
+
+import psycopg2
+import pytest
+
+from src.core.pg_engine import PsqlEngine
+
+
+class FakeDb:
+    """
+    每次 transaction 依 plan 決定在哪裡斷線: "execute" 在 statement 執行時, "commit" 在 server 已 commit 之後
+    committed 記錄真正寫進 DB 的 statement
+    """
+
+    def __init__(self, plan):
+        self.plan = list(plan)
+        self.committed = []
+        self.transactions = 0
+
+    @contextmanager
+    def transaction(self, cursor_factory=None):
+        self.transactions += 1
+        phase = self.plan.pop(0) if self.plan else None
+        pending = []
+        db = self
+
+        class Cursor:
+            def execute(self, stmt, params=None):
+                if phase == "execute":
+                    raise psycopg2.OperationalError("server closed the connection unexpectedly")
+                pending.append(stmt)
+
+        yield Cursor()
+        db.committed.extend(pending)
+        if phase == "commit":
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(PsqlEngine, "connect_db", lambda self: self)
+    return PsqlEngine()
+
+
+def use(monkeypatch, db: FakeDb):
+    monkeypatch.setattr(PsqlEngine, "transaction", lambda self, cursor_factory=None: db.transaction(cursor_factory))
+
+
+def test_disconnect_before_commit_is_retried(engine, monkeypatch):
+    db = FakeDb(["execute"])
+    use(monkeypatch, db)
+    engine._run(lambda cur: cur.execute("INSERT 1"), cursor_factory=None)
+    assert db.transactions == 2
+    assert db.committed == ["INSERT 1"]
+
+
+def test_disconnect_during_commit_is_not_retried(engine, monkeypatch):
+    db = FakeDb(["commit"])
+    use(monkeypatch, db)
+    with pytest.raises(psycopg2.OperationalError):
+        engine._run(lambda cur: cur.execute("INSERT 1"), cursor_factory=None)
+    # server 端已經 commit, 重試會寫兩次
+    assert db.transactions == 1
+    assert db.committed == ["INSERT 1"]
+
+
+def test_idempotent_caller_retries_after_commit_disconnect(engine, monkeypatch):
+    db = FakeDb(["commit"])
+    use(monkeypatch, db)
+    engine._run(lambda cur: cur.execute("SELECT 1"), cursor_factory=None, idempotent=True)
+    assert db.transactions == 2
+
+
+def test_server_error_is_not_retried(engine, monkeypatch):
+    db = FakeDb([])
+    use(monkeypatch, db)
+
+    class StatementTimeout(psycopg2.OperationalError):
+        pgcode = "57014"
+
+    def fail(cur):
+        raise StatementTimeout("canceling statement due to statement timeout")
+
+    with pytest.raises(psycopg2.OperationalError):
+        engine._run(fail, cursor_factory=None)
+    assert db.transactions == 1
@@ -0,0 +1,92 @@
+"""src.etl.arxiv_etl: 寫入失敗時對半拆批次, 找出壞資料隔離到 etl.quarantine_rows (不需要 PostgreSQL)"""
+
+import json
+
+import psycopg2
+import pytest
+
+from src.etl import arxiv_etl
+
+COLUMNS = ["entry_id", "title"]
+
+
+class FakePg:
+    """_run 把自己當 cursor 傳給 fn, 記錄隔離的 INSERT; fail 有值時模擬隔離寫入失敗"""
+
+    def __init__(self, fail: Exception | None = None):
+        self.fail = fail
+        self.inserted = []
+
+    def _run(self, fn, cursor_factory=None):
+        if self.fail is not None:
+            raise self.fail
+        return fn(self)
+
+    def execute(self, stmt, params=None):
+        self.inserted.append(params)
+
+
+class FakeWriter:
+    """title 含 NUL 的 row 跟 psycopg2 一樣 raise ValueError, 整批不寫入"""
+
+    def __init__(self):
+        self.written = []
+        self.calls = 0
+
+    def __call__(self, rows):
+        self.calls += 1
+        if any("\x00" in r[1] for r in rows):
+            raise ValueError("A string literal cannot contain NUL (0x00) characters.")
+        self.written.extend(rows)
+
+
+def batch():
+    rows = [(f"id-{i}", f"title {i}") for i in range(8)]
+    rows[5] = ("id-5", "broken\x00title")
+    return rows
+
+
+def test_bad_row_is_quarantined_and_others_written(monkeypatch):
+    fake = FakePg()
+    monkeypatch.setattr(arxiv_etl, "pg", fake)
+    write = FakeWriter()
+
+    assert arxiv_etl.safe_insert("arxiv_papers", batch(), "raw/a.jsonl.gz", write=write, columns=COLUMNS) == 1
+    assert sorted(r[0] for r in write.written) == [f"id-{i}" for i in range(8) if i != 5]
+    assert len(fake.inserted) == 1
+    table, entry_id, s3_path, error_msg, row_data = fake.inserted[0]
+    assert (table, entry_id, s3_path) == ("arxiv_papers", "id-5", "raw/a.jsonl.gz")
+    assert "NUL" in error_msg
+    # JSONB 不接受 \u0000, 要先拿掉
+    dumped = row_data.dumps(row_data.adapted)
+    assert "\\u0000" not in dumped
+    assert json.loads(dumped) == {"entry_id": "id-5", "title": "brokentitle"}
+
+
+def test_good_batch_is_written_once(monkeypatch):
+    fake = FakePg()
+    monkeypatch.setattr(arxiv_etl, "pg", fake)
+    write = FakeWriter()
+    rows = [(f"id-{i}", "ok") for i in range(8)]
+    assert arxiv_etl.safe_insert("arxiv_papers", rows, "raw/a.jsonl.gz", write=write, columns=COLUMNS) == 0
+    assert write.calls == 1 and write.written == rows and not fake.inserted
+
+
+def test_quarantine_failure_fails_the_file(monkeypatch):
+    monkeypatch.setattr(arxiv_etl, "pg", FakePg(fail=psycopg2.OperationalError("server closed the connection")))
+    with pytest.raises(psycopg2.OperationalError):
+        arxiv_etl.safe_insert("arxiv_papers", batch(), "raw/a.jsonl.gz", write=FakeWriter(), columns=COLUMNS)
+
+
+def test_non_row_errors_are_not_bisected(monkeypatch):
+    monkeypatch.setattr(arxiv_etl, "pg", FakePg())
+
+    def write(rows):
+        raise psycopg2.OperationalError("connection lost")
+
+    with pytest.raises(psycopg2.OperationalError):
+        arxiv_etl.safe_insert("arxiv_papers", batch(), "raw/a.jsonl.gz", write=write, columns=COLUMNS)
+
+
+def test_strip_nul_nested():
+    assert arxiv_etl.strip_nul({"a\x00": ["x\x00y", ("z\x00",)], "n": 1}) == {"a": ["xy", ["z"]], "n": 1}
@@ -0,0 +1,102 @@
+"""src.core.rate_limit.TokenBucket 與 src.extract.arxiv_client.RateLimitedClient: 多個 thread 共用時整體仍維持每 N 秒一次請求"""
+
+import threading
+import time
+
+import arxiv
+import pytest
+import requests
+
+from src.core import rate_limit
+from src.core.rate_limit import TokenBucket
+from src.extract.arxiv_client import RateLimitedClient
+
+
+class FakeClock:
+    """取代 rate_limit 裡的 time: sleep 直接把時間往前推"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def test_one_token_per_interval_with_fake_clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    bucket = TokenBucket.per_interval(3)
+    granted = []
+    for _ in range(5):
+        bucket.acquire()
+        granted.append(clock.now)
+    # 第一個 token 一開始就有, 之後每 3 秒一個
+    assert granted == pytest.approx([0, 3, 6, 9, 12])
+
+
+def test_idle_time_does_not_accumulate_beyond_burst(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    bucket = TokenBucket.per_interval(3, burst=2)
+    bucket.acquire()
+    clock.now = 100  # 閒置很久, 最多也只累積 burst 個
+    assert [bucket.acquire() for _ in range(3)] == pytest.approx([0, 0, 3])
+
+
+def test_invalid_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_shared_bucket_limits_all_threads():
+    interval = 0.05
+    bucket = TokenBucket.per_interval(interval)
+    granted = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(4):
+            bucket.acquire()
+            with lock:
+                granted.append(time.monotonic())
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    granted.sort()
+    assert len(granted) == 16
+    # 4 個 thread 合計仍是每 interval 一次 (容許 timer 誤差)
+    gaps = [b - a for a, b in zip(granted, granted[1:])]
+    assert min(gaps) >= interval * 0.9
+    assert granted[-1] - granted[0] >= 15 * interval * 0.9
+
+
+def test_parse_feed_and_retries_go_through_the_bucket(monkeypatch):
+    calls = []
+
+    class CountingBucket:
+        def acquire(self, tokens=1):
+            calls.append(tokens)
+            return 0.5
+
+    attempts = []
+
+    def try_parse_feed(self, url, first_page=True, try_index=0):
+        attempts.append(try_index)
+        if try_index == 0:
+            raise requests.exceptions.ConnectionError("reset by peer")
+        return {"entries": []}
+
+    monkeypatch.setattr(arxiv.Client, "_Client__try_parse_feed", try_parse_feed)
+    client = RateLimitedClient(CountingBucket(), page_size=10, num_retries=3)
+    assert client._parse_feed("http://export.arxiv.org/api/query?search_query=cat:cs.AI") == {"entries": []}
+    # 第一次失敗後的 retry 也要先拿 token
+    assert attempts == [0, 1]
+    assert len(calls) == 2
+    assert client.pages_fetched == 2 and client.rate_wait_sec == 1.0
+    assert client.delay_seconds == 0
@@ -0,0 +1,124 @@
+"""RecordDecoder 的 tuple 必須跟原本 arxiv_etl 逐欄 parse 的結果相同, 並依 RECORD_SCHEMA 擋下壞資料"""
+
+import gzip
+import json
+
+import pytest
+
+from src.etl.record_decoder import (
+    HISTORY_KEYWORDS_INDEX, PAPER_KEYWORDS_INDEX, RecordDecoder, RecordError, content_hash, loads,
+)
+from src.etl.s3_stream import iter_gzip_lines
+from src.utils.benchmark.bench_record_decoder import (
+    S3_KEY, check_equivalent, legacy_content_hash, legacy_parse_history_record, legacy_parse_record, synthetic_gz,
+)
+
+RECORD = {
+    "entry_id": "http://arxiv.org/abs/2501.00001v1",
+    "title": "Graph Neural Networks",
+    "authors": ["Ada Lovelace", "Alan Turing"],
+    "summary": "We study\ngraphs.\r\x00",
+    "primary_category": "cs.LG",
+    "categories": ["cs.LG", "stat.ML"],
+    "published": "2025-01-01T00:00:00+00:00",
+    "updated": "2025-01-03T12:00:00+00:00",
+    "journal_ref": None,
+    "doi": "10.1000/xyz",
+}
+
+
+@pytest.fixture(scope="module")
+def lines():
+    return list(iter_gzip_lines(iter([synthetic_gz(300)])))
+
+
+def test_matches_legacy_parse(lines):
+    check_equivalent(lines)
+
+
+def test_paper_tuple_matches_legacy():
+    paper, _ = RecordDecoder(S3_KEY, "test", with_hash=True).decode(RECORD)
+    legacy = legacy_parse_record(RECORD, S3_KEY) + (legacy_content_hash(RECORD),)
+    # 14 是 etl_timestamp, 每次呼叫不同
+    assert paper[:14] + paper[15:] == legacy[:14] + legacy[15:]
+    assert paper[PAPER_KEYWORDS_INDEX] == []
+
+
+def test_history_tuple_matches_legacy():
+    decoder = RecordDecoder(S3_KEY, "initial_load", operation="update")
+    _, history = decoder.decode(RECORD)
+    legacy = legacy_parse_history_record(RECORD, S3_KEY, "update", "initial_load")
+    # history_id / version / etl_timestamp 每次不同; Json adapter 比較內容
+    assert history[4:7] + history[8:15] + history[16:] == legacy[4:7] + legacy[8:15] + legacy[16:]
+    assert history[7].adapted == legacy[7].adapted == {}
+    assert history[8] == "We study graphs. "
+    assert history[HISTORY_KEYWORDS_INDEX] == []
+
+
+def test_history_ids_are_unique_within_a_file():
+    decoder = RecordDecoder(S3_KEY, "test")
+    ids = {decoder.decode(RECORD)[1][0] for _ in range(100)}
+    assert len(ids) == 100
+
+
+def test_upsert_mode_has_hash_and_no_history():
+    paper, history = RecordDecoder(S3_KEY, "test", with_history=False, with_hash=True).decode(RECORD)
+    assert history is None
+    assert paper[-1] == content_hash(RECORD) == legacy_content_hash(RECORD)
+
+
+def test_hash_uses_raw_values_not_defaults():
+    record = {k: v for k, v in RECORD.items() if k != "authors"}
+    paper, _ = RecordDecoder(S3_KEY, "test", with_hash=True).decode(record)
+    assert paper[2] == []
+    assert paper[-1] == legacy_content_hash(record)
+
+
+def test_missing_optional_fields_use_defaults():
+    record = {k: v for k, v in RECORD.items() if k not in ("authors", "categories", "journal_ref", "doi")}
+    paper, _ = RecordDecoder(S3_KEY, "test").decode(record)
+    assert paper[2] == [] and paper[6] == [] and paper[9] is None and paper[10] is None
+
+
+def test_orjson_and_json_agree(lines):
+    assert all(loads(line) == json.loads(line) for line in lines[:50])
+
+
+@pytest.mark.parametrize("field, value, message", [
+    ("title", None, "title is required"),
+    ("summary", 123, "summary must be str"),
+    ("authors", "Ada", "authors must be list"),
+    ("published", "yesterday", "published is not an ISO timestamp"),
+])
+def test_invalid_records_raise(field, value, message):
+    record = dict(RECORD, **{field: value})
+    with pytest.raises(RecordError, match=message) as exc:
+        RecordDecoder(S3_KEY, "test").decode(record)
+    assert exc.value.entry_id == RECORD["entry_id"]
+
+
+def test_non_object_record_raises():
+    with pytest.raises(RecordError, match="must be an object"):
+        RecordDecoder(S3_KEY, "test").decode(["not", "a", "dict"])
+
+
+def test_synthetic_file_round_trip():
+    data = synthetic_gz(10)
+    records = [json.loads(line) for line in gzip.decompress(data).splitlines()]
+    decoder = RecordDecoder(S3_KEY, "test")
+    assert [decoder.decode(r)[0][0] for r in records] == [r["entry_id"] for r in records]
+
+
+def test_hash_backfill_matches_decoder_hash():
+    """hash_backfill 從主表欄位 (timestamptz 以連線的時區回傳) 還原出相同的 content_hash"""
+    from datetime import datetime, timedelta, timezone
+
+    from src.etl.hash_backfill import row_hash
+    from src.etl.record_decoder import HASH_FIELDS
+
+    taipei = timezone(timedelta(hours=8))
+    row = [RECORD["entry_id"]] + [
+        datetime.fromisoformat(RECORD[f]).astimezone(taipei) if f in ("published", "updated") else RECORD[f]
+        for f in HASH_FIELDS
+    ]
+    assert row_hash(tuple(row)) == content_hash(RECORD)
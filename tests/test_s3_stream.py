@@ -0,0 +1,89 @@
+"""src.etl.s3_stream: 串流 gunzip 切行 (多個 gzip member、截斷的檔案) 與背景預讀"""
+
+import gzip
+import io
+
+import pytest
+
+from src.etl.s3_stream import iter_gzip_lines, iter_prefetched_chunks, iter_s3_gzip_lines
+
+
+def chunked(data: bytes, size: int):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_multi_member_gzip(chunk_size):
+    # collector 續傳 / 分段上傳會產生多個 member 串接的檔案
+    data = gzip.compress(b'{"a": 1}\n{"a": 2}\n') + gzip.compress(b'{"a": 3}\n') + gzip.compress(b'{"a": 4}')
+    assert list(iter_gzip_lines(chunked(data, chunk_size))) == [b'{"a": 1}', b'{"a": 2}', b'{"a": 3}', b'{"a": 4}']
+
+
+def test_line_split_across_members_and_blank_lines():
+    data = gzip.compress(b"first\n\nsec") + gzip.compress(b"ond\n  \nthird\n")
+    assert list(iter_gzip_lines(chunked(data, 5))) == [b"first", b"second", b"third"]
+
+
+@pytest.mark.parametrize("cut", [1, 10, 30])
+def test_truncated_gzip_raises(cut):
+    data = gzip.compress(b"".join(b"line %d\n" % i for i in range(1000)))
+    with pytest.raises(EOFError):
+        list(iter_gzip_lines(chunked(data[:-cut], 256)))
+
+
+def test_truncated_second_member_raises():
+    data = gzip.compress(b"ok\n") + gzip.compress(b"lost\n")[:-4]
+    with pytest.raises(EOFError):
+        list(iter_gzip_lines(chunked(data, 3)))
+
+
+def test_empty_input():
+    assert list(iter_gzip_lines(iter([]))) == []
+
+
+class Body(io.BytesIO):
+    """S3 StreamingBody 的替身, 記錄是否被關閉"""
+
+    def __init__(self, data: bytes, fail_after: int | None = None):
+        super().__init__(data)
+        self.fail_after = fail_after
+        self.reads = 0
+        self.was_closed = False
+
+    def read(self, size=-1):
+        self.reads += 1
+        if self.fail_after is not None and self.reads > self.fail_after:
+            raise ConnectionError("connection reset")
+        return super().read(size)
+
+    def close(self):
+        self.was_closed = True
+        super().close()
+
+
+def test_prefetched_chunks_preserve_order():
+    data = bytes(range(256)) * 100
+    body = Body(data)
+    assert b"".join(iter_prefetched_chunks(body, 1000, 2)) == data
+    assert body.was_closed
+
+
+def test_prefetch_error_is_raised_to_consumer():
+    body = Body(b"x" * 10000, fail_after=3)
+    with pytest.raises(ConnectionError):
+        for _ in iter_prefetched_chunks(body, 100, 2):
+            pass
+
+
+def test_consumer_stopping_early_closes_body():
+    body = Body(b"x" * 100000)
+    chunks = iter_prefetched_chunks(body, 100, 2)
+    next(chunks)
+    chunks.close()
+    assert body.was_closed
+
+
+def test_s3_gzip_lines():
+    lines = [b'{"entry_id": "%d"}' % i for i in range(5000)]
+    body = Body(gzip.compress(b"\n".join(lines)))
+    assert list(iter_s3_gzip_lines(body, chunk_size=4096, prefetch=3)) == lines
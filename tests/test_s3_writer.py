@@ -0,0 +1,111 @@
+"""src.extract.s3_writer: 小檔案單次 put, 超過門檻改 multipart 並依 part_size 分段, 失敗時 abort (moto, 見 conftest.s3)"""
+
+import base64
+import gzip
+import json
+import os
+from collections import Counter
+
+import pytest
+
+from src.extract.s3_writer import MIN_PART_SIZE, GzipJsonlWriter
+from tests.conftest import BUCKET
+
+
+class Spy:
+    """記錄呼叫了哪些 S3 API, fail 裡的 API 一律 raise"""
+
+    def __init__(self, client, fail=()):
+        self.client = client
+        self.fail = set(fail)
+        self.calls = Counter()
+        self.part_sizes = []
+
+    def __getattr__(self, name):
+        fn = getattr(self.client, name)
+
+        def call(**kwargs):
+            self.calls[name] += 1
+            if name in self.fail:
+                raise RuntimeError(f"{name} failed")
+            if name == "upload_part":
+                self.part_sizes.append(len(kwargs["Body"]))
+            return fn(**kwargs)
+        return call
+
+
+def records(n: int, payload: int = 0):
+    # 隨機字串幾乎壓不小, 用來產生超過 multipart 門檻的壓縮檔
+    return [{"entry_id": f"id-{i}", "title": "T ü", "blob": base64.b64encode(os.urandom(payload)).decode()}
+            for i in range(n)]
+
+
+def write_all(writer: GzipJsonlWriter, recs: list) -> str | None:
+    for r in recs:
+        writer.write(r)
+    return writer.close()
+
+
+def read_back(s3, key: str) -> bytes:
+    return gzip.decompress(s3.get_object(Bucket=BUCKET, Key=key)["Body"].read())
+
+
+def expected(recs: list) -> bytes:
+    return "\n".join(json.dumps(r, ensure_ascii=False) for r in recs).encode("utf-8")
+
+
+def test_small_batch_uses_single_put(s3):
+    spy = Spy(s3)
+    recs = records(100)
+    writer = GzipJsonlWriter(spy, BUCKET, "raw/small.jsonl.gz")
+    assert write_all(writer, recs) == "raw/small.jsonl.gz"
+    assert spy.calls == Counter(put_object=1)
+    assert read_back(s3, "raw/small.jsonl.gz") == expected(recs)
+    assert len(writer) == 100 and writer.compressed_bytes > 0
+
+
+def test_large_batch_is_uploaded_in_parts(s3):
+    spy = Spy(s3)
+    # 壓縮後約 12 MB: 5 MB + 5 MB + 剩下的
+    recs = records(170, payload=75_000)
+    writer = GzipJsonlWriter(spy, BUCKET, "raw/large.jsonl.gz", multipart_threshold=MIN_PART_SIZE,
+                             part_size=MIN_PART_SIZE)
+    assert write_all(writer, recs) == "raw/large.jsonl.gz"
+    assert spy.calls["put_object"] == 0
+    assert spy.calls["create_multipart_upload"] == 1 and spy.calls["complete_multipart_upload"] == 1
+    assert len(spy.part_sizes) >= 3
+    assert all(size == MIN_PART_SIZE for size in spy.part_sizes[:-1]) and spy.part_sizes[-1] <= MIN_PART_SIZE
+    assert sum(spy.part_sizes) == writer.compressed_bytes
+    assert read_back(s3, "raw/large.jsonl.gz") == expected(recs)
+
+
+def test_part_size_below_s3_minimum_is_raised():
+    writer = GzipJsonlWriter(None, BUCKET, "k", multipart_threshold=1024, part_size=1024)
+    assert writer.multipart_threshold == writer.part_size == MIN_PART_SIZE
+
+
+def test_failed_multipart_is_aborted(s3):
+    spy = Spy(s3, fail={"complete_multipart_upload"})
+    writer = GzipJsonlWriter(spy, BUCKET, "raw/failed.jsonl.gz", multipart_threshold=MIN_PART_SIZE,
+                             part_size=MIN_PART_SIZE, max_attempts=2, initial_delay=0)
+    with pytest.raises(RuntimeError):
+        write_all(writer, records(80, payload=75_000))
+    assert spy.calls["complete_multipart_upload"] == 2
+    assert spy.calls["abort_multipart_upload"] == 1
+    assert "Uploads" not in s3.list_multipart_uploads(Bucket=BUCKET)
+    assert "Contents" not in s3.list_objects_v2(Bucket=BUCKET)
+
+
+def test_failed_put_is_retried_then_raised(s3):
+    spy = Spy(s3, fail={"put_object"})
+    writer = GzipJsonlWriter(spy, BUCKET, "raw/small.jsonl.gz", max_attempts=3, initial_delay=0)
+    with pytest.raises(RuntimeError):
+        write_all(writer, records(10))
+    assert spy.calls == Counter(put_object=3)
+    assert writer.closed
+
+
+def test_empty_writer_uploads_nothing(s3):
+    spy = Spy(s3)
+    assert GzipJsonlWriter(spy, BUCKET, "raw/empty.jsonl.gz").close() is None
+    assert not spy.calls
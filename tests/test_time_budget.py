@@ -0,0 +1,117 @@
+"""src.core.time_budget: EWMA 估計與依 Lambda 剩餘時間決定要做多少工作"""
+
+import threading
+import time
+
+import pytest
+
+from src.core.time_budget import Ewma, TimeBudget
+
+
+class FakeContext:
+    """get_remaining_time_in_millis 回傳手動控制的剩餘時間"""
+
+    def __init__(self, remaining_seconds: float):
+        self.remaining = remaining_seconds
+
+    def get_remaining_time_in_millis(self) -> int:
+        return int(self.remaining * 1000)
+
+
+def items(n: int):
+    it = iter(range(n))
+    return lambda: next(it, None)
+
+
+def test_ewma():
+    e = Ewma(alpha=0.5)
+    assert e.value is None
+    assert e.update(10) == 10
+    assert e.update(20) == 15
+    assert e.samples == 2
+    assert Ewma(initial=3.0).value == 3.0
+    with pytest.raises(ValueError):
+        Ewma(alpha=0)
+
+
+def test_without_context_only_max_items_limits():
+    budget = TimeBudget(None, max_items=3)
+    assert budget.remaining_seconds() is None and not budget.exhausted()
+    results = budget.run(items(10), lambda i: i * 2)
+    assert sorted(results) == [(0, 0), (1, 2), (2, 4)]
+    assert budget.started == 3
+    assert not budget.stopped_early
+
+
+def test_runs_everything_when_time_allows():
+    budget = TimeBudget(FakeContext(600), safety_seconds=30, estimate=Ewma(initial=1.0))
+    assert len(budget.run(items(5), lambda i: i)) == 5
+    assert not budget.stopped_early
+
+
+def test_fits_and_exhausted_follow_remaining_time():
+    ctx = FakeContext(100)
+    budget = TimeBudget(ctx, safety_seconds=30, estimate=Ewma(initial=60))
+    assert budget.fits() and not budget.exhausted()
+    ctx.remaining = 89
+    assert not budget.fits() and not budget.exhausted()
+    ctx.remaining = 30
+    assert budget.exhausted()
+
+
+def test_stops_when_next_item_does_not_fit():
+    ctx = FakeContext(100)
+    # 實際耗時 (幾乎為 0) 幾乎不影響估計值, 維持約 20 秒
+    budget = TimeBudget(ctx, safety_seconds=30, estimate=Ewma(alpha=0.01, initial=20))
+
+    def handle(i):
+        ctx.remaining -= 20  # 每個工作用掉 20 秒
+        return i
+
+    results = budget.run(items(10), handle)
+    # 100 -> 80 -> 60 -> 40 (40 - 30 < 20, 放不下第四個)
+    assert [i for i, _ in results] == [0, 1, 2]
+    assert budget.stopped_early
+
+
+def test_no_estimate_runs_until_safety_margin():
+    ctx = FakeContext(31)
+    budget = TimeBudget(ctx, safety_seconds=30)
+    assert budget.fits()
+    ctx.remaining = 29
+    assert not budget.fits()
+
+
+def test_estimate_is_updated_from_measured_time():
+    estimate = Ewma(alpha=1.0)
+    budget = TimeBudget(FakeContext(600), estimate=estimate)
+    budget.run(items(1), lambda i: time.sleep(0.05))
+    assert estimate.samples == 1 and estimate.value >= 0.05
+
+
+def test_concurrency_and_waiting_for_running_items():
+    running, peak = 0, 0
+    lock = threading.Lock()
+
+    def handle(i):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return i
+
+    budget = TimeBudget(FakeContext(600), estimate=Ewma(initial=0.0))
+    results = budget.run(items(9), handle, concurrency=3)
+    assert sorted(i for i, _ in results) == list(range(9))
+    assert peak == 3
+
+
+def test_handler_error_is_raised():
+    def handle(i):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        TimeBudget(None).run(items(1), handle)